@@ -1,16 +1,145 @@
 from __future__ import annotations
-import os, json
-from fastapi import FastAPI, HTTPException, Header
-from fastapi.responses import FileResponse
-from sqlalchemy import select
-from app.models import get_session_factory, Message
-from app.constants.database import message
+import asyncio, hashlib, os, tempfile, time, zipfile
+import anyio
+from contextlib import asynccontextmanager
+from datetime import datetime
+from urllib.parse import quote
+from fastapi import FastAPI, HTTPException, Header, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, HTMLResponse, PlainTextResponse, StreamingResponse
+from sqlalchemy import select, or_
+from app import metrics
+from app.archive import import_archive, iter_export
+from app.blobs import get_blob_store, is_compressed, iter_eml
+from app.ingest import IngestPipeline
+from app.cache import parsed_cache
+from app.mime import iter_part
+from app.models import get_async_session_factory, get_session_factory, init_db, Message, MessagePart
+from app.models import fts
+from app.notify import bus, message_event, start_feed
+from app.retention import Purger
+from app.storage import SUMMARY_COLUMNS, group_page_query, mailbox_page_query, message_filters, page_query, recipient_condition, scan_parts, split_page
+from app.utils.utils import dumps, loads, normalize_namespace, parse_age
+from app.constants.database import group
+from app.constants import api as limits, archive, blobs, notify
+from app.constants.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
 
 API_TOKEN = os.getenv("API_TOKEN", "change_me")
 DB_PATH = os.getenv("DB_PATH", "./localdata/messages.db")
+DATA_DIR = os.getenv("DATA_DIR", "./localdata")
+BLOB_STORE = os.getenv("BLOB_STORE", blobs.BACKEND_FLAT)
+BLOB_COMPRESS = os.getenv("BLOB_COMPRESS", blobs.CODEC_NONE)
+NOTIFY_ADDR = os.getenv("NOTIFY_ADDR")
+NOTIFY_MODE = os.getenv("NOTIFY_MODE", notify.MODE_UDP if NOTIFY_ADDR else notify.MODE_POLL)
 
-Session = get_session_factory(DB_PATH)
-app = FastAPI(title = "SMTP Sink API")
+MAX_CONCURRENCY = int(os.getenv("API_MAX_CONCURRENCY", limits.MAX_CONCURRENCY))
+QUEUE_TIMEOUT = float(os.getenv("API_QUEUE_TIMEOUT", limits.QUEUE_TIMEOUT))
+THREADPOOL_SIZE = int(os.getenv("API_THREADPOOL_SIZE", limits.THREADPOOL_SIZE))
+FILE_IO_THREADS = int(os.getenv("API_FILE_IO_THREADS", limits.FILE_IO_THREADS))
+
+# writes, and the few reads that need a sync Session, go through these on
+# the threadpool; the read handlers await AsyncReadSession on the loop.
+# Creating them does not connect: the schema is checked at startup.
+Session = get_session_factory(DB_PATH, init=False)
+ReadSession = get_session_factory(DB_PATH, readonly=True, init=False)
+AsyncReadSession = get_async_session_factory(DB_PATH, readonly=True)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_in_threadpool(init_db, Session.kw["bind"])
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    stop = await start_feed(NOTIFY_MODE, bus, addr=NOTIFY_ADDR, session_factory=ReadSession)
+    try:
+        yield
+    finally:
+        stop()
+        await AsyncReadSession.kw["bind"].dispose()
+
+app = FastAPI(title = "SMTP Sink API", lifespan=lifespan)
+
+
+class ConcurrencyLimit:
+    """Caps requests in flight, body streaming included. A request that
+    cannot get a slot within ``timeout`` gets 503 instead of queueing
+    without bound; long-polls and event streams are exempt."""
+
+    def __init__(self, app, limit: int, timeout: float, exempt=limits.UNLIMITED_PATHS):
+        self.app = app
+        self.slots = asyncio.Semaphore(limit) if limit > 0 else None
+        self.timeout = timeout
+        self.exempt = frozenset(exempt)
+
+    async def __call__(self, scope, receive, send):
+        if self.slots is None or scope["type"] != "http" or scope["path"] in self.exempt:
+            return await self.app(scope, receive, send)
+        try:
+            await asyncio.wait_for(self.slots.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            busy = PlainTextResponse("Too many concurrent requests", 503,
+                                     headers={"Retry-After": limits.RETRY_AFTER})
+            return await busy(scope, receive, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.slots.release()
+
+app.add_middleware(ConcurrencyLimit, limit=MAX_CONCURRENCY, timeout=QUEUE_TIMEOUT)
+
+_file_limiter: anyio.CapacityLimiter | None = None
+
+async def _file_io(fn, *args):
+    """Run one blocking file call on the file-IO pool, which is kept apart
+    from the threads of the request handlers."""
+    global _file_limiter
+    if _file_limiter is None:
+        _file_limiter = anyio.CapacityLimiter(FILE_IO_THREADS)
+    return await anyio.to_thread.run_sync(fn, *args, limiter=_file_limiter)
+
+async def _aiter_blocking(chunks):
+    """Pull a blocking chunk iterator (an .eml or decoded part) one read at
+    a time on the file-IO pool, so downloads neither block the loop nor
+    take threads from the request handlers."""
+    done = object()
+    try:
+        while (chunk := await _file_io(next, chunks, done)) is not done:
+            yield chunk
+    finally:
+        await _file_io(chunks.close)
+
+async def _aiter(chunks):
+    # row serialisation is cheap CPU work; no reason to hop to a thread
+    for chunk in chunks:
+        yield chunk
+
+metrics.registry.gauge("mailgate_parsed_cache", "Parsed-message cache entries, bytes, hits, misses and evictions",
+                       ("stat",), fn=lambda: {(k,): v for k, v in parsed_cache.stats().items()})
+metrics.registry.gauge("mailgate_notify_subscribers", "Open /messages/wait and /messages/stream subscriptions",
+                       fn=lambda: {(): bus.subscribers})
+
+class RequestLatency:
+    """Times each request to its response headers. A plain ASGI wrapper,
+    so streamed bodies pass straight through, and with metrics disabled
+    it only hands the call on."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not metrics.enabled or scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        t0 = time.perf_counter()
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                # the route template, so /messages/{mid}/raw is one series, not one per id
+                route = getattr(scope.get("route"), "path", "unmatched")
+                metrics.HTTP_REQUEST.observe(time.perf_counter() - t0, method=scope["method"],
+                                             route=route, status=message["status"])
+            await send(message)
+
+        await self.app(scope, receive, timed_send)
+
+app.add_middleware(RequestLatency)
 
 def _auth(authorization: str | None):
     if not authorization or not authorization.startswith("Bearer"):
@@ -19,33 +148,496 @@ def _auth(authorization: str | None):
     if token != API_TOKEN:
         raise HTTPException(401, "Invalid token")
 
+LIST_COLUMNS = SUMMARY_COLUMNS   # stored at ingest: no file reads
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_ROWS = 200
+
+def _row_json(r) -> dict:
+    return {
+        "id": r.id,
+        "received_at": r.received_at.isoformat() if r.received_at else None,
+        "from": r.from_addr,
+        "to": loads(r.to_addrs or "[]"),
+        "subject": r.subject,
+        "size": r.size_bytes,
+        "has_attachments": bool(r.has_attachments),
+        "namespace": r.namespace,
+        # null until `mailgate reindex` fills them for mail stored before they existed
+        "display_from": r.display_from,
+        "display_to": r.display_to,
+        "snippet": r.snippet,
+        "sent_at": r.sent_at.isoformat() if r.sent_at else None,
+        "part_count": r.part_count,
+        "thread": r.thread_id,
+        "dup": r.dup_key,
+    }
+
+def _stream(rows, fmt: str):
+    if fmt == "ndjson":
+        for i in range(0, len(rows), STREAM_CHUNK_ROWS):
+            yield b"".join(dumps(_row_json(r)) + b"\n" for r in rows[i:i + STREAM_CHUNK_ROWS])
+        return
+    yield b"["
+    for i in range(0, len(rows), STREAM_CHUNK_ROWS):
+        chunk = b",".join(dumps(_row_json(r)) for r in rows[i:i + STREAM_CHUNK_ROWS])
+        yield chunk if i == 0 else b"," + chunk
+    yield b"]"
+
+def _etag(newest: str | None, query: list[tuple[str, str]]) -> str:
+    # Keyed on the newest message plus the query, so pollers get 304 until
+    # something new arrives. Deleting older messages does not change it.
+    digest = hashlib.blake2b(repr((newest, sorted(query))).encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+def _etag_matches(etag: str, if_none_match: str | None) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+@app.get("/metrics")
+def get_metrics(authorization: str | None = Header(None)):
+    """Prometheus text format for this API process; the SMTP listener
+    serves its own on --metrics-addr."""
+    _auth(authorization)
+    return PlainTextResponse(metrics.render(metrics.registry.snapshot()), media_type=METRICS_CONTENT_TYPE)
+
 @app.get("/messages")
-def list_messages(authorization: str | None = Header(None), limit: int = 100) :
-    _auth(authorization)
-    with Session() as s:
-        rows = s.execute(
-            select(Message).order_by(Message.received_at.desc()).limit(limit)
-        ).scalars().all()
-        return [
-            {
-                "id": m.id,
-                "received_at": m.received_at.isoformat() if m.received_at else None,
-                "from": m.from_addr,
-                "to": json.loads(m.to_addrs or "[]"),
-                "subject": m.subject,
-                "size": m.size_bytes,
-                "has_attachments": bool(m.has_attachments),
-             } for m in rows
-        ]
+async def list_messages(request: Request,
+                  authorization: str | None = Header(None),
+                  if_none_match: str | None = Header(None),
+                  limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+                  cursor: str | None = None,
+                  format: str = Query("json", pattern="^(json|ndjson)$"),
+                  q: str | None = None,
+                  from_addr: str | None = Query(None, alias="from"),
+                  to_addr: str | None = Query(None, alias="to"),
+                  subject: str | None = None,
+                  since: datetime | None = None,
+                  until: datetime | None = None,
+                  has_attachments: bool | None = None,
+                  namespace: str | None = None,
+                  thread: str | None = None,
+                  dup: str | None = None):
+    _auth(authorization)
+    async with AsyncReadSession() as s:
+        newest = (await s.execute(
+            select(Message.id).where(*message_filters(namespace=namespace))
+            .order_by(Message.received_at.desc(), Message.id.desc()).limit(1)
+        )).scalar()
+        etag = _etag(newest, request.query_params.multi_items())
+        if _etag_matches(etag, if_none_match):
+            return Response(status_code=304, headers={"ETag": etag})
+        try:
+            stmt = page_query(
+                LIST_COLUMNS, q, cursor=cursor, limit=limit,
+                from_addr=from_addr, to_addr=to_addr, subject=subject,
+                since=since, until=until, has_attachments=has_attachments, namespace=namespace,
+                thread_id=thread, dup_key=dup,
+            )
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        rows, next_cursor = split_page((await s.execute(stmt)).all(), limit)
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+        headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
+    media_type = "application/x-ndjson" if format == "ndjson" else "application/json"
+    return StreamingResponse(_aiter(_stream(rows, format)), media_type=media_type, headers=headers)
+
+def _group_json(g, r) -> dict:
+    return {**_row_json(r), "group": g.id, "count": g.count,
+            "first_at": g.first_at.isoformat() if g.first_at else None}
+
+async def _group_page(kind: str, request: Request, limit: int, cursor: str | None, format: str, **filters):
+    async with AsyncReadSession() as s:
+        try:
+            stmt = group_page_query(kind, cursor=cursor, limit=limit, **filters)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        groups, next_cursor = split_page((await s.execute(stmt)).all(), limit)
+        by_id = {r.id: r for r in (await s.execute(
+            select(*LIST_COLUMNS).where(Message.id.in_([g.latest_id for g in groups]))
+        )).all()}
+    items = [_group_json(g, by_id[g.latest_id]) for g in groups if g.latest_id in by_id]
+
+    headers = {"Cache-Control": "no-cache"}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+        headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
+    if format == "ndjson":
+        body = b"".join(dumps(i) + b"\n" for i in items)
+        return Response(body, media_type="application/x-ndjson", headers=headers)
+    return Response(dumps(items), media_type="application/json", headers=headers)
+
+@app.get("/threads")
+async def list_threads(request: Request,
+                       authorization: str | None = Header(None),
+                       limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+                       cursor: str | None = None,
+                       format: str = Query("json", pattern="^(json|ndjson)$"),
+                       q: str | None = None,
+                       from_addr: str | None = Query(None, alias="from"),
+                       to_addr: str | None = Query(None, alias="to"),
+                       subject: str | None = None,
+                       since: datetime | None = None,
+                       until: datetime | None = None,
+                       has_attachments: bool | None = None,
+                       namespace: str | None = None):
+    """Threads (Message-ID / References chains), latest activity first,
+    each shown by its newest message; ``/messages?thread=<group>`` expands
+    one. Filters keep threads with at least one matching message."""
+    _auth(authorization)
+    return await _group_page(group.KIND_THREAD, request, limit, cursor, format, text=q,
+                             from_addr=from_addr, to_addr=to_addr, subject=subject, since=since,
+                             until=until, has_attachments=has_attachments, namespace=namespace)
+
+@app.get("/duplicates")
+async def list_duplicates(request: Request,
+                          authorization: str | None = Header(None),
+                          limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+                          cursor: str | None = None,
+                          format: str = Query("json", pattern="^(json|ndjson)$"),
+                          q: str | None = None,
+                          from_addr: str | None = Query(None, alias="from"),
+                          to_addr: str | None = Query(None, alias="to"),
+                          subject: str | None = None,
+                          since: datetime | None = None,
+                          until: datetime | None = None,
+                          has_attachments: bool | None = None,
+                          namespace: str | None = None):
+    """Sets of identical mail (same envelope, subject and text body),
+    newest first with their size; ``/messages?dup=<group>`` expands one."""
+    _auth(authorization)
+    return await _group_page(group.KIND_DUP, request, limit, cursor, format, text=q,
+                             from_addr=from_addr, to_addr=to_addr, subject=subject, since=since,
+                             until=until, has_attachments=has_attachments, namespace=namespace)
+
+@app.get("/mailboxes/{address}/messages")
+async def mailbox_messages(address: str, request: Request,
+                     authorization: str | None = Header(None),
+                     limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+                     cursor: str | None = None,
+                     format: str = Query("json", pattern="^(json|ndjson)$")):
+    """Messages addressed to one mailbox (or ``@domain``), newest first,
+    paged off the message_recipients index."""
+    _auth(authorization)
+    async with AsyncReadSession() as s:
+        try:
+            stmt = mailbox_page_query(address, cursor=cursor, limit=limit)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        keys, next_cursor = split_page((await s.execute(stmt)).all(), limit)
+        by_id = {r.id: r for r in (await s.execute(
+            select(*LIST_COLUMNS).where(Message.id.in_([k.id for k in keys]))
+        )).all()}
+    rows = [by_id[k.id] for k in keys if k.id in by_id]
+
+    headers = {"Cache-Control": "no-cache"}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+        headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
+    media_type = "application/x-ndjson" if format == "ndjson" else "application/json"
+    return StreamingResponse(_aiter(_stream(rows, format)), media_type=media_type, headers=headers)
+
+@app.delete("/messages")
+def purge_messages(authorization: str | None = Header(None),
+                   older_than: str | None = None,
+                   q: str | None = None,
+                   from_addr: str | None = Query(None, alias="from"),
+                   to_addr: str | None = Query(None, alias="to"),
+                   subject: str | None = None,
+                   before: datetime | None = None,
+                   namespace: str | None = None,
+                   purge_all: bool = Query(False, alias="all")):
+    _auth(authorization)
+    conds = message_filters(q, from_addr=from_addr, to_addr=to_addr, subject=subject, until=before,
+                            namespace=namespace)
+    if older_than:
+        try:
+            conds.append(Message.received_at < datetime.utcnow() - parse_age(older_than))
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+    if not conds and not purge_all:
+        raise HTTPException(400, "give a filter, or all=true to delete every message")
+    deleted, freed = Purger(Session, parsed_cache).purge(conds)
+    return {"deleted": deleted, "bytes": freed}
+
+@app.delete("/namespaces/{namespace}")
+def drop_namespace(namespace: str, authorization: str | None = Header(None)):
+    """Drop all of a finished test's mail. Only that namespace's rows are
+    visited, so the cost follows its own volume, not the whole store's."""
+    _auth(authorization)
+    ns = normalize_namespace(namespace)
+    if not ns:
+        raise HTTPException(400, "empty namespace")
+    deleted, freed = Purger(Session, parsed_cache).purge(message_filters(namespace=ns))
+    return {"namespace": ns, "deleted": deleted, "bytes": freed}
+
+@app.get("/messages/export")
+def export_messages(authorization: str | None = Header(None),
+                    format: str = Query(archive.FORMAT_MBOX, pattern="^(mbox|maildir|zip)$"),
+                    q: str | None = None,
+                    from_addr: str | None = Query(None, alias="from"),
+                    to_addr: str | None = Query(None, alias="to"),
+                    subject: str | None = None,
+                    since: datetime | None = None,
+                    until: datetime | None = None,
+                    has_attachments: bool | None = None,
+                    namespace: str | None = None):
+    """Every matching message, oldest first, streamed as one mbox or zip
+    (Maildir comes zipped) straight from the blob store."""
+    _auth(authorization)
+    conds = message_filters(q, from_addr=from_addr, to_addr=to_addr, subject=subject,
+                            since=since, until=until, has_attachments=has_attachments,
+                            namespace=namespace)
+    name = f"messages-{datetime.utcnow():%Y%m%dT%H%M%S}{archive.EXTENSIONS[format]}"
+    return StreamingResponse(iter_export(ReadSession, format, conds), media_type=archive.MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f'attachment; filename="{name}"'})
+
+@app.post("/messages/import")
+async def import_messages(request: Request, authorization: str | None = Header(None),
+                          format: str | None = Query(None, pattern="^(mbox|zip)$"),
+                          namespace: str | None = None):
+    """Ingest an uploaded mbox, or a zip of .eml files or of a Maildir.
+    The body is spooled to a temporary file, then committed in batches."""
+    _auth(authorization)
+    fd, spool = tempfile.mkstemp(prefix="import-")
+    try:
+        # a dropped upload lands in the finally too, so the spool never leaks
+        with os.fdopen(fd, "wb") as tmp:
+            async for chunk in request.stream():
+                await _file_io(tmp.write, chunk)
+        pipeline = IngestPipeline(DATA_DIR, Session, listeners=[bus.publish],
+                                  blob_store=get_blob_store(DATA_DIR, BLOB_STORE, BLOB_COMPRESS))
+        try:
+            imported = await run_in_threadpool(import_archive, spool, format, pipeline, namespace)
+        except (ValueError, zipfile.BadZipFile) as e:
+            raise HTTPException(400, str(e))
+    finally:
+        os.unlink(spool)
+    return {"imported": imported, "failed": pipeline.failed}
+
+@app.get("/messages/search")
+async def search_messages(q: str, authorization: str | None = Header(None),
+                          limit: int = Query(20, ge=1, le=200), offset: int = Query(0, ge=0)):
+    _auth(authorization)
+    async with AsyncReadSession() as s:
+        try:
+            hits = await s.run_sync(fts.search, q, limit=limit, offset=offset)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        rows = (await s.execute(
+            select(*LIST_COLUMNS).where(Message.id.in_([h["id"] for h in hits]))
+        )).all()
+    by_id = {m.id: m for m in rows}
+    # the list row, with the match's highlighted snippet in place of the
+    # body's opening
+    return [
+        {**_row_json(by_id[h["id"]]), "rank": h["rank"], "snippet": h["snippet"]}
+        for h in hits if h["id"] in by_id
+    ]
+
+async def _find_existing(to, from_addr, subject, message_id, since, namespace=None) -> dict | None:
+    conds = message_filters(namespace=namespace)
+    if to:
+        conds.append(recipient_condition(to))
+    if from_addr:
+        conds.append(Message.from_addr.contains(from_addr, autoescape=True))
+    if subject:
+        conds.append(Message.subject.contains(subject, autoescape=True))
+    if message_id:
+        mid = message_id.strip().strip("<>")
+        conds.append(or_(Message.message_id == mid, Message.message_id == f"<{mid}>"))
+    if since:
+        conds.append(Message.received_at >= since)
+    async with AsyncReadSession() as s:
+        m = (await s.execute(
+            select(Message).where(*conds).order_by(Message.received_at.desc()).limit(1)
+        )).scalar()
+    return message_event(m) if m else None
+
+@app.get("/messages/wait")
+async def wait_for_message(authorization: str | None = Header(None),
+                           to: str | None = None,
+                           from_addr: str | None = Query(None, alias="from"),
+                           subject: str | None = None,
+                           message_id: str | None = None,
+                           since: datetime | None = None,
+                           namespace: str | None = None,
+                           timeout: float = Query(30.0, gt=0, le=notify.MAX_WAIT)):
+    """Long-poll until a matching message exists; 204 if none arrives in time."""
+    _auth(authorization)
+    # subscribe before looking in the database so nothing slips in between
+    with bus.subscribe(to=to, from_addr=from_addr, subject=subject, message_id=message_id,
+                       namespace=namespace) as sub:
+        found = await _find_existing(to, from_addr, subject, message_id, since, namespace)
+        if found:
+            return found
+        try:
+            return await asyncio.wait_for(sub.get(), timeout)
+        except asyncio.TimeoutError:
+            return Response(status_code=204)
+
+@app.get("/messages/stream")
+async def stream_messages(authorization: str | None = Header(None),
+                          to: str | None = None,
+                          from_addr: str | None = Query(None, alias="from"),
+                          subject: str | None = None,
+                          message_id: str | None = None,
+                          namespace: str | None = None):
+    """Server-Sent Events: one ``message`` event per matching new message."""
+    _auth(authorization)
+    sub = bus.subscribe(to=to, from_addr=from_addr, subject=subject, message_id=message_id,
+                        namespace=namespace)
+
+    async def events():
+        with sub:
+            yield b": connected\n\n"
+            while True:
+                try:
+                    ev = await asyncio.wait_for(sub.get(), notify.SSE_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                yield b"event: message\nid: " + ev["id"].encode() + b"\ndata: " + dumps(ev) + b"\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+async def _eml_path(mid: str) -> str:
+    async with AsyncReadSession() as s:
+        path = (await s.execute(select(Message.eml_path).where(Message.id == mid))).scalar()
+    if not path:
+        raise HTTPException(404, "Not found")
+    return path
+
+async def _parsed(mid: str):
+    entry = parsed_cache.lookup(mid)
+    if entry is not None:
+        return entry
+    path = await _eml_path(mid)
+    try:
+        # reading and parsing the file is blocking; the lookup was not
+        return await run_in_threadpool(parsed_cache.load, mid, path)
+    except OSError:
+        raise HTTPException(404, "Message file missing")
+
+@app.get("/messages/{mid}/body")
+async def get_body(mid: str, authorization: str | None = Header(None)):
+    _auth(authorization)
+    parsed = await _parsed(mid)
+    return {"id": mid, "headers": parsed.headers, "text": parsed.text, "html": parsed.html}
+
+@app.get("/messages/{mid}/text")
+async def get_text(mid: str, authorization: str | None = Header(None)):
+    _auth(authorization)
+    parsed = await _parsed(mid)
+    if not parsed.text:
+        raise HTTPException(404, "No text body")
+    return PlainTextResponse(parsed.text)
+
+@app.get("/messages/{mid}/html")
+async def get_html(mid: str, authorization: str | None = Header(None)):
+    _auth(authorization)
+    parsed = await _parsed(mid)
+    if not parsed.html:
+        raise HTTPException(404, "No HTML body")
+    return HTMLResponse(parsed.html)
+
+async def _parts(mid: str) -> list[MessagePart]:
+    async with AsyncReadSession() as s:
+        parts = (await s.scalars(
+            select(MessagePart).where(MessagePart.message_id == mid).order_by(MessagePart.part_index)
+        )).all()
+        if parts:
+            return list(parts)
+        path = (await s.execute(select(Message.eml_path).where(Message.id == mid))).scalar()
+    if not path:
+        raise HTTPException(404, "Not found")
+    # not indexed yet (stored before message_parts existed): parse the
+    # file off the loop; 'mailgate reindex' stores the rows
+    try:
+        return await run_in_threadpool(scan_parts, mid, path)
+    except OSError:
+        raise HTTPException(404, "Message file missing")
+
+def _part_json(p) -> dict:
+    return {
+        "index": p.part_index,
+        "content_type": p.content_type,
+        "charset": p.charset,
+        "filename": p.filename,
+        "disposition": p.disposition,
+        "size": p.size_bytes,
+    }
+
+def _byte_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """(start, stop) for a single ``bytes=`` range, or None to send the
+    whole part. Multiple ranges and malformed headers are ignored."""
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[6:].strip().partition("-")
+    try:
+        if not first:
+            n = int(last)   # suffix: the final n bytes
+            start, stop = (max(0, size - n), size) if n > 0 else (size, size)
+        else:
+            start = int(first)
+            stop = int(last) + 1 if last else size
+    except ValueError:
+        return None
+    if stop <= start and first and last:
+        return None
+    if start >= size:
+        raise HTTPException(416, "Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, min(stop, size)
+
+@app.get("/messages/{mid}/parts")
+async def get_parts(mid: str, authorization: str | None = Header(None)):
+    _auth(authorization)
+    return [_part_json(p) for p in await _parts(mid)]
+
+@app.get("/messages/{mid}/parts/{index}")
+async def get_part(mid: str, index: int, range: str | None = Header(None),
+             authorization: str | None = Header(None)):
+    """One decoded part, streamed from its offsets in the .eml; honours a
+    single byte range so large attachments can be resumed."""
+    _auth(authorization)
+    part = next((p for p in await _parts(mid) if p.part_index == index), None)
+    if part is None:
+        raise HTTPException(404, "No such part")
+    path = await _eml_path(mid)
+    size = part.size_bytes or 0
+    rng = _byte_range(range, size)
+    start, stop = rng or (0, size)
+    media_type = part.content_type
+    if part.charset and part.content_type.startswith("text/"):
+        media_type += f"; charset={part.charset}"
+    headers = {"Accept-Ranges": "bytes", "Content-Length": str(stop - start)}
+    if part.filename:
+        headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{quote(part.filename)}"
+    if rng:
+        headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+    return StreamingResponse(
+        _aiter_blocking(iter_part(path, part.encoding, part.body_offset, part.end_offset, start, stop)),
+        status_code=206 if rng else 200, media_type=media_type, headers=headers,
+    )
 
 @app.get("/messages/{mid}/raw")
-def get_raw(mid: str, authorization: str | None = Header(None)):
+async def get_raw(mid: str, authorization: str | None = Header(None)):
     _auth(authorization)
-    with Session() as s:
-        m = s.get(Message, mid)
-        if not m: raise HTTPException(404, "Not found")
-        return FileResponse(
-            m.eml_path,
+    path = await _eml_path(mid)
+    if is_compressed(path):
+        return StreamingResponse(
+            _aiter_blocking(iter_eml(path)),
             media_type="message/rfc822",
-            filename=f"{mid}.eml"
-        )
\ No newline at end of file
+            headers={"Content-Disposition": f'attachment; filename="{mid}.eml"'},
+        )
+    # FileResponse already reads through anyio's async file wrapper
+    return FileResponse(
+        path,
+        media_type="message/rfc822",
+        filename=f"{mid}.eml"
+    )
\ No newline at end of file
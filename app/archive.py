@@ -0,0 +1,323 @@
+"""Bulk export of stored mail to mbox, Maildir or zip, and import back.
+
+Exports are generators of bytes: messages are read from the blob store a
+chunk at a time and written straight into the output (an HTTP response or
+a file), so nothing is staged. Imports feed the same ingest pipeline the
+SMTP listener uses, in batched transactions.
+"""
+from __future__ import annotations
+import argparse, logging, os, re, time, zipfile
+from datetime import datetime, timezone
+from email.utils import getaddresses, parsedate_to_datetime
+from pathlib import Path
+from sqlalchemy import select, tuple_
+from app.blobs import get_blob_store, open_eml
+from app.ingest import IngestPipeline, Pending
+from app.mime import body_offset, parse_headers
+from app.models import Message, get_session_factory
+from app.storage import message_filters
+from app.utils.utils import normalize_namespace, parse_age
+from app.constants import archive, blobs, ingest
+
+log = logging.getLogger(__name__)
+
+_FROM_LINE = re.compile(rb"^(>*From )", re.M)
+_QUOTED_FROM_LINE = re.compile(rb"^>(>*From )", re.M)
+
+
+# -- export --------------------------------------------------------------
+
+def iter_rows(session_factory, conds: list, batch_size: int = archive.EXPORT_BATCH):
+    """Matching messages oldest-first, one short read per keyset batch."""
+    last = None
+    while True:
+        stmt = select(
+            Message.id, Message.received_at, Message.from_addr, Message.to_addrs, Message.size_bytes,
+            Message.eml_path,
+        ).where(*conds)
+        if last:
+            stmt = stmt.where(tuple_(Message.received_at, Message.id) > tuple_(*last))
+        with session_factory() as s:
+            rows = s.execute(stmt.order_by(Message.received_at, Message.id).limit(batch_size)).all()
+        if not rows:
+            return
+        yield from rows
+        last = (rows[-1].received_at, rows[-1].id)
+
+def _open(row):
+    try:
+        return open_eml(row.eml_path)
+    except (OSError, TypeError):
+        log.warning("skipping %s: .eml missing", row.id)
+        return None
+
+def iter_mbox(rows, chunk_size: int = blobs.READ_CHUNK):
+    for row in rows:
+        f = _open(row)
+        if f is None:
+            continue
+        sender = (row.from_addr or "").split()[0] if (row.from_addr or "").strip() else archive.MBOX_SENDER
+        stamp = (row.received_at or datetime.utcnow()).ctime()
+        yield f"From {sender} {stamp}\n".encode()
+        carry = b""
+        with f:
+            while chunk := f.read(chunk_size):
+                buf = carry + chunk
+                # quote whole lines only, so a "From " split across reads is caught
+                cut = buf.rfind(b"\n") + 1
+                carry = buf[cut:]
+                if cut:
+                    yield _FROM_LINE.sub(rb">\1", buf[:cut])
+        yield (_FROM_LINE.sub(rb">\1", carry) + b"\n" if carry else b"") + b"\n"
+
+
+class _Spool:
+    """Write-only, non-seekable sink that ZipFile writes into and the
+    generator drains after every chunk."""
+
+    def __init__(self):
+        self.buf = bytearray()
+        self.pos = 0
+
+    def write(self, b) -> int:
+        self.buf += b
+        self.pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self.pos
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        out = bytes(self.buf)
+        self.buf.clear()
+        return out
+
+
+def _entry_name(row, fmt: str) -> str:
+    if fmt == archive.FORMAT_MAILDIR:
+        ts = int((row.received_at or datetime.utcnow()).replace(tzinfo=timezone.utc).timestamp())
+        return f"cur/{ts}.{row.id}.mailgate{archive.MAILDIR_INFO}"
+    return f"{row.id}.eml"
+
+def iter_zip(rows, fmt: str = archive.FORMAT_ZIP, chunk_size: int = blobs.READ_CHUNK):
+    spool = _Spool()
+    with zipfile.ZipFile(spool, "w", zipfile.ZIP_DEFLATED) as zf:
+        if fmt == archive.FORMAT_MAILDIR:
+            for sub in archive.MAILDIR_SUBDIRS:
+                zf.writestr(sub + "/", b"")
+        for row in rows:
+            f = _open(row)
+            if f is None:
+                continue
+            info = zipfile.ZipInfo(_entry_name(row, fmt), (row.received_at or datetime.utcnow()).timetuple()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with f, zf.open(info, "w", force_zip64=(row.size_bytes or 0) > zipfile.ZIP64_LIMIT // 2) as out:
+                while chunk := f.read(chunk_size):
+                    out.write(chunk)
+                    if len(spool.buf) >= chunk_size:
+                        yield spool.drain()
+            yield spool.drain()
+    yield spool.drain()
+
+def iter_export(session_factory, fmt: str, conds: list):
+    """The archive as a stream of byte chunks. Maildir comes out as a zip
+    holding cur/new/tmp; write_maildir() lays it out on disk instead."""
+    rows = iter_rows(session_factory, conds)
+    if fmt == archive.FORMAT_MBOX:
+        return iter_mbox(rows)
+    if fmt in (archive.FORMAT_ZIP, archive.FORMAT_MAILDIR):
+        return iter_zip(rows, fmt)
+    raise ValueError(f"unknown archive format: {fmt!r}")
+
+def write_maildir(session_factory, conds: list, dest: str, chunk_size: int = blobs.READ_CHUNK) -> int:
+    """Export into a Maildir directory, delivering each file through tmp/."""
+    root = Path(dest)
+    for sub in archive.MAILDIR_SUBDIRS:
+        (root / sub).mkdir(parents=True, exist_ok=True)
+    n = 0
+    for row in iter_rows(session_factory, conds):
+        f = _open(row)
+        if f is None:
+            continue
+        name = _entry_name(row, archive.FORMAT_MAILDIR)
+        tmp = root / "tmp" / name.split("/", 1)[1]
+        with f, open(tmp, "wb") as out:
+            while chunk := f.read(chunk_size):
+                out.write(chunk)
+        os.replace(tmp, root / name)
+        n += 1
+    return n
+
+
+# -- import --------------------------------------------------------------
+
+def _mbox_envelope(line: bytes) -> tuple[str, datetime | None]:
+    fields = line.decode("ascii", "replace").split(None, 2)
+    sender = fields[1] if len(fields) > 1 else ""
+    try:
+        when = datetime.strptime(" ".join(fields[2].split()), archive.MBOX_DATE) if len(fields) > 2 else None
+    except ValueError:
+        when = None
+    return ("" if sender == archive.MBOX_SENDER else sender), when
+
+def _mbox_message(lines: list[bytes]) -> bytes:
+    if lines and lines[-1] in (b"\n", b"\r\n"):
+        lines = lines[:-1]   # the separator before the next "From " line
+    return _QUOTED_FROM_LINE.sub(rb"\1", b"".join(lines))
+
+def read_mbox(path: str):
+    """(data, sender, received_at) per message, reading line by line."""
+    envelope, lines, blank = None, [], True
+    with open(path, "rb") as f:
+        for line in f:
+            if blank and line.startswith(b"From "):
+                if envelope is not None:
+                    yield (_mbox_message(lines), *_mbox_envelope(envelope))
+                envelope, lines = line, []
+            elif envelope is not None:
+                lines.append(line)
+            blank = line in (b"\n", b"\r\n")
+    if envelope is not None:
+        yield (_mbox_message(lines), *_mbox_envelope(envelope))
+
+def _maildir_time(name: str) -> datetime | None:
+    try:
+        return datetime.utcfromtimestamp(int(name.split(".", 1)[0]))
+    except (ValueError, OverflowError):
+        return None
+
+def read_maildir(path: str):
+    root = Path(path)
+    for sub in ("cur", "new"):
+        d = root / sub
+        if not d.is_dir():
+            continue
+        for entry in sorted(d.iterdir()):
+            if entry.is_file() and not entry.name.startswith("."):
+                yield entry.read_bytes(), "", _maildir_time(entry.name)
+
+def read_zip(path: str):
+    """Flat .eml zips and zipped Maildirs alike."""
+    with zipfile.ZipFile(path) as zf:
+        for info in zf.infolist():
+            name = info.filename
+            if info.is_dir() or name.startswith("tmp/") or "/tmp/" in name:
+                continue
+            if not (name.endswith(".eml") or "cur/" in name or "new/" in name):
+                continue
+            when = _maildir_time(name.rsplit("/", 1)[-1]) or datetime(*info.date_time)
+            yield zf.read(info), "", when
+
+READERS = {
+    archive.FORMAT_MBOX: read_mbox,
+    archive.FORMAT_MAILDIR: read_maildir,
+    archive.FORMAT_ZIP: read_zip,
+}
+
+def detect_format(path: str) -> str:
+    if os.path.isdir(path):
+        return archive.FORMAT_MAILDIR
+    if zipfile.is_zipfile(path):
+        return archive.FORMAT_ZIP
+    return archive.FORMAT_MBOX
+
+def _pending(data: bytes, sender: str, received_at: datetime | None) -> Pending:
+    headers = parse_headers(memoryview(data)[:body_offset(data)])
+    rcpts = [str(v) for h in archive.RCPT_HEADERS for v in (headers.get_all(h) or [])]
+    if not rcpts:
+        rcpts = [str(v) for h in archive.ADDRESS_HEADERS for v in (headers.get_all(h) or [])]
+    if not sender:
+        sender = next((a for _, a in getaddresses([str(headers.get("From", "") or "")]) if a), "")
+    if received_at is None and headers.get("Date"):
+        try:
+            dt = parsedate_to_datetime(str(headers["Date"]))
+            received_at = dt.astimezone(timezone.utc).replace(tzinfo=None) if dt.tzinfo else dt
+        except (TypeError, ValueError):
+            pass
+    item = Pending(mail_from=sender, rcpt_tos=[a for _, a in getaddresses(rcpts) if a], data=data)
+    if received_at is not None:
+        item.received_at = received_at
+    return item
+
+def import_archive(path: str, fmt: str | None, pipeline: IngestPipeline,
+                   namespace: str | None = None) -> int:
+    """Ingest every message of an mbox, Maildir or zip, optionally into one
+    namespace; returns the count."""
+    fmt = fmt or detect_format(path)
+    if fmt not in READERS:
+        raise ValueError(f"unknown archive format: {fmt!r}")
+    namespace = normalize_namespace(namespace)
+
+    def items():
+        for m in READERS[fmt](path):
+            item = _pending(*m)
+            item.namespace = namespace
+            yield item
+    return pipeline.ingest_many(items())
+
+
+def _filters(args) -> list:
+    conds = message_filters(args.q, subject=args.subject, from_addr=args.from_addr, to_addr=args.to_addr,
+                            since=args.since, until=args.until, namespace=args.namespace)
+    if args.older_than:
+        conds.append(Message.received_at < datetime.utcnow() - parse_age(args.older_than))
+    return conds
+
+def main(argv: list[str] | None = None, prog: str | None = None):
+    ap = argparse.ArgumentParser(prog=prog, description="Export stored mail to mbox/Maildir/zip, or import an archive")
+    ap.add_argument("--db", default="./localdata/messages.db")
+    ap.add_argument("--store-dir", default="./localdata")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    ex = sub.add_parser("export", help="write matching messages to an archive")
+    ex.add_argument("out", help="output file, '-' for stdout, or a directory for --format maildir")
+    ex.add_argument("--format", choices=archive.FORMATS, default=archive.FORMAT_MBOX)
+    ex.add_argument("--q", default=None, help="substring of subject, sender or recipients")
+    ex.add_argument("--subject", default=None)
+    ex.add_argument("--from", dest="from_addr", default=None)
+    ex.add_argument("--to", dest="to_addr", default=None, help="mailbox, or @domain")
+    ex.add_argument("--since", type=datetime.fromisoformat, default=None)
+    ex.add_argument("--until", type=datetime.fromisoformat, default=None)
+    ex.add_argument("--older-than", default=None, help="e.g. 7d, 12h")
+    ex.add_argument("--namespace", default=None)
+
+    im = sub.add_parser("import", help="ingest an mbox file, Maildir directory or zip")
+    im.add_argument("path")
+    im.add_argument("--format", choices=archive.FORMATS, default=None, help="detected when omitted")
+    im.add_argument("--namespace", default=None, help="file every imported message under this namespace")
+    im.add_argument("--batch-size", type=int, default=ingest.DEFAULT_BATCH_SIZE)
+    im.add_argument("--ingest-workers", type=int, default=ingest.DEFAULT_WORKERS)
+    im.add_argument("--blob-store", choices=blobs.BACKENDS, default=blobs.BACKEND_FLAT)
+    im.add_argument("--compress", choices=blobs.CODECS, default=blobs.CODEC_NONE)
+    args = ap.parse_args(argv)
+
+    Session = get_session_factory(args.db)
+    started = time.perf_counter()
+    if args.command == "import":
+        Path(args.store_dir).mkdir(parents=True, exist_ok=True)
+        pipeline = IngestPipeline(args.store_dir, Session, workers=args.ingest_workers,
+                                  batch_size=args.batch_size,
+                                  blob_store=get_blob_store(args.store_dir, args.blob_store, args.compress))
+        n = import_archive(args.path, args.format, pipeline, args.namespace)
+        print(f"imported {n} messages in {time.perf_counter() - started:.1f}s"
+              + (f" ({pipeline.failed} failed)" if pipeline.failed else ""))
+        return
+
+    ReadSession = get_session_factory(args.db, readonly=True, init=False)
+    conds = _filters(args)
+    if args.format == archive.FORMAT_MAILDIR and args.out != "-" and not args.out.endswith(".zip"):
+        n = write_maildir(ReadSession, conds, args.out)
+        print(f"exported {n} messages in {time.perf_counter() - started:.1f}s")
+        return
+    out = os.fdopen(os.dup(1), "wb") if args.out == "-" else open(args.out, "wb")
+    with out:
+        for chunk in iter_export(ReadSession, args.format, conds):
+            out.write(chunk)
+    if args.out != "-":
+        print(f"exported to {args.out} in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
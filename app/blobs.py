@@ -0,0 +1,243 @@
+from __future__ import annotations
+import gzip, hashlib, os, re, uuid
+from dataclasses import dataclass
+from sqlalchemy import select, update, delete, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app.models import Blob
+from app.constants import blobs
+
+try:
+    import zstandard
+except ImportError:  # only needed for the zstd codec
+    zstandard = None
+
+_HASHED_NAME = re.compile(r"^[0-9a-f]{64}\.eml(\.gz|\.zst)?$")
+
+
+def codec_of(path: str) -> str:
+    if path.endswith(blobs.SUFFIXES[blobs.CODEC_GZIP]):
+        return blobs.CODEC_GZIP
+    if path.endswith(blobs.SUFFIXES[blobs.CODEC_ZSTD]):
+        return blobs.CODEC_ZSTD
+    return blobs.CODEC_NONE
+
+def is_compressed(path: str) -> bool:
+    return codec_of(path) != blobs.CODEC_NONE
+
+def _require_zstd():
+    if zstandard is None:
+        raise RuntimeError("the zstd codec needs the 'zstandard' package")
+    return zstandard
+
+def open_eml(path: str):
+    """Open a stored message for reading, decompressing by file suffix."""
+    codec = codec_of(path)
+    if codec == blobs.CODEC_GZIP:
+        return gzip.open(path, "rb")
+    if codec == blobs.CODEC_ZSTD:
+        f = open(path, "rb")
+        return _require_zstd().ZstdDecompressor().stream_reader(f, closefd=True)
+    return open(path, "rb")
+
+def read_eml(path: str) -> bytes:
+    with open_eml(path) as f:
+        return f.read()
+
+def iter_eml(path: str, chunk_size: int = blobs.READ_CHUNK):
+    with open_eml(path) as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+def compress(data: bytes, codec: str, level: int | None = None) -> bytes:
+    if codec == blobs.CODEC_GZIP:
+        return gzip.compress(data, compresslevel=level or blobs.DEFAULT_LEVEL[codec], mtime=0)
+    if codec == blobs.CODEC_ZSTD:
+        return _require_zstd().ZstdCompressor(level=level or blobs.DEFAULT_LEVEL[codec]).compress(data)
+    return data
+
+def blob_key(path: str) -> str | None:
+    """Key of a content-addressed blob, or None for a per-message file."""
+    name = os.path.basename(path or "")
+    return name if _HASHED_NAME.match(name) else None
+
+def _write_atomic(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = os.path.join(os.path.dirname(path), f".{uuid.uuid4().hex}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+@dataclass(slots=True)
+class BlobRef:
+    path: str
+    size: int
+    key: str | None = None
+    stored_size: int = 0
+    reused: bool = False
+
+
+class FlatBlobStore:
+    """The original layout: one uncompressed ``{mid}.eml`` per message."""
+
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        os.makedirs(store_dir, exist_ok=True)
+
+    def write(self, mid: str, data: bytes) -> BlobRef:
+        path = os.path.join(self.store_dir, f"{mid}.eml")
+        with open(path, "wb") as f:
+            f.write(data)
+        return BlobRef(path, len(data), stored_size=len(data))
+
+    def acquire(self, session, refs: list[BlobRef]) -> None:
+        pass
+
+    def ensure(self, ref: BlobRef, data: bytes) -> None:
+        pass
+
+    def discard(self, ref: BlobRef) -> None:
+        try:
+            os.remove(ref.path)
+        except OSError:
+            pass
+
+
+class HashedBlobStore:
+    """Content-addressed blobs under ``store_dir/blobs/ab/cd/<sha256><suffix>``.
+
+    Identical messages share one file; the ``blobs`` table counts references
+    and the file is unlinked when the last message pointing at it is deleted.
+    """
+
+    def __init__(self, store_dir: str, codec: str = blobs.CODEC_NONE, level: int | None = None):
+        if codec not in blobs.CODECS:
+            raise ValueError(f"unknown codec: {codec!r}")
+        if codec == blobs.CODEC_ZSTD:
+            _require_zstd()
+        self.store_dir = store_dir
+        self.root = os.path.join(store_dir, blobs.BLOB_DIR)
+        self.codec = codec
+        self.level = level
+
+    def path_for(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], digest + blobs.SUFFIXES[self.codec])
+
+    def write(self, mid: str, data: bytes) -> BlobRef:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path_for(digest)
+        ref = BlobRef(path, len(data), key=os.path.basename(path))
+        try:
+            ref.stored_size = os.stat(path).st_size
+            ref.reused = True
+        except FileNotFoundError:
+            stored = compress(data, self.codec, self.level)
+            _write_atomic(path, stored)
+            ref.stored_size = len(stored)
+        return ref
+
+    def acquire(self, session, refs: list[BlobRef]) -> None:
+        counts: dict[str, list] = {}
+        for ref in refs:
+            entry = counts.setdefault(ref.key, [0, ref])
+            entry[0] += 1
+        if not counts:
+            return
+        insert = sqlite_insert
+        if session.bind.dialect.name == "postgresql":
+            # imported here: the dialect module costs ~50ms of every start
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(Blob).values([
+            {"key": key, "refcount": n, "size_bytes": ref.size, "stored_bytes": ref.stored_size}
+            for key, (n, ref) in counts.items()
+        ])
+        session.execute(stmt.on_conflict_do_update(
+            index_elements=[Blob.key],
+            set_={"refcount": Blob.refcount + stmt.excluded.refcount},
+        ))
+
+    def ensure(self, ref: BlobRef, data: bytes) -> None:
+        # a concurrent delete may have unlinked a blob this message reused
+        # between write() and the commit that took the reference
+        if ref.reused and not os.path.exists(ref.path):
+            _write_atomic(ref.path, compress(data, self.codec, self.level))
+
+    def discard(self, ref: BlobRef) -> None:
+        # shared: an unreferenced blob is harmless and is reused by the next
+        # identical message
+        pass
+
+
+def release_blobs(session, paths: list[str]) -> list[str]:
+    """Drop one reference per path; return the files that can be unlinked
+    once the session commits."""
+    unlink, keyed = [], {}
+    for path in paths:
+        if not path:
+            continue
+        key = blob_key(path)
+        if key is None:
+            unlink.append(path)
+        else:
+            keyed.setdefault(key, []).append(path)
+    if not keyed:
+        return unlink
+    for key, refs in keyed.items():
+        session.execute(update(Blob).where(Blob.key == key).values(refcount=Blob.refcount - len(refs)))
+    dead = session.execute(
+        select(Blob.key).where(Blob.key.in_(list(keyed)), Blob.refcount <= 0)
+    ).scalars().all()
+    if dead:
+        session.execute(delete(Blob).where(Blob.key.in_(dead)))
+    unlink.extend(keyed[k][0] for k in dead)
+    return unlink
+
+def _unlink(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def unlink_files(paths: list[str], pool=None) -> None:
+    if pool is None:
+        for path in paths:
+            _unlink(path)
+    else:
+        list(pool.map(_unlink, paths))
+
+def unlink_released(session_factory, paths: list[str], pool=None) -> None:
+    """Unlink the files release_blobs() returned, after that session has
+    committed. An identical message may have re-acquired a shared blob in
+    between; the check and the unlink run under the writer lock, so such a
+    blob is kept, and an acquire() that comes later waits for the unlink
+    and lets ensure() rewrite the file."""
+    keyed: dict[str, list[str]] = {}
+    plain = []
+    for path in paths:
+        key = blob_key(path)
+        if key is None:
+            plain.append(path)
+        else:
+            keyed.setdefault(key, []).append(path)
+    unlink_files(plain, pool)
+    if not keyed:
+        return
+    with session_factory() as s:
+        if s.bind.dialect.name == "postgresql":
+            s.execute(text(f"LOCK TABLE {Blob.__tablename__} IN SHARE ROW EXCLUSIVE MODE"))
+        else:
+            # any write statement takes SQLite's single writer lock
+            s.execute(update(Blob).where(Blob.key.in_(list(keyed))).values(refcount=Blob.refcount))
+        alive = set(s.execute(select(Blob.key).where(Blob.key.in_(list(keyed)))).scalars())
+        unlink_files([p for key, ps in keyed.items() if key not in alive for p in ps], pool)
+        s.commit()
+
+def get_blob_store(store_dir: str, backend: str = blobs.BACKEND_FLAT,
+                   codec: str = blobs.CODEC_NONE, level: int | None = None):
+    if backend == blobs.BACKEND_FLAT:
+        if codec != blobs.CODEC_NONE:
+            raise ValueError("compression requires the hashed blob backend")
+        return FlatBlobStore(store_dir)
+    if backend == blobs.BACKEND_HASHED:
+        return HashedBlobStore(store_dir, codec, level)
+    raise ValueError(f"unknown blob backend: {backend!r}")
@@ -0,0 +1,125 @@
+from __future__ import annotations
+import os, threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from email import policy
+from email.parser import BytesParser
+from app.blobs import open_eml
+from app.utils.utils import text_body, html_body, part_tree
+from app.constants import cache
+
+
+@dataclass(slots=True)
+class ParsedMessage:
+    headers: dict[str, str]
+    text: str
+    html: str
+    parts: list[dict]
+    path: str = ""
+    mtime_ns: int = 0
+    nbytes: int = field(default=0, compare=False)
+
+
+def parse_eml(path: str) -> ParsedMessage:
+    with open_eml(path) as f:
+        msg = BytesParser(policy=policy.default).parse(f)
+    headers = {k: str(msg[k]) for k in cache.PREVIEW_HEADERS if msg.get(k)}
+    try:
+        text, html = text_body(msg), html_body(msg)
+    except (LookupError, ValueError):
+        text, html = "", ""
+    parsed = ParsedMessage(headers, text or "", html or "", part_tree(msg), path)
+    parsed.nbytes = (
+        cache.ENTRY_OVERHEAD
+        + sum(len(k) + len(v) for k, v in headers.items())
+        + len(parsed.text) + len(parsed.html)
+        + cache.PART_OVERHEAD * len(parsed.parts)
+    )
+    return parsed
+
+
+class ParsedCache:
+    """LRU of parsed messages bounded by an estimate of their size in bytes.
+
+    Entries are keyed by message id and remember the file's mtime; a lookup
+    whose file has changed (or vanished) counts as a miss and drops the entry.
+    """
+
+    def __init__(self, max_bytes: int = cache.DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, ParsedMessage] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, mid: str) -> ParsedMessage | None:
+        with self._lock:
+            entry = self._entries.get(mid)
+        if entry is not None:
+            try:
+                fresh = os.stat(entry.path).st_mtime_ns == entry.mtime_ns
+            except OSError:
+                fresh = False
+            if fresh:
+                with self._lock:
+                    if mid in self._entries:
+                        self._entries.move_to_end(mid)
+                    self.hits += 1
+                return entry
+            self.invalidate(mid)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def get(self, mid: str, path: str) -> ParsedMessage:
+        return self.lookup(mid) or self.load(mid, path)
+
+    def load(self, mid: str, path: str) -> ParsedMessage:
+        mtime_ns = os.stat(path).st_mtime_ns
+        entry = parse_eml(path)
+        entry.mtime_ns = mtime_ns
+        self.put(mid, entry)
+        return entry
+
+    def put(self, mid: str, entry: ParsedMessage) -> None:
+        if entry.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(mid, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._entries[mid] = entry
+            self._bytes += entry.nbytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def invalidate(self, *mids: str) -> None:
+        with self._lock:
+            for mid in mids:
+                old = self._entries.pop(mid, None)
+                if old is not None:
+                    self._bytes -= old.nbytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+parsed_cache = ParsedCache(int(os.getenv("MESSAGE_CACHE_BYTES", cache.DEFAULT_MAX_BYTES)))
@@ -0,0 +1,95 @@
+"""``mailgate``: one entry point for the listener, the API, the TUI and the
+maintenance tools.
+
+    mailgate smtp --port 1025
+    mailgate api --port 8080
+    mailgate all                 # both, in one process, sharing the bus
+    mailgate tui
+
+Only argparse is loaded up front. A subcommand imports its module when it
+runs, so ``mailgate tui`` never loads FastAPI and ``mailgate --help``
+loads nothing at all.
+"""
+from __future__ import annotations
+import argparse, importlib, os, sys, threading
+
+# name -> (module with main(argv, prog), one-line help)
+COMMANDS = {
+    "smtp": ("app.smtp", "SMTP capture listener"),
+    "api": ("app.cli", "HTTP API under uvicorn"),
+    "all": ("app.cli", "SMTP listener and API in one process"),
+    "tui": ("app.tui.__main__", "terminal UI"),
+    "archive": ("app.archive", "export to or import from mbox/Maildir/zip"),
+    "retention": ("app.retention", "purge by retention policy; --vacuum to reclaim space"),
+    "reindex": ("app.reindex", "back-fill search, recipient, part, list-display and grouping data"),
+    "migrate-blobs": ("app.migrate_blobs", "move .eml files into the hashed blob store"),
+    "replay": ("app.relay", "re-deliver captured mail to another SMTP server"),
+}
+
+def _api_arguments(ap: argparse.ArgumentParser, prefix: str = "") -> None:
+    ap.add_argument(f"--{prefix}host", default=os.getenv("API_HOST", "127.0.0.1"))
+    ap.add_argument(f"--{prefix}port", type=int, default=int(os.getenv("API_PORT", "8080")))
+    ap.add_argument("--log-level", default="info")
+
+def _serve_api(host: str, port: int, log_level: str) -> None:
+    # app.api reads its settings from the environment when imported, so
+    # uvicorn is handed the import string and loads it after they are set
+    import uvicorn
+    uvicorn.run("app.api:app", host=host, port=port, log_level=log_level)
+
+def api_main(argv: list[str] | None = None, prog: str | None = None) -> None:
+    ap = argparse.ArgumentParser(prog=prog, description="HTTP API under uvicorn; settings come from "
+                                                        "the environment (DB_PATH, DATA_DIR, API_TOKEN, ...)")
+    _api_arguments(ap)
+    ap.add_argument("--db", default=None, help="overrides DB_PATH")
+    ap.add_argument("--store-dir", default=None, help="overrides DATA_DIR")
+    args = ap.parse_args(argv)
+    if args.db:
+        os.environ["DB_PATH"] = args.db
+    if args.store_dir:
+        os.environ["DATA_DIR"] = args.store_dir
+    _serve_api(args.host, args.port, args.log_level)
+
+def all_main(argv: list[str] | None = None, prog: str | None = None) -> None:
+    from app import smtp
+    from app.constants import notify
+    ap = smtp.add_arguments(argparse.ArgumentParser(
+        prog=prog, description="SMTP listener and API in one process; new mail reaches "
+                               "/messages/wait and /messages/stream without UDP or polling"))
+    _api_arguments(ap, prefix="api-")
+    args = smtp.parse_args(ap, argv)
+    if args.workers > 1:
+        ap.error("--workers needs separate processes; run 'mailgate smtp' and 'mailgate api' instead")
+    args.notify_addr = None
+    os.environ.update(DB_PATH=args.db, DATA_DIR=args.store_dir, NOTIFY_MODE=notify.MODE_LOCAL,
+                      BLOB_STORE=args.blob_store, BLOB_COMPRESS=args.compress)
+    os.makedirs(args.store_dir, exist_ok=True)
+    # uvicorn keeps the main thread and its signals; the listener is told
+    # to drain once the API has shut down
+    halt = threading.Event()
+    listener = threading.Thread(target=smtp.serve, args=(args,), kwargs={"halt": halt}, name="smtp")
+    listener.start()
+    try:
+        _serve_api(args.api_host, args.api_port, args.log_level)
+    finally:
+        halt.set()
+        listener.join()
+
+def main(argv: list[str] | None = None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    ap = argparse.ArgumentParser(
+        prog="mailgate", description="Capture, store and inspect test mail.",
+        epilog="commands:\n" + "\n".join(f"  {name:16}{text}" for name, (_, text) in COMMANDS.items())
+               + "\n\nrun 'mailgate <command> --help' for its options",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    ap.add_argument("command", choices=COMMANDS, metavar="command", help="one of the commands below")
+    ap.add_argument("args", nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    # parse only the command name: everything after it belongs to the command
+    args = ap.parse_args(argv[:1])
+    module, _ = COMMANDS[args.command]
+    entry = {"api": "api_main", "all": "all_main"}.get(args.command, "main")
+    getattr(importlib.import_module(module), entry)(argv[1:], prog=f"mailgate {args.command}")
+
+if __name__ == "__main__":
+    main()
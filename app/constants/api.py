@@ -0,0 +1,6 @@
+MAX_CONCURRENCY = 256     # requests in flight; 0 disables the limit
+QUEUE_TIMEOUT = 5.0       # seconds a request may wait for a slot before 503
+RETRY_AFTER = "1"
+THREADPOOL_SIZE = 40      # anyio's default, for the handlers that stay sync
+FILE_IO_THREADS = 16      # separate pool for .eml and part downloads
+UNLIMITED_PATHS = ("/messages/wait", "/messages/stream")   # long-lived by design
@@ -0,0 +1,20 @@
+FORMAT_MBOX = "mbox"          # mboxrd: "From " lines quoted with ">" on export, unquoted on import
+FORMAT_MAILDIR = "maildir"    # a directory on disk, or a zip of cur/new/tmp over HTTP
+FORMAT_ZIP = "zip"            # one {id}.eml per message
+FORMATS = (FORMAT_MBOX, FORMAT_MAILDIR, FORMAT_ZIP)
+
+MEDIA_TYPES = {
+    FORMAT_MBOX: "application/mbox",
+    FORMAT_MAILDIR: "application/zip",
+    FORMAT_ZIP: "application/zip",
+}
+EXTENSIONS = {FORMAT_MBOX: ".mbox", FORMAT_MAILDIR: ".maildir.zip", FORMAT_ZIP: ".zip"}
+
+EXPORT_BATCH = 500            # rows per keyset query while exporting
+MAILDIR_SUBDIRS = ("cur", "new", "tmp")
+MAILDIR_INFO = ":2,S"         # exported messages are marked seen
+MBOX_DATE = "%a %b %d %H:%M:%S %Y"   # asctime, as written by ctime()
+MBOX_SENDER = "MAILER-DAEMON"
+# envelope recipients of an imported message when it carries these
+RCPT_HEADERS = ("Delivered-To", "X-Original-To")
+ADDRESS_HEADERS = ("To", "Cc", "Bcc")
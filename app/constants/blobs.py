@@ -0,0 +1,13 @@
+BACKEND_FLAT = "flat"      # one {uuid}.eml per message directly in store_dir
+BACKEND_HASHED = "hashed"  # content-addressed, sharded, refcounted
+BACKENDS = (BACKEND_FLAT, BACKEND_HASHED)
+
+CODEC_NONE = "none"
+CODEC_GZIP = "gzip"
+CODEC_ZSTD = "zstd"
+CODECS = (CODEC_NONE, CODEC_GZIP, CODEC_ZSTD)
+SUFFIXES = {CODEC_NONE: ".eml", CODEC_GZIP: ".eml.gz", CODEC_ZSTD: ".eml.zst"}
+
+BLOB_DIR = "blobs"
+DEFAULT_LEVEL = {CODEC_GZIP: 6, CODEC_ZSTD: 3}
+READ_CHUNK = 64 * 1024
@@ -0,0 +1,5 @@
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+ENTRY_OVERHEAD = 512   # rough per-entry cost of the dicts/strings around the payload
+PART_OVERHEAD = 200
+
+PREVIEW_HEADERS = ("From", "To", "Cc", "Subject", "Date", "Message-ID")
@@ -0,0 +1,6 @@
+TABLE_NAME = "blobs"
+
+COL_KEY = "key"
+COL_REFCOUNT = "refcount"
+COL_SIZE = "size_bytes"
+COL_STORED_SIZE = "stored_bytes"
@@ -0,0 +1,34 @@
+JOURNAL_MODE = "WAL"
+SYNCHRONOUS = "NORMAL"
+BUSY_TIMEOUT_MS = 10_000
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_SIZE_KB = 64 * 1024
+TEMP_STORE = "MEMORY"
+# keywords (and numeric codes) SQLite accepts; it silently ignores others
+JOURNAL_MODES = frozenset({"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"})
+SYNCHRONOUS_MODES = frozenset({"OFF", "NORMAL", "FULL", "EXTRA", "0", "1", "2", "3"})
+TEMP_STORES = frozenset({"DEFAULT", "FILE", "MEMORY", "0", "1", "2"})
+
+# the writer pool holds exactly one connection: in-process writers queue on
+# the pool instead of racing for SQLite's lock and hitting "database is locked"
+WRITER_POOL_SIZE = 1
+READER_POOL_SIZE = 8
+POOL_TIMEOUT = 30
+ASYNC_DRIVER = "sqlite+aiosqlite"
+
+# stored in PRAGMA user_version; bump it with any change to a table, column,
+# index or the fts table so existing databases get init_db's full pass once
+SCHEMA_VERSION = 5
+# version -> indexes it removed or redefined. init_db drops them when
+# upgrading from an older stamp, before creating missing indexes, so a
+# redefined one is rebuilt with its new columns.
+DROPPED_INDEXES = {
+    2: ("ix_messages_received_at_id",),   # ix_messages_list covers it
+    3: ("ix_messages_list",),             # gained thread_id and dup_key
+    4: ("ix_messages_list",),             # key plus fixed-width columns only
+}
+# version -> tables whose CREATE TABLE changed in a way ALTER cannot apply.
+# init_db sets them aside, creates them afresh and copies their rows over.
+REBUILT_TABLES = {
+    5: ("messages_fts_docs",),            # AUTOINCREMENT ids
+}
@@ -0,0 +1,18 @@
+TABLE_NAME = "messages_fts"
+DOCS_TABLE_NAME = "messages_fts_docs"
+
+COL_DOC_ID = "id"
+COL_MESSAGE_ID = "message_id"
+
+# indexed columns of the fts5 table, in declaration order
+COL_SUBJECT = "subject"
+COL_FROM_ADDR = "from_addr"
+COL_TO_ADDRS = "to_addrs"
+COL_BODY = "body"
+COLUMNS = (COL_SUBJECT, COL_FROM_ADDR, COL_TO_ADDRS, COL_BODY)
+WEIGHTS = (10.0, 2.0, 2.0, 1.0)
+
+BODY_LIMIT = 64 * 1024
+SNIPPET_TOKENS = 16
+HIGHLIGHT_OPEN = "<mark>"
+HIGHLIGHT_CLOSE = "</mark>"
@@ -0,0 +1,25 @@
+TABLE_NAME = "message_groups"
+
+COL_ID = "id"
+COL_KIND = "kind"
+COL_KEY = "group_key"
+COL_NAMESPACE = "namespace"
+COL_COUNT = "count"
+COL_FIRST_AT = "first_at"
+COL_LATEST_AT = "latest_at"
+COL_LATEST_ID = "latest_id"
+
+KIND_THREAD = "thread"   # Message-ID / In-Reply-To / References chain
+KIND_DUP = "dup"         # same sender, recipients, subject and body
+KINDS = (KIND_THREAD, KIND_DUP)
+
+KEY_BYTES = 8            # blake2b digest size of a group key
+# References lines of long threads run to hundreds of ids; the root and the
+# nearest ancestors are enough to find the thread
+REFS_LIMIT = 20
+# Re:/Fwd: and their common translations, stripped before comparing subjects
+SUBJECT_PREFIXES = ("re", "fw", "fwd", "aw", "wg", "sv", "vs", "antw", "tr", "rif")
+
+IX_KIND_KEY = "ix_message_groups_kind_key"
+IX_KIND_LATEST = "ix_message_groups_kind_latest"
+IX_KIND_NAMESPACE_LATEST = "ix_message_groups_kind_namespace_latest"
@@ -8,3 +8,22 @@ COL_SUBJECT = "subject"
 COL_SIZE = "size_bytes"
 COL_EML_PATH = "eml_path"
 COL_HAS_ATTACHMENTS = "has_attachments"
+COL_NAMESPACE = "namespace"
+# display summary, filled at ingest so lists never open the .eml
+COL_DISPLAY_FROM = "display_from"
+COL_DISPLAY_TO = "display_to"
+COL_SNIPPET = "snippet"
+COL_SENT_AT = "sent_at"
+COL_PART_COUNT = "part_count"
+# grouping keys, see app.models.group
+COL_THREAD_ID = "thread_id"
+COL_DUP_KEY = "dup_key"
+
+SNIPPET_CHARS = 160
+DISPLAY_TO_CHARS = 200
+
+IX_LIST = "ix_messages_list"
+IX_THREAD_RECEIVED = "ix_messages_thread_received_at"
+IX_DUP_RECEIVED = "ix_messages_dup_received_at"
+IX_ATTACHMENTS_RECEIVED = "ix_messages_has_attachments_received_at"
+IX_NAMESPACE_RECEIVED_ID = "ix_messages_namespace_received_at_id"
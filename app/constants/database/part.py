@@ -0,0 +1,16 @@
+TABLE_NAME = "message_parts"
+
+COL_ID = "id"
+COL_MESSAGE_ID = "message_id"
+COL_INDEX = "part_index"
+COL_CONTENT_TYPE = "content_type"
+COL_CHARSET = "charset"
+COL_DISPOSITION = "disposition"
+COL_FILENAME = "filename"
+COL_ENCODING = "encoding"
+COL_HEADER_OFFSET = "header_offset"
+COL_BODY_OFFSET = "body_offset"
+COL_END_OFFSET = "end_offset"
+COL_SIZE = "size_bytes"
+
+IX_MESSAGE_PART = "ix_message_parts_message_index"
@@ -0,0 +1,17 @@
+TABLE_NAME = "message_recipients"
+
+COL_ID = "id"
+COL_MESSAGE_ID = "message_id"
+COL_RECEIVED_AT = "received_at"
+COL_KIND = "kind"
+COL_ADDRESS = "address"
+COL_DOMAIN = "domain"
+
+KIND_RCPT = "rcpt"   # SMTP envelope RCPT TO
+KIND_TO = "to"
+KIND_CC = "cc"
+KIND_BCC = "bcc"
+HEADER_KINDS = {"To": KIND_TO, "Cc": KIND_CC, "Bcc": KIND_BCC}
+
+IX_ADDRESS = "ix_message_recipients_address_received"
+IX_DOMAIN = "ix_message_recipients_domain_received"
@@ -0,0 +1,25 @@
+DURABILITY_COMMIT = "commit"      # 250 is sent only after the row is committed
+DURABILITY_ENQUEUE = "enqueue"    # 250 is sent as soon as the envelope is queued
+DURABILITY_MODES = (DURABILITY_COMMIT, DURABILITY_ENQUEUE)
+
+DEFAULT_WORKERS = 4
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_MAX_LATENCY = 0.05
+DEFAULT_QUEUE_SIZE = 10000
+
+# on top of the driver's busy timeout, for writers in other processes
+COMMIT_RETRIES = 3
+COMMIT_RETRY_DELAY = 0.05
+
+# where SinkHandler takes a message's namespace from; when several apply
+# the header wins, then the AUTH username, then the first +tag
+NAMESPACE_HEADER = "header"   # NAMESPACE_HEADER_NAME in the message
+NAMESPACE_AUTH = "auth"       # SMTP AUTH login
+NAMESPACE_TAG = "tag"         # plus-address: test+<namespace>@example.com
+NAMESPACE_SOURCES = (NAMESPACE_HEADER, NAMESPACE_AUTH, NAMESPACE_TAG)
+NAMESPACE_HEADER_NAME = "X-Mailgate-Namespace"
+NAMESPACE_MAX_LEN = 128
+
+REPLY_ACCEPTED = "250 OK - captured"
+REPLY_QUEUE_FULL = "451 4.3.2 Ingest queue full, try again later"
+REPLY_STORE_FAILED = "451 4.3.0 Could not persist message, try again later"
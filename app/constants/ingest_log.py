@@ -0,0 +1,12 @@
+SEGMENT_SUFFIX = ".log"
+SEGMENT_DIGITS = 20                          # file name: zero-padded offset of its first record
+DEFAULT_SEGMENT_BYTES = 256 * 1024 * 1024    # start a new segment past this size
+DEFAULT_RETAIN_SEGMENTS = 0                  # 0 keeps every segment
+
+# record framing: payload length and crc32, then the payload, which starts
+# with offset, received_at (us since the epoch) and the lengths of mid,
+# mail_from, namespace and the newline-joined recipients; the raw message
+# fills the rest
+HEADER_FORMAT = "<II"
+META_FORMAT = "<QqHHHI"
+READ_BUFFER = 1024 * 1024
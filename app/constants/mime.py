@@ -0,0 +1,4 @@
+MAX_PARTS = 256              # stop scanning a message's structure after this many parts
+MAX_DEPTH = 8                # nested multiparts followed
+TEXT_SCAN_LIMIT = 1 << 20    # raw bytes of the text part decoded for the search index
+BODY_TYPES = ("text/plain", "text/html")
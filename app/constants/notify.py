@@ -0,0 +1,12 @@
+MODE_LOCAL = "local"  # SMTP listener runs in the same process as the API
+MODE_UDP = "udp"      # listener publishes datagrams to NOTIFY_ADDR
+MODE_POLL = "poll"    # tail the database, only while someone is waiting
+MODES = (MODE_LOCAL, MODE_UDP, MODE_POLL)
+
+POLL_INTERVAL = 0.25
+POLL_OVERLAP = 2.0        # on resuming from idle, mail received this long before is announced
+SUBSCRIBER_QUEUE = 1000
+MAX_WAIT = 300.0
+SSE_HEARTBEAT = 15.0
+MAX_EVENT_RCPTS = 100
+MAX_EVENT_SUBJECT = 998
@@ -0,0 +1,12 @@
+DEFAULT_CONNECTIONS = 8
+DEFAULT_TIMEOUT = 30.0        # seconds per SMTP command
+DEFAULT_RETRIES = 3           # for 4xx replies and dropped connections
+RETRY_DELAY = 0.2             # seconds, times the attempt number
+
+FEED_CHUNK = 64               # envelopes handed to a connection at a time
+FEED_DEPTH = 4                # chunks read ahead per connection
+RATE_BURST = 0.05             # seconds of --rate a limiter may send at once
+
+ERROR_DISCONNECTED = "disconnected"
+ERROR_REFUSED = "recipients_refused"
+ERROR_NO_RECIPIENTS = "no_recipients"
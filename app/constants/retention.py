@@ -0,0 +1,9 @@
+CHUNK_SIZE = 500
+UNLINK_WORKERS = 8
+INTERVAL = 300.0          # seconds between retention passes
+VACUUM_PAGES = 2000       # pages released per incremental_vacuum step
+VACUUM_STEPS = 50         # steps per pass, with a pause between them
+VACUUM_PAUSE = 0.05
+
+# "7d", "12h", "30m", "45s"
+AGE_UNITS = {"d": 86400, "h": 3600, "m": 60, "s": 1}
@@ -0,0 +1,5 @@
+STATS_INTERVAL = 5.0        # seconds between worker stats reports
+DRAIN_TIMEOUT = 30.0        # grace period for workers to flush their queues on shutdown
+RESTART_BACKOFF = 1.0       # delay before restarting a worker that died young
+MAX_RESTART_BACKOFF = 30.0
+MIN_UPTIME = 10.0           # a worker that lived this long restarts immediately
@@ -0,0 +1,353 @@
+from __future__ import annotations
+import asyncio, itertools, json, logging, time, uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from app.blobs import BlobRef, FlatBlobStore
+from app.ingest_log import LogRecord
+from app.mime import scan_message
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+from app import metrics
+from app.models import Message, MessagePart, Recipient, add_to_groups, assign_threads
+from app.models.fts import index_documents
+from app.notify import message_event
+from app.ingest_rows import dup_key, fts_document, part_rows, recipient_rows, summary_fields, thread_refs
+from app.utils.utils import normalize_namespace
+from app.constants import ingest
+from app.constants.database import recipient
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class Pending:
+    mail_from: str
+    rcpt_tos: list[str]
+    data: bytes
+    namespace: str | None = None
+    mid: str = field(default_factory=lambda: str(uuid.uuid4()))
+    received_at: datetime = field(default_factory=datetime.utcnow)
+    done: asyncio.Future | None = None
+    queued: float = field(default_factory=time.perf_counter)
+
+
+@dataclass(slots=True)
+class Prepared:
+    message: Message
+    fts: dict
+    blob: BlobRef
+    raw: bytes
+    recipients: list[dict]
+    parts: list[dict]
+    refs: list[str]   # Message-IDs it replies to; thread_id is set at commit
+
+
+class IngestPipeline:
+    """Write-behind ingest: handle_DATA enqueues, a worker pool writes the
+    .eml and parses headers, and a single committer batches rows into one
+    transaction per batch_size messages or max_latency seconds."""
+
+    def __init__(self, store_dir: str, session_factory, *,
+                 workers: int = ingest.DEFAULT_WORKERS,
+                 batch_size: int = ingest.DEFAULT_BATCH_SIZE,
+                 max_latency: float = ingest.DEFAULT_MAX_LATENCY,
+                 queue_size: int = ingest.DEFAULT_QUEUE_SIZE,
+                 durability: str = ingest.DURABILITY_COMMIT,
+                 listeners: list | None = None,
+                 blob_store=None,
+                 namespace_header: str | None = None,
+                 ingest_log=None):
+        if durability not in ingest.DURABILITY_MODES:
+            raise ValueError(f"unknown durability mode: {durability!r}")
+        self.store_dir = store_dir
+        self.Session = session_factory
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.max_latency = max(0.0, max_latency)
+        self.queue_size = max(1, queue_size)
+        self.durability = durability
+        self.blobs = blob_store if blob_store is not None else FlatBlobStore(store_dir)
+        # a header in the message that overrides the submitted namespace
+        self.namespace_header = namespace_header
+        # an app.ingest_log.IngestLog each committed batch is appended to,
+        # in commit order, for replay
+        self.ingest_log = ingest_log
+        # called on the event loop with the notification events of each
+        # committed batch (see app.notify)
+        self.listeners = list(listeners or [])
+        self._queue: asyncio.Queue | None = None
+        self._rows: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._io_pool: ThreadPoolExecutor | None = None
+        self._db_pool: ThreadPoolExecutor | None = None
+        # touched only on the event loop
+        self.received = self.refused = self.committed = self.failed = self.batches = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    @property
+    def depth(self) -> int:
+        if not self._queue:
+            return 0
+        return self._queue.qsize() + self._rows.qsize()
+
+    def stats(self) -> dict:
+        return {
+            "received": self.received,
+            "refused": self.refused,
+            "committed": self.committed,
+            "failed": self.failed,
+            "batches": self.batches,
+            "depth": self.depth,
+        }
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._rows = asyncio.Queue(maxsize=self.queue_size)
+        self._io_pool = ThreadPoolExecutor(self.workers, thread_name_prefix="ingest-io")
+        self._db_pool = ThreadPoolExecutor(1, thread_name_prefix="ingest-db")
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._commit_loop()))
+
+    async def stop(self) -> None:
+        if not self._tasks:
+            return
+        await self._queue.join()
+        await self._rows.join()
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._io_pool.shutdown()
+        self._db_pool.shutdown()
+
+    async def submit(self, envelope, namespace: str | None = None) -> str:
+        self.start()
+        item = Pending(
+            mail_from=envelope.mail_from or "",
+            rcpt_tos=list(envelope.rcpt_tos or []),
+            # the raw DATA bytes; with decode_data off, content is the same object
+            data=envelope.original_content,
+            namespace=namespace,
+        )
+        if self.durability == ingest.DURABILITY_COMMIT:
+            item.done = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.refused += 1
+            metrics.SMTP_REJECTED.inc(reason="queue_full")
+            return ingest.REPLY_QUEUE_FULL
+        self.received += 1
+        metrics.SMTP_MESSAGES.inc()
+        metrics.SMTP_BYTES.inc(len(item.data))
+        metrics.SMTP_MESSAGE_SIZE.observe(len(item.data))
+        if item.done is None:
+            return ingest.REPLY_ACCEPTED
+        try:
+            # shield so a dropped client connection doesn't cancel the future
+            # the committer is about to resolve
+            await asyncio.shield(item.done)
+        except Exception:
+            metrics.SMTP_REJECTED.inc(reason="store_failed")
+            return ingest.REPLY_STORE_FAILED
+        return ingest.REPLY_ACCEPTED
+
+    async def _work(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            metrics.INGEST_STAGE.observe(time.perf_counter() - item.queued, stage="queue")
+            try:
+                prepared = await loop.run_in_executor(self._io_pool, self._prepare, item)
+            except Exception as e:
+                log.exception("failed to write message %s", item.mid)
+                self._resolve([item], e)
+            else:
+                await self._rows.put((item, prepared))
+            finally:
+                self._queue.task_done()
+
+    async def _commit_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._rows.get()]
+            deadline = loop.time() + self.max_latency
+            while len(batch) < self.batch_size:
+                if not self._rows.empty():
+                    batch.append(self._rows.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._rows.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            items = [item for item, _ in batch]
+            metrics.INGEST_BATCH.observe(len(batch))
+            prepared = [p for _, p in batch]
+            try:
+                await loop.run_in_executor(self._db_pool, self._commit, prepared)
+            except Exception as e:
+                log.exception("failed to commit batch of %d messages", len(batch))
+                self._discard(prepared)
+                self._resolve(items, e)
+            else:
+                # stored: nothing after this point may fail the batch
+                await loop.run_in_executor(self._db_pool, self._after_commit, prepared)
+                self.committed += len(items)
+                self.batches += 1
+                self._resolve(items)
+                self._notify(prepared)
+            finally:
+                for _ in batch:
+                    self._rows.task_done()
+
+    def ingest_many(self, items) -> int:
+        """Synchronous bulk path for archive imports: prepare each window of
+        batch_size items on the io threads, then commit it as one
+        transaction on the calling thread. Returns the number committed."""
+        items, done = iter(items), 0
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="ingest-io") as pool:
+            while window := list(itertools.islice(items, self.batch_size)):
+                futures = [pool.submit(self._prepare, item) for item in window]
+                batch = []
+                for item, future in zip(window, futures):
+                    try:
+                        batch.append(future.result())
+                    except Exception as e:
+                        log.exception("failed to write message %s", item.mid)
+                        self._resolve([item], e)
+                if not batch:
+                    continue
+                metrics.INGEST_BATCH.observe(len(batch))
+                try:
+                    self._commit(batch)
+                except Exception:
+                    self._discard(batch)
+                    raise
+                self._after_commit(batch)
+                self.committed += len(batch)
+                self.batches += 1
+                done += len(batch)
+                self._notify(batch)
+        return done
+
+    def _prepare(self, item: Pending) -> Prepared:
+        data, item.data = item.data, b""
+        t0 = time.perf_counter()
+        blob = self.blobs.write(item.mid, data)
+        t1 = time.perf_counter()
+        metrics.INGEST_STAGE.observe(t1 - t0, stage="write")
+
+        # headers and MIME layout only; the text part is the one body decoded
+        mime = scan_message(data)
+        msg = mime.headers
+        body = mime.text(data)
+        parts = part_rows(item.mid, mime, data)
+        subject = str(msg.get("Subject", "") or "")
+        namespace = (self.namespace_header and normalize_namespace(msg.get(self.namespace_header))) or item.namespace
+        row = Message(
+            id=item.mid,
+            received_at=item.received_at,
+            from_addr=item.mail_from,
+            to_addrs=json.dumps(item.rcpt_tos),
+            subject=subject,
+            message_id=str(msg.get("Message-ID", "") or "").strip(),
+            size_bytes=len(data),
+            has_attachments=1 if mime.has_attachments else 0,
+            eml_path=blob.path,
+            namespace=namespace,
+            dup_key=dup_key(namespace, item.mail_from, item.rcpt_tos, subject, body),
+            **summary_fields(msg, item.rcpt_tos, body, len(parts)),
+        )
+        fts = fts_document(item.mid, msg, item.mail_from, item.rcpt_tos, body=body)
+        recipients = recipient_rows(item.mid, item.received_at, item.rcpt_tos, msg)
+        metrics.INGEST_STAGE.observe(time.perf_counter() - t1, stage="parse")
+        # ensure() only needs the bytes to rewrite a shared blob it reused;
+        # the ingest log needs them for every message
+        keep = blob.reused or self.ingest_log is not None
+        return Prepared(row, fts, blob, data if keep else b"", recipients, parts, thread_refs(msg))
+
+    def _commit(self, batch: list[Prepared]) -> None:
+        t0 = time.perf_counter()
+        for attempt in range(ingest.COMMIT_RETRIES + 1):
+            try:
+                self._write_batch(batch)
+                break
+            except OperationalError as e:
+                if attempt == ingest.COMMIT_RETRIES or "locked" not in str(e):
+                    raise
+                metrics.DB_LOCK_RETRIES.inc()
+                time.sleep(ingest.COMMIT_RETRY_DELAY * (attempt + 1))
+        metrics.INGEST_STAGE.observe(time.perf_counter() - t0, stage="commit")
+
+    def _after_commit(self, batch: list[Prepared]) -> None:
+        """Steps once the rows are committed. Their failures are logged and
+        counted; the batch is stored, so it is neither failed nor discarded."""
+        for p in batch:
+            try:
+                self.blobs.ensure(p.blob, p.raw)
+            except Exception:
+                log.exception("failed to restore blob %s of message %s", p.blob.path, p.message.id)
+                metrics.BLOB_RESTORE_FAILED.inc()
+        if self.ingest_log is None:
+            return
+        try:
+            self.ingest_log.append([
+                LogRecord(p.message.id, p.message.received_at, p.message.from_addr or "",
+                          json.loads(p.message.to_addrs or "[]"), p.raw, p.message.namespace)
+                for p in batch
+            ])
+        except Exception:
+            log.exception("failed to append %d messages to the ingest log", len(batch))
+            metrics.INGEST_LOG_FAILED.inc(len(batch))
+
+    def _write_batch(self, batch: list[Prepared]) -> None:
+        with self.Session() as s:
+            # threads are resolved here, on the one writer, so replies see
+            # parents committed by earlier batches or earlier in this one
+            assign_threads(s, [(p.message, p.refs) for p in batch])
+            s.add_all([p.message for p in batch])
+            add_to_groups(s, [p.message for p in batch])
+            self.blobs.acquire(s, [p.blob for p in batch])
+            recipients = [r for p in batch for r in p.recipients]
+            if recipients:
+                s.execute(insert(Recipient), recipients)
+            parts = [r for p in batch for r in p.parts]
+            if parts:
+                s.execute(insert(MessagePart), parts)
+            index_documents(s, [p.fts for p in batch])
+            s.commit()
+
+    def _notify(self, batch: list[Prepared]) -> None:
+        if not self.listeners:
+            return
+        events = [message_event(p.message, [r[recipient.COL_ADDRESS] for r in p.recipients]) for p in batch]
+        for listener in self.listeners:
+            try:
+                listener(events)
+            except Exception:
+                log.exception("ingest listener %r failed", listener)
+
+    def _discard(self, batch: list[Prepared]) -> None:
+        for p in batch:
+            self.blobs.discard(p.blob)
+
+    def _resolve(self, items: list[Pending], exc: Exception | None = None) -> None:
+        if exc is not None:
+            self.failed += len(items)
+            metrics.INGEST_FAILED.inc(len(items))
+        for item in items:
+            if item.done is None or item.done.done():
+                continue
+            if exc is None:
+                item.done.set_result(item.mid)
+            else:
+                item.done.set_exception(exc)
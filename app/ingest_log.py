@@ -0,0 +1,189 @@
+"""Sequential log of accepted envelopes, for replaying captured traffic.
+
+Records are appended to numbered segment files (named after the offset of
+their first record) in commit order. Every record carries a crc32, and a
+torn record at the end of the last segment is cut off when the log is
+reopened. Offsets are sequence numbers: the n-th message ever logged has
+offset n, whatever segments have since been removed.
+"""
+from __future__ import annotations
+import os, struct, zlib
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Iterator
+from app.constants import ingest_log
+
+_HEADER = struct.Struct(ingest_log.HEADER_FORMAT)
+_META = struct.Struct(ingest_log.META_FORMAT)
+_EPOCH = datetime(1970, 1, 1)
+
+
+@dataclass(slots=True)
+class LogRecord:
+    mid: str
+    received_at: datetime
+    mail_from: str
+    rcpt_tos: list[str]
+    data: bytes
+    namespace: str | None = None
+    offset: int = field(default=-1)
+
+
+def _encode(r: LogRecord, offset: int) -> bytes:
+    mid, sender = r.mid.encode(), r.mail_from.encode("utf-8", "surrogateescape")
+    ns = (r.namespace or "").encode()
+    rcpts = "\n".join(r.rcpt_tos).encode("utf-8", "surrogateescape")
+    us = (r.received_at - _EPOCH) // timedelta(microseconds=1)
+    payload = b"".join((_META.pack(offset, us, len(mid), len(sender), len(ns), len(rcpts)),
+                        mid, sender, ns, rcpts, r.data))
+    return _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+def _decode(payload: bytes) -> LogRecord:
+    offset, us, n_mid, n_from, n_ns, n_rcpts = _META.unpack_from(payload)
+    pos = _META.size
+    fields = []
+    for n in (n_mid, n_from, n_ns, n_rcpts):
+        fields.append(payload[pos:pos + n].decode("utf-8", "surrogateescape"))
+        pos += n
+    mid, sender, ns, rcpts = fields
+    return LogRecord(mid, _EPOCH + timedelta(microseconds=us), sender, rcpts.split("\n") if rcpts else [],
+                     payload[pos:], ns or None, offset)
+
+def segment_name(base: int) -> str:
+    return f"{base:0{ingest_log.SEGMENT_DIGITS}d}{ingest_log.SEGMENT_SUFFIX}"
+
+def segments(directory: str) -> list[tuple[int, Path]]:
+    """(base offset, path) of each segment, oldest first."""
+    found = []
+    for p in Path(directory).glob(f"*{ingest_log.SEGMENT_SUFFIX}"):
+        if p.stem.isdigit():
+            found.append((int(p.stem), p))
+    return sorted(found)
+
+def _scan(f, size: int) -> tuple[int, int | None]:
+    """End of the last whole record in a segment, and that record's offset.
+    Only headers are read, except for the last record, whose crc is checked."""
+    end, last, last_at = 0, None, None
+    while end + _HEADER.size <= size:
+        f.seek(end)
+        length, _ = _HEADER.unpack(f.read(_HEADER.size))
+        if length < _META.size or end + _HEADER.size + length > size:
+            break
+        last_at, end = end, end + _HEADER.size + length
+        last = _META.unpack(f.read(_META.size))[0]
+    if last_at is not None:
+        f.seek(last_at)
+        length, crc = _HEADER.unpack(f.read(_HEADER.size))
+        if zlib.crc32(f.read(length)) != crc:
+            # the last record was half-written: drop it, and find the one
+            # before with a second pass bounded by its start
+            return _scan(f, last_at) if last_at else (0, None)
+    return end, last
+
+
+class IngestLog:
+    """Appends records to the current segment and rotates to a new one
+    past ``segment_bytes``; with ``retain_segments`` the oldest beyond that
+    count are deleted. Written by one thread only: the ingest committer."""
+
+    def __init__(self, directory: str, *, segment_bytes: int = ingest_log.DEFAULT_SEGMENT_BYTES,
+                 retain_segments: int = ingest_log.DEFAULT_RETAIN_SEGMENTS, fsync: bool = False):
+        self.directory = directory
+        self.segment_bytes = max(1, segment_bytes)
+        self.retain_segments = max(0, retain_segments)
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        self._file = None
+        self._size = 0
+        existing = segments(directory)
+        if not existing:
+            self.next_offset = 0
+            self._open(0)
+            return
+        base, path = existing[-1]
+        with open(path, "r+b") as f:
+            size = f.seek(0, os.SEEK_END)
+            end, last = _scan(f, size)
+            if end < size:
+                f.truncate(end)
+        self.next_offset = base if last is None else last + 1
+        self._file = open(path, "ab")
+        self._size = end
+
+    def _open(self, base: int) -> None:
+        if self._file is not None:
+            self._file.close()
+        self._file = open(os.path.join(self.directory, segment_name(base)), "ab")
+        self._size = 0
+        if self.retain_segments:
+            for _, path in segments(self.directory)[:-self.retain_segments]:
+                path.unlink(missing_ok=True)
+
+    def append(self, records: list[LogRecord]) -> int:
+        """Write records in order, assigning their offsets; returns the
+        offset of the first."""
+        first = self.next_offset
+        buf = []
+        for r in records:
+            rec = _encode(r, self.next_offset)
+            if self._size and self._size + len(rec) > self.segment_bytes:
+                self._flush(buf)
+                buf = []
+                self._open(self.next_offset)
+            r.offset = self.next_offset
+            buf.append(rec)
+            self._size += len(rec)
+            self.next_offset += 1
+        self._flush(buf)
+        return first
+
+    def _flush(self, buf: list[bytes]) -> None:
+        if not buf:
+            return
+        self._file.write(b"".join(buf))
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_log(directory: str, start: int = 0, stop: int | None = None) -> Iterator[LogRecord]:
+    """Records with ``start <= offset < stop``, in order. Whole segments
+    before ``start`` are skipped by name, records within one by their
+    length; an incomplete record at the tail (a writer mid-append) ends
+    the read, a corrupt one raises ValueError."""
+    found = segments(directory)
+    for i, (base, path) in enumerate(found):
+        if stop is not None and base >= stop:
+            return
+        if i + 1 < len(found) and found[i + 1][0] <= start:
+            continue
+        with open(path, "rb", buffering=ingest_log.READ_BUFFER) as f:
+            while True:
+                header = f.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    break
+                length, crc = _HEADER.unpack(header)
+                if length < _META.size:
+                    raise ValueError(f"corrupt record in {path} at byte {f.tell() - _HEADER.size}")
+                meta = f.read(_META.size)
+                if len(meta) < _META.size:
+                    return
+                offset = _META.unpack(meta)[0]
+                if offset < start:
+                    f.seek(length - _META.size, os.SEEK_CUR)
+                    continue
+                if stop is not None and offset >= stop:
+                    return
+                f.seek(-_META.size, os.SEEK_CUR)
+                payload = f.read(length)
+                if len(payload) < length:
+                    return
+                if zlib.crc32(payload) != crc:
+                    raise ValueError(f"corrupt record in {path} at offset {offset}")
+                yield _decode(payload)
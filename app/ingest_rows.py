@@ -0,0 +1,111 @@
+"""Rows worked out from a message once, at ingest (and by the reindex
+back-fills): full-text documents, list display columns, recipients, MIME
+parts and the thread/duplicate keys."""
+import re
+from datetime import timezone
+from email.utils import getaddresses, parsedate_to_datetime
+from app.models.group import group_key
+from app.utils.utils import normalize_address, text_body
+from app.constants.database import fts, group, message, part, recipient
+
+def fts_document(mid: str, msg, mail_from: str, rcpt_tos: list[str], body: str | None = None) -> dict:
+    """Full-text row for a message parsed with ``policy.default``; pass
+    ``body`` when only the headers were parsed."""
+    if body is None:
+        try:
+            body = text_body(msg)
+        except (LookupError, ValueError):
+            body = ""
+    return {
+        fts.COL_MESSAGE_ID: mid,
+        fts.COL_SUBJECT: str(msg.get("Subject", "") or ""),
+        fts.COL_FROM_ADDR: " ".join(filter(None, [mail_from, str(msg.get("From", "") or "")])),
+        fts.COL_TO_ADDRS: " ".join([*rcpt_tos, *(str(msg.get(h, "") or "") for h in ("To", "Cc"))]).strip(),
+        fts.COL_BODY: body[:fts.BODY_LIMIT],
+    }
+
+def summary_fields(msg, rcpt_tos: list[str], body: str, part_count: int) -> dict:
+    """The display columns of a messages row, worked out once at ingest so
+    list and preview-header rendering never go back to the .eml."""
+    rcpts = [a for _, a in getaddresses([str(v) for h in ("To", "Cc") for v in (msg.get_all(h) or [])]) if a]
+    display_to = ", ".join(rcpts or rcpt_tos)
+    if len(display_to) > message.DISPLAY_TO_CHARS:
+        display_to = display_to[:message.DISPLAY_TO_CHARS - 1] + "…"
+    try:
+        sent_at = parsedate_to_datetime(str(msg.get("Date", "") or ""))
+    except (TypeError, ValueError, IndexError):
+        sent_at = None
+    if sent_at is not None and sent_at.tzinfo is not None:
+        # stored naive in UTC, like received_at
+        sent_at = sent_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return {
+        message.COL_DISPLAY_FROM: str(msg.get("From", "") or ""),
+        message.COL_DISPLAY_TO: display_to,
+        message.COL_SNIPPET: " ".join(body[:message.SNIPPET_CHARS * 4].split())[:message.SNIPPET_CHARS],
+        message.COL_SENT_AT: sent_at,
+        message.COL_PART_COUNT: part_count,
+    }
+
+_MSGID = re.compile(r"<[^<>\s]+>")
+_SUBJECT_PREFIX = re.compile(
+    r"^(?:\s*(?:%s)\s*(?:\[\d+\]|\(\d+\))?\s*:)+" % "|".join(group.SUBJECT_PREFIXES), re.IGNORECASE)
+
+def thread_refs(msg) -> list[str]:
+    """Message-IDs a message replies to, root first: References, then
+    In-Reply-To when References does not already end with it."""
+    refs = _MSGID.findall(str(msg.get("References", "") or ""))
+    parent = _MSGID.findall(str(msg.get("In-Reply-To", "") or ""))[:1]
+    if parent and parent[0] not in refs:
+        refs.extend(parent)
+    if len(refs) > group.REFS_LIMIT:
+        refs = refs[:1] + refs[1 - group.REFS_LIMIT:]
+    return refs
+
+def normalize_subject(subject: str) -> str:
+    """``Re: [2] Fwd:  Weekly  report`` -> ``weekly report``."""
+    return " ".join(_SUBJECT_PREFIX.sub("", subject or "").split()).lower()
+
+def dup_key(namespace: str | None, mail_from: str, rcpt_tos: list[str], subject: str, body: str) -> str:
+    """Equal for resends of one mail: same envelope, subject and text body,
+    whatever their Message-ID and Date say."""
+    rcpts = ",".join(sorted({normalize_address(a)[0] for a in rcpt_tos}))
+    return group_key(namespace, normalize_address(mail_from)[0], rcpts, normalize_subject(subject), body)
+
+def part_rows(mid: str, summary, data) -> list[dict]:
+    """message_parts rows for the leaf parts of a scanned message."""
+    return [{
+        part.COL_MESSAGE_ID: mid,
+        part.COL_INDEX: p.index,
+        part.COL_CONTENT_TYPE: p.content_type,
+        part.COL_CHARSET: p.charset,
+        part.COL_DISPOSITION: p.disposition,
+        part.COL_FILENAME: p.filename,
+        part.COL_ENCODING: p.encoding,
+        part.COL_HEADER_OFFSET: p.start,
+        part.COL_BODY_OFFSET: p.body,
+        part.COL_END_OFFSET: p.end,
+        part.COL_SIZE: p.decoded_size(data),
+    } for p in summary.parts]
+
+def recipient_rows(mid: str, received_at, rcpt_tos: list[str], msg=None) -> list[dict]:
+    """message_recipients rows: envelope RCPT TO plus header To/Cc/Bcc,
+    lowercased and de-duplicated per (kind, address)."""
+    found = [(recipient.KIND_RCPT, a) for a in rcpt_tos]
+    if msg is not None:
+        for header, kind in recipient.HEADER_KINDS.items():
+            values = [str(v) for v in (msg.get_all(header) or [])]
+            found.extend((kind, a) for _, a in getaddresses(values) if a)
+    rows, seen = [], set()
+    for kind, addr in found:
+        address, domain = normalize_address(addr)
+        if not address or (kind, address) in seen:
+            continue
+        seen.add((kind, address))
+        rows.append({
+            recipient.COL_MESSAGE_ID: mid,
+            recipient.COL_RECEIVED_AT: received_at,
+            recipient.COL_KIND: kind,
+            recipient.COL_ADDRESS: address,
+            recipient.COL_DOMAIN: domain,
+        })
+    return rows
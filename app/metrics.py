@@ -0,0 +1,250 @@
+from __future__ import annotations
+import bisect, functools, inspect, os, threading
+from time import perf_counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from app.constants import metrics as defaults
+
+# Instruments check this on every call, so a disabled process pays for one
+# attribute lookup per call site.
+enabled = os.getenv("METRICS_ENABLED", "1").lower() not in ("0", "false", "no", "off")
+
+def set_enabled(value: bool) -> None:
+    global enabled
+    enabled = value
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(k, "")) for k in self.labels)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            values = {k: (list(v) if isinstance(v, list) else v) for k, v in self._values.items()}
+        return {"kind": self.kind, "help": self.help, "labels": self.labels, "values": values}
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, value: float = 1, **labels) -> None:
+        if not enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+
+class Gauge(_Metric):
+    """Set explicitly, or computed at scrape time by ``fn`` (label tuple -> value)."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), fn=None):
+        super().__init__(name, help, labels)
+        self.fn = fn
+
+    def set(self, value: float, **labels) -> None:
+        if not enabled:
+            return
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def snapshot(self) -> dict:
+        snap = super().snapshot()
+        if self.fn is not None:
+            snap["values"].update(self.fn())
+        return snap
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (),
+                 buckets: tuple = defaults.LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        if not enabled:
+            return
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            # per-bucket (non-cumulative) counts, then +Inf, sum
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[i] += 1
+            state[-1] += value
+
+    def snapshot(self) -> dict:
+        snap = super().snapshot()
+        snap["buckets"] = self.buckets
+        return snap
+
+
+def timed(histogram: Histogram, **labels):
+    """Decorator observing a function's wall time into ``histogram``."""
+    def wrap(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def ainner(*args, **kwargs):
+                if not enabled:
+                    return await fn(*args, **kwargs)
+                t0 = perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    histogram.observe(perf_counter() - t0, **labels)
+            return ainner
+
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            if not enabled:
+                return fn(*args, **kwargs)
+            t0 = perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe(perf_counter() - t0, **labels)
+        return inner
+    return wrap
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: tuple[str, ...] = (), fn=None) -> Gauge:
+        return self._add(Gauge(name, help, labels, fn))
+
+    def histogram(self, name: str, help: str, labels: tuple[str, ...] = (),
+                  buckets: tuple = defaults.LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def snapshot(self) -> dict:
+        """Plain-data copy of every metric, picklable for other processes."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {m.name: m.snapshot() for m in metrics}
+
+
+def merge(snapshots: list[dict]) -> dict:
+    """Sum snapshots from several processes (counters, gauges and buckets)."""
+    out: dict[str, dict] = {}
+    for snap in snapshots:
+        for name, m in snap.items():
+            into = out.setdefault(name, {**m, "values": {}})
+            for key, v in m["values"].items():
+                have = into["values"].get(key)
+                if have is None:
+                    into["values"][key] = list(v) if isinstance(v, list) else v
+                elif isinstance(v, list):
+                    into["values"][key] = [a + b for a, b in zip(have, v)]
+                else:
+                    into["values"][key] = have + v
+    return out
+
+def _fmt(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{k}="{_escape(v)}"' for k, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def render(snapshot: dict) -> str:
+    """Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for name in sorted(snapshot):
+        m = snapshot[name]
+        lines.append(f"# HELP {name} {m['help']}")
+        lines.append(f"# TYPE {name} {m['kind']}")
+        for key in sorted(m["values"]):
+            v = m["values"][key]
+            if m["kind"] != "histogram":
+                lines.append(f"{name}{_labels(m['labels'], key)} {_fmt(v)}")
+                continue
+            running = 0
+            for bound, n in zip((*m["buckets"], float("inf")), v):
+                running += n
+                le = 'le="%s"' % _fmt(bound)
+                lines.append(f"{name}_bucket{_labels(m['labels'], key, le)} {running}")
+            lines.append(f"{name}_sum{_labels(m['labels'], key)} {_fmt(v[-1])}")
+            lines.append(f"{name}_count{_labels(m['labels'], key)} {running}")
+    return "\n".join(lines) + "\n"
+
+
+def serve(addr: str, collect) -> ThreadingHTTPServer:
+    """Serve ``render(collect())`` at ``http://addr/metrics`` from a daemon thread."""
+    host, _, port = addr.rpartition(":")
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render(collect()).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", defaults.CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host or "127.0.0.1", int(port)), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+registry = Registry()
+
+# -- SMTP ingest -------------------------------------------------------------
+SMTP_MESSAGES = registry.counter("mailgate_smtp_messages_total", "Messages accepted by DATA")
+SMTP_BYTES = registry.counter("mailgate_smtp_bytes_total", "Raw bytes of accepted messages")
+SMTP_REJECTED = registry.counter("mailgate_smtp_rejected_total", "DATA commands answered with 4xx", ("reason",))
+SMTP_ACCEPT = registry.histogram("mailgate_smtp_accept_seconds", "DATA received to reply sent")
+SMTP_MESSAGE_SIZE = registry.histogram("mailgate_smtp_message_bytes", "Raw message size",
+                                       buckets=defaults.SIZE_BUCKETS)
+INGEST_STAGE = registry.histogram("mailgate_ingest_stage_seconds",
+                                  "Time per ingest stage (queue, write, parse, commit)", ("stage",))
+INGEST_BATCH = registry.histogram("mailgate_ingest_batch_messages", "Messages per commit",
+                                  buckets=defaults.BATCH_BUCKETS)
+INGEST_FAILED = registry.counter("mailgate_ingest_failed_total", "Messages that could not be stored")
+# fn is pointed at the running pipeline by app.smtp.serve
+INGEST_QUEUE_DEPTH = registry.gauge("mailgate_ingest_queue_depth", "Messages waiting to be written or committed")
+DB_LOCK_RETRIES = registry.counter("mailgate_db_lock_retries_total",
+                                   "Commits retried because the database was locked")
+BLOB_RESTORE_FAILED = registry.counter("mailgate_blob_restore_failed_total",
+                                       "Reused blobs found deleted after commit and not rewritten")
+INGEST_LOG_FAILED = registry.counter("mailgate_ingest_log_failed_total",
+                                     "Stored messages that could not be appended to the ingest log")
+
+# -- queries -----------------------------------------------------------------
+STORE_QUERY = registry.histogram("mailgate_store_query_seconds", "Store method latency", ("op",))
+HTTP_REQUEST = registry.histogram("mailgate_http_request_seconds", "API request latency",
+                                  ("method", "route", "status"))
@@ -0,0 +1,24 @@
+from __future__ import annotations
+import argparse, time
+from app.blobs import get_blob_store
+from app.storage import Store
+from app.constants import blobs
+
+def main(argv: list[str] | None = None, prog: str | None = None):
+    ap = argparse.ArgumentParser(prog=prog, description="Move stored messages into the content-addressed blob store")
+    ap.add_argument("--db", default="./localdata/messages.db")
+    ap.add_argument("--store-dir", default="./localdata")
+    ap.add_argument("--compress", choices=blobs.CODECS, default=blobs.CODEC_GZIP)
+    ap.add_argument("--level", type=int, default=None)
+    ap.add_argument("--batch-size", type=int, default=500)
+    args = ap.parse_args(argv)
+
+    store = Store(args.db, args.store_dir)
+    target = get_blob_store(args.store_dir, blobs.BACKEND_HASHED, args.compress, args.level)
+    started = time.perf_counter()
+    migrated, missing = store.migrate_blobs(target, batch_size=args.batch_size)
+    print(f"migrated {migrated} messages in {time.perf_counter() - started:.1f}s"
+          + (f" ({missing} missing .eml files skipped)" if missing else ""))
+
+if __name__ == "__main__":
+    main()
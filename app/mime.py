@@ -0,0 +1,220 @@
+from __future__ import annotations
+import binascii, re
+from dataclasses import dataclass, field
+from email import policy
+from email.message import EmailMessage
+from email.parser import BytesParser, Parser
+from app.blobs import open_eml
+from app.constants import blobs, mime
+
+_BLANK_LINE = re.compile(rb"\r?\n\r?\n")
+_HEADERS = Parser(policy=policy.default)
+
+
+def body_offset(data, start: int = 0, end: int | None = None) -> int:
+    """Offset just past the blank line ending the header block at ``start``."""
+    end = len(data) if end is None else end
+    if data[start:start + 2] == b"\r\n":
+        return start + 2
+    if data[start:start + 1] == b"\n":
+        return start + 1
+    m = _BLANK_LINE.search(data, start, end)
+    return m.end() if m else end
+
+def parse_headers(view: memoryview) -> EmailMessage:
+    """Header-only parse of a raw header block. ``policy.default`` decodes
+    RFC 2047 encoded words, so ``str(msg["Subject"])`` is display text."""
+    # surrogateescape keeps 8-bit header bytes, as BytesParser does
+    return _HEADERS.parsestr(str(view, "ascii", "surrogateescape"), headersonly=True)
+
+
+@dataclass(slots=True)
+class MimePart:
+    index: int
+    content_type: str
+    disposition: str | None
+    filename: str | None
+    encoding: str
+    charset: str | None
+    start: int   # offset of the part's headers in the raw message
+    body: int    # offset of its (still transfer-encoded) body
+    end: int
+
+    @property
+    def is_attachment(self) -> bool:
+        if self.disposition == "attachment":
+            return True
+        # named non-body parts, which some clients send as "inline"
+        return bool(self.filename) and self.content_type not in mime.BODY_TYPES
+
+    def decoded_size(self, data) -> int:
+        """Size after transfer decoding, counted without decoding base64."""
+        if self.encoding == "base64":
+            end = self.end
+            while end > self.body and data[end - 1:end] in (b"\r", b"\n", b" ", b"\t", b"="):
+                end -= 1
+            n = end - self.body - sum(data.count(c, self.body, end) for c in (b"\r", b"\n", b" ", b"\t"))
+            return n * 3 // 4
+        if self.encoding == "quoted-printable":
+            return len(binascii.a2b_qp(data[self.body:self.end]))
+        return self.end - self.body
+
+
+@dataclass(slots=True)
+class MimeSummary:
+    headers: EmailMessage
+    body: int
+    parts: list[MimePart] = field(default_factory=list)
+    truncated: bool = False
+
+    @property
+    def has_attachments(self) -> bool:
+        return any(p.is_attachment for p in self.parts)
+
+    def text_part(self) -> MimePart | None:
+        """First text/plain leaf, else the first other text/* leaf."""
+        texts = [p for p in self.parts if p.content_type.startswith("text/") and not p.is_attachment]
+        for p in texts:
+            if p.content_type == "text/plain":
+                return p
+        return texts[0] if texts else None
+
+    def text(self, data, limit: int = mime.TEXT_SCAN_LIMIT) -> str:
+        """Decoded text body; only that part's bytes (at most ``limit`` of
+        its body) are parsed."""
+        part = self.text_part()
+        if part is None:
+            return ""
+        raw = memoryview(data)[part.start:min(part.end, part.body + limit)]
+        try:
+            return BytesParser(policy=policy.default).parsebytes(bytes(raw)).get_content()
+        except (LookupError, ValueError, AttributeError):
+            return ""
+
+
+def _delimiters(data, boundary: str, start: int, end: int):
+    """(start, end) of each body part between ``--boundary`` lines."""
+    delim = b"--" + boundary.encode("ascii", "surrogateescape")
+    if data[start:start + len(delim)] == delim:
+        p = start
+    else:
+        p = data.find(b"\n" + delim, start, end)
+        if p < 0:
+            return
+        p += 1
+    while True:
+        after = p + len(delim)
+        if data[after:after + 2] == b"--":
+            return
+        nl = data.find(b"\n", after, end)
+        if nl < 0:
+            return
+        q = nl
+        while True:
+            q = data.find(b"\n" + delim, q, end)
+            if q < 0:
+                yield nl + 1, end
+                return
+            # a longer boundary that merely starts with ours is not a delimiter
+            tail = data[q + 1 + len(delim):q + 3 + len(delim)]
+            if tail[:1] in (b"", b"\r", b"\n", b" ", b"\t") or tail == b"--":
+                break
+            q += 1
+        part_end = q - 1 if q > nl and data[q - 1:q] == b"\r" else q
+        yield nl + 1, max(nl + 1, part_end)
+        p = q + 1
+
+def _walk(data, view, headers: EmailMessage, start: int, body: int, end: int,
+          parts: list[MimePart], depth: int) -> bool:
+    """Append the leaves under one part; True when a limit cut the scan short."""
+    boundary = headers.get_boundary() if headers.get_content_maintype() == "multipart" else None
+    if boundary:
+        if depth >= mime.MAX_DEPTH:
+            return True
+        for s, e in _delimiters(data, boundary, body, end):
+            if len(parts) >= mime.MAX_PARTS:
+                return True
+            b = body_offset(data, s, e)
+            if _walk(data, view, parse_headers(view[s:b]), s, b, e, parts, depth + 1):
+                return True
+        return False
+    parts.append(MimePart(
+        index=len(parts),
+        content_type=headers.get_content_type(),
+        disposition=headers.get_content_disposition(),
+        filename=headers.get_filename(),
+        encoding=str(headers.get("Content-Transfer-Encoding", "") or "7bit").strip().lower(),
+        charset=headers.get_content_charset(),
+        start=start, body=body, end=end,
+    ))
+    return False
+
+def scan_message(data: bytes) -> MimeSummary:
+    """Headers and MIME layout of a raw message without decoding any part.
+
+    Only header blocks are parsed; part bodies are located by searching for
+    boundary lines, so a large base64 attachment costs one ``find`` rather
+    than a decode.
+    """
+    view = memoryview(data)
+    body = body_offset(data)
+    summary = MimeSummary(parse_headers(view[:body]), body)
+    summary.truncated = _walk(data, view, summary.headers, 0, body, len(data), summary.parts, 0)
+    return summary
+
+
+def _decode(f, length: int, encoding: str, chunk_size: int):
+    """Transfer-decode ``length`` encoded bytes read from ``f`` in chunks."""
+    decode = binascii.a2b_base64 if encoding == "base64" else binascii.a2b_qp
+    remaining, carry = length, b""
+    while remaining > 0:
+        raw = f.read(min(chunk_size, remaining))
+        if not raw:
+            break
+        remaining -= len(raw)
+        if encoding == "base64":
+            buf = carry + raw.translate(None, b" \t\r\n")
+            cut = len(buf) - len(buf) % 4
+        else:
+            # quoted-printable soft breaks only make sense on whole lines
+            buf = carry + raw
+            cut = len(buf) if remaining <= 0 else buf.rfind(b"\n") + 1
+        carry = buf[cut:]
+        if cut:
+            yield decode(buf[:cut])
+    if carry:
+        if encoding == "base64":
+            carry += b"=" * (-len(carry) % 4)   # unpadded final quantum
+        try:
+            yield decode(carry)
+        except binascii.Error:
+            pass
+
+def iter_part(path: str, encoding: str, body: int, end: int, start: int = 0,
+              stop: int | None = None, chunk_size: int = blobs.READ_CHUNK):
+    """Stream decoded bytes ``[start, stop)`` of the part whose encoded body
+    is ``[body, end)`` of the stored message.
+
+    Identity encodings seek straight to ``start``; base64 and
+    quoted-printable decode from the part's start and skip ahead.
+    """
+    with open_eml(path) as f:
+        if encoding not in ("base64", "quoted-printable"):
+            f.seek(body + start)
+            remaining = min(end, body + stop if stop is not None else end) - body - start
+            while remaining > 0:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+            return
+        f.seek(body)
+        pos = 0
+        for chunk in _decode(f, end - body, encoding, chunk_size):
+            lo, hi = max(0, start - pos), len(chunk) if stop is None else min(len(chunk), stop - pos)
+            pos += len(chunk)
+            if hi > lo:
+                yield chunk[lo:hi]
+            if stop is not None and pos >= stop:
+                return
@@ -1,5 +1,13 @@
 from .base import Base
 from .message import Message
-from .session import get_engine, init_db, get_session_factory
+from .fts import FtsDoc
+from .blob import Blob
+from .recipient import Recipient
+from .part import MessagePart
+from .group import MessageGroup, add_to_groups, assign_threads, group_key, group_keys, refresh_groups
+from .related import delete_related
+from .session import get_engine, get_async_engine, init_db, schema_version, get_session_factory, get_async_session_factory
 
-__all__ = ["Base", "Message", "get_engine", "init_db", "get_session_factory"]
\ No newline at end of file
+__all__ = ["Base", "Message", "FtsDoc", "Blob", "Recipient", "MessagePart", "MessageGroup", "add_to_groups", "assign_threads",
+           "group_key", "group_keys", "refresh_groups", "delete_related", "get_engine", "get_async_engine", "init_db", "schema_version",
+           "get_session_factory", "get_async_session_factory"]
\ No newline at end of file
@@ -0,0 +1,10 @@
+from sqlalchemy import Column, String, Integer
+from .base import Base
+from app.constants.database import blob
+
+class Blob(Base):
+    __tablename__ = blob.TABLE_NAME
+    key = Column(String, primary_key=True)   # file name: sha256 hex + codec suffix
+    refcount = Column(Integer, nullable=False, default=0)
+    size_bytes = Column(Integer)
+    stored_bytes = Column(Integer)
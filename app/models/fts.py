@@ -0,0 +1,100 @@
+from __future__ import annotations
+import re
+from sqlalchemy import Column, Integer, String, delete, select, text
+from .base import Base
+from app.constants.database import fts, message
+
+class FtsDoc(Base):
+    # Maps a message to its fts5 rowid. messages has a string primary key,
+    # and its implicit rowid is not stable across VACUUM, so the full-text
+    # rows are keyed on this table's INTEGER PRIMARY KEY instead.
+    # AUTOINCREMENT never hands out an id again, so ids follow commit order
+    # even after the newest rows are deleted; notify.DbTail relies on it.
+    __tablename__ = fts.DOCS_TABLE_NAME
+    __table_args__ = {"sqlite_autoincrement": True}
+    id = Column(Integer, primary_key=True)
+    message_id = Column(String, unique=True, index=True, nullable=False)
+
+def fts_available(bind) -> bool:
+    return bind.dialect.name == "sqlite"
+
+def init_fts(engine) -> None:
+    if not fts_available(engine):
+        return
+    cols = ", ".join(fts.COLUMNS)
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts.TABLE_NAME} "
+            f"USING fts5({cols}, tokenize='unicode61 remove_diacritics 2')"
+        ))
+
+def index_documents(session, docs: list[dict]) -> None:
+    """Add full-text rows; each doc has ``message_id`` plus the fts columns."""
+    if not docs or not fts_available(session.bind):
+        return
+    links = [FtsDoc(message_id=d["message_id"]) for d in docs]
+    session.add_all(links)
+    session.flush()
+    cols = ", ".join(fts.COLUMNS)
+    params = ", ".join(f":{c}" for c in fts.COLUMNS)
+    session.execute(
+        text(f"INSERT INTO {fts.TABLE_NAME}(rowid, {cols}) VALUES (:rowid, {params})"),
+        [
+            {"rowid": link.id, **{c: (d.get(c) or "") for c in fts.COLUMNS}}
+            for link, d in zip(links, docs)
+        ],
+    )
+
+def remove_documents(session, message_ids: list[str]) -> None:
+    if not message_ids or not fts_available(session.bind):
+        return
+    rowids = session.execute(
+        select(FtsDoc.id).where(FtsDoc.message_id.in_(message_ids))
+    ).scalars().all()
+    if not rowids:
+        return
+    session.execute(
+        text(f"DELETE FROM {fts.TABLE_NAME} WHERE rowid = :rowid"),
+        [{"rowid": r} for r in rowids],
+    )
+    session.execute(delete(FtsDoc).where(FtsDoc.id.in_(rowids)))
+
+_TERM = re.compile(r'"[^"]*"|\S+')
+
+def to_match_query(q: str) -> str:
+    """Turn free text into an fts5 MATCH expression.
+
+    Every word (or double-quoted phrase) becomes a quoted phrase, so
+    punctuation in addresses can't trip the fts5 parser; a trailing ``*``
+    keeps prefix matching.
+    """
+    terms = []
+    for raw in _TERM.findall(q or ""):
+        prefix = raw.endswith("*") and not raw.startswith('"')
+        word = raw.rstrip("*").strip('"').replace('"', '""')
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    if not terms:
+        raise ValueError("empty search query")
+    return " ".join(terms)
+
+def search(session, q: str, *, limit: int = 50, offset: int = 0,
+           open_mark: str = fts.HIGHLIGHT_OPEN, close_mark: str = fts.HIGHLIGHT_CLOSE) -> list[dict]:
+    """Ranked (bm25, best first) full-text matches with a highlighted snippet."""
+    if not fts_available(session.bind):
+        raise ValueError("full-text search requires SQLite with fts5")
+    weights = ", ".join(str(w) for w in fts.WEIGHTS)
+    stmt = text(
+        f"SELECT d.{fts.COL_MESSAGE_ID} AS mid, "
+        f"bm25({fts.TABLE_NAME}, {weights}) AS rank, "
+        f"snippet({fts.TABLE_NAME}, -1, :open, :close, '…', {fts.SNIPPET_TOKENS}) AS snippet "
+        f"FROM {fts.TABLE_NAME} f "
+        f"JOIN {fts.DOCS_TABLE_NAME} d ON d.{fts.COL_DOC_ID} = f.rowid "
+        f"WHERE {fts.TABLE_NAME} MATCH :q "
+        f"ORDER BY rank LIMIT :limit OFFSET :offset"
+    )
+    rows = session.execute(stmt, {
+        "q": to_match_query(q), "open": open_mark, "close": close_mark,
+        "limit": limit, "offset": offset,
+    }).all()
+    return [{message.COL_ID: r.mid, "rank": r.rank, "snippet": r.snippet} for r in rows]
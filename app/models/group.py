@@ -0,0 +1,125 @@
+from __future__ import annotations
+import hashlib
+from sqlalchemy import Column, DateTime, Integer, String, Index, case, delete, func, insert, literal, select, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import aliased
+from .base import Base
+from .message import Message
+from app.constants.database import group
+
+class MessageGroup(Base):
+    """One thread or duplicate set, kept up to date as messages arrive and
+    are deleted, so grouped listings page this table instead of grouping
+    the messages table."""
+    __tablename__ = group.TABLE_NAME
+    __table_args__ = (
+        Index(group.IX_KIND_KEY, group.COL_KIND, group.COL_KEY, unique=True),
+        # grouped pages walk (latest_at, group_key) newest first, like messages
+        Index(group.IX_KIND_LATEST, group.COL_KIND, group.COL_LATEST_AT, group.COL_KEY),
+        Index(group.IX_KIND_NAMESPACE_LATEST, group.COL_KIND, group.COL_NAMESPACE,
+              group.COL_LATEST_AT, group.COL_KEY),
+    )
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    group_key = Column(String, nullable=False)
+    namespace = Column(String)
+    count = Column(Integer, nullable=False)
+    first_at = Column(DateTime)
+    latest_at = Column(DateTime)
+    latest_id = Column(String)   # newest message, shown for the group
+
+GROUP_COLUMNS = {group.KIND_THREAD: Message.thread_id, group.KIND_DUP: Message.dup_key}
+
+def group_key(namespace: str | None, *values: str) -> str:
+    """Short digest used as ``thread_id`` / ``dup_key``; the namespace is
+    part of it, so groups never span namespaces."""
+    raw = "\x1f".join([namespace or "", *values]).encode("utf-8", "surrogatepass")
+    return hashlib.blake2b(raw, digest_size=group.KEY_BYTES).hexdigest()
+
+def assign_threads(session, items: list[tuple[Message, list[str]]]) -> None:
+    """Set ``thread_id`` on new messages given their referenced Message-IDs
+    (root first). A message joins the thread of any referenced message
+    already stored or earlier in ``items``; otherwise the id is derived
+    from the root of its chain, so a parent that arrives after its reply
+    still lands in the same thread."""
+    wanted = {r for _, refs in items for r in refs}
+    known: dict[tuple, str] = {}
+    if wanted:
+        rows = session.execute(
+            select(Message.namespace, Message.message_id, Message.thread_id)
+            .where(Message.message_id.in_(wanted), Message.thread_id.is_not(None))
+        )
+        for ns, ref, tid in rows:
+            known.setdefault((ns, ref), tid)
+    for m, refs in items:
+        tid = next((known[(m.namespace, r)] for r in refs if (m.namespace, r) in known), None)
+        if tid is None:
+            tid = group_key(m.namespace, refs[0] if refs else (m.message_id or m.id))
+        m.thread_id = tid
+        if m.message_id:
+            known.setdefault((m.namespace, m.message_id), tid)
+
+def add_to_groups(session, messages: list) -> None:
+    """Count new messages into their groups: one upsert per batch."""
+    acc: dict[tuple, dict] = {}
+    for m in messages:
+        for kind, col in GROUP_COLUMNS.items():
+            key = getattr(m, col.key)
+            if not key:
+                continue
+            g = acc.get((kind, key))
+            if g is None:
+                g = acc[(kind, key)] = {
+                    group.COL_KIND: kind, group.COL_KEY: key, group.COL_NAMESPACE: m.namespace,
+                    group.COL_COUNT: 0, group.COL_FIRST_AT: m.received_at,
+                    group.COL_LATEST_AT: m.received_at, group.COL_LATEST_ID: m.id,
+                }
+            g[group.COL_COUNT] += 1
+            if (m.received_at, m.id) > (g[group.COL_LATEST_AT], g[group.COL_LATEST_ID]):
+                g[group.COL_LATEST_AT], g[group.COL_LATEST_ID] = m.received_at, m.id
+            g[group.COL_FIRST_AT] = min(g[group.COL_FIRST_AT], m.received_at)
+    if not acc:
+        return
+    upsert = sqlite_insert
+    if session.bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    stmt = upsert(MessageGroup).values(list(acc.values()))
+    new = stmt.excluded
+    newer = tuple_(new.latest_at, new.latest_id) > tuple_(MessageGroup.latest_at, MessageGroup.latest_id)
+    session.execute(stmt.on_conflict_do_update(
+        index_elements=[MessageGroup.kind, MessageGroup.group_key],
+        set_={
+            group.COL_COUNT: MessageGroup.count + new.count,
+            group.COL_LATEST_AT: case((newer, new.latest_at), else_=MessageGroup.latest_at),
+            group.COL_LATEST_ID: case((newer, new.latest_id), else_=MessageGroup.latest_id),
+            group.COL_FIRST_AT: case((new.first_at < MessageGroup.first_at, new.first_at),
+                                     else_=MessageGroup.first_at),
+        },
+    ))
+
+def refresh_groups(session, keys: set[tuple[str, str]]) -> None:
+    """Recount ``(kind, group_key)`` groups from the messages left in them,
+    after a delete in the caller's transaction; emptied groups go away."""
+    for kind, col in GROUP_COLUMNS.items():
+        wanted = [k for kd, k in keys if kd == kind and k]
+        if not wanted:
+            continue
+        session.execute(delete(MessageGroup).where(MessageGroup.kind == kind,
+                                                   MessageGroup.group_key.in_(wanted)))
+        newest = aliased(Message)
+        latest_id = (
+            select(newest.id).where(getattr(newest, col.key) == col)
+            .order_by(newest.received_at.desc(), newest.id.desc()).limit(1).scalar_subquery()
+        )
+        session.execute(insert(MessageGroup).from_select(
+            [group.COL_KIND, group.COL_KEY, group.COL_NAMESPACE, group.COL_COUNT,
+             group.COL_FIRST_AT, group.COL_LATEST_AT, group.COL_LATEST_ID],
+            select(literal(kind), col, func.min(Message.namespace), func.count(),
+                   func.min(Message.received_at), func.max(Message.received_at), latest_id)
+            .where(col.in_(wanted)).group_by(col),
+        ))
+
+def group_keys(rows) -> set[tuple[str, str]]:
+    """The groups that deleted rows (with thread_id and dup_key) belonged to."""
+    return {(kind, getattr(r, col.key)) for r in rows for kind, col in GROUP_COLUMNS.items()
+            if getattr(r, col.key)}
@@ -1,10 +1,18 @@
-from sqlalchemy import Column, String, Integer, DateTime, Text
+from sqlalchemy import Column, String, Integer, DateTime, Text, Index
 from datetime import datetime
 from .base import Base
 from app.constants.database import message
 
 class Message(Base):
     __tablename__ = message.TABLE_NAME
+    __table_args__ = (
+        Index(message.IX_ATTACHMENTS_RECEIVED, message.COL_HAS_ATTACHMENTS, message.COL_RECEIVED_AT),
+        # a namespaced page or drop only touches that namespace's rows
+        Index(message.IX_NAMESPACE_RECEIVED_ID, message.COL_NAMESPACE, message.COL_RECEIVED_AT, message.COL_ID),
+        # expanding a group, and recounting one after a delete
+        Index(message.IX_THREAD_RECEIVED, message.COL_THREAD_ID, message.COL_RECEIVED_AT),
+        Index(message.IX_DUP_RECEIVED, message.COL_DUP_KEY, message.COL_RECEIVED_AT),
+    )
     id = Column(String, primary_key=True)
     received_at = Column(DateTime, default=datetime.utcnow, index=True)
     from_addr = Column(String)
@@ -14,3 +22,20 @@ class Message(Base):
     size_bytes = Column(Integer)
     has_attachments = Column(Integer)
     eml_path = Column(Text)
+    namespace = Column(String)   # per-test isolation; None for un-namespaced mail
+    display_from = Column(Text)  # decoded From header
+    display_to = Column(Text)    # To/Cc addresses without display names
+    snippet = Column(Text)       # start of the text body, whitespace collapsed
+    sent_at = Column(DateTime)   # Date header, UTC
+    part_count = Column(Integer)
+    thread_id = Column(String)   # shared by a Message-ID/References chain
+    dup_key = Column(String)     # shared by resends of the same mail
+
+# Keyset pagination walks (received_at, id) newest first. Only small
+# fixed-width columns trail the key, so namespace and attachment filters are
+# checked in the index; the text of a row comes from the table, one rowid
+# lookup per row of the page.
+Index(
+    message.IX_LIST, Message.received_at.desc(), Message.id.desc(),
+    Message.namespace, Message.has_attachments, Message.size_bytes,
+)
@@ -0,0 +1,23 @@
+from sqlalchemy import Column, String, Integer, Index
+from .base import Base
+from app.constants.database import part
+
+class MessagePart(Base):
+    """One leaf MIME part. Offsets point into the uncompressed .eml, so a
+    part can be served without parsing the rest of the message."""
+    __tablename__ = part.TABLE_NAME
+    __table_args__ = (
+        Index(part.IX_MESSAGE_PART, part.COL_MESSAGE_ID, part.COL_INDEX, unique=True),
+    )
+    id = Column(Integer, primary_key=True)
+    message_id = Column(String, nullable=False)
+    part_index = Column(Integer, nullable=False)
+    content_type = Column(String, nullable=False)
+    charset = Column(String)
+    disposition = Column(String)
+    filename = Column(String)
+    encoding = Column(String, nullable=False)   # Content-Transfer-Encoding, lowercased
+    header_offset = Column(Integer, nullable=False)
+    body_offset = Column(Integer, nullable=False)
+    end_offset = Column(Integer, nullable=False)
+    size_bytes = Column(Integer)                 # decoded
@@ -0,0 +1,17 @@
+from sqlalchemy import Column, String, Integer, DateTime, Index
+from .base import Base
+from app.constants.database import recipient
+
+class Recipient(Base):
+    __tablename__ = recipient.TABLE_NAME
+    __table_args__ = (
+        # mailbox views page by (received_at, message_id) within one address
+        Index(recipient.IX_ADDRESS, recipient.COL_ADDRESS, recipient.COL_RECEIVED_AT, recipient.COL_MESSAGE_ID),
+        Index(recipient.IX_DOMAIN, recipient.COL_DOMAIN, recipient.COL_RECEIVED_AT),
+    )
+    id = Column(Integer, primary_key=True)
+    message_id = Column(String, nullable=False, index=True)
+    received_at = Column(DateTime)
+    kind = Column(String, nullable=False)
+    address = Column(String, nullable=False)   # lowercased
+    domain = Column(String, nullable=False)
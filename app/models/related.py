@@ -0,0 +1,13 @@
+from sqlalchemy import delete
+from . import fts
+from .recipient import Recipient
+from .part import MessagePart
+
+def delete_related(session, message_ids: list[str]) -> None:
+    """Remove every row that hangs off the given messages (full-text entries,
+    recipients, part index, ...) in the caller's transaction."""
+    if not message_ids:
+        return
+    fts.remove_documents(session, message_ids)
+    session.execute(delete(Recipient).where(Recipient.message_id.in_(message_ids)))
+    session.execute(delete(MessagePart).where(MessagePart.message_id.in_(message_ids)))
@@ -1,16 +1,226 @@
+import os
+from dataclasses import dataclass
 from pathlib import Path
-from sqlalchemy import create_engine
+from urllib.parse import quote
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from .base import Base
+from .fts import init_fts
+from app.constants.database import engine as defaults
 
-def get_engine(db_path: str):
+@dataclass(slots=True)
+class EngineProfile:
+    journal_mode: str = defaults.JOURNAL_MODE
+    synchronous: str = defaults.SYNCHRONOUS
+    busy_timeout_ms: int = defaults.BUSY_TIMEOUT_MS
+    mmap_size: int = defaults.MMAP_SIZE
+    cache_size_kb: int = defaults.CACHE_SIZE_KB
+    temp_store: str = defaults.TEMP_STORE
+    reader_pool_size: int = defaults.READER_POOL_SIZE
+
+    def __post_init__(self):
+        # interpolated into PRAGMA statements, and a typo there is a no-op
+        for name, allowed in (("journal_mode", defaults.JOURNAL_MODES),
+                              ("synchronous", defaults.SYNCHRONOUS_MODES),
+                              ("temp_store", defaults.TEMP_STORES)):
+            value = str(getattr(self, name)).strip().upper()
+            if value not in allowed:
+                raise ValueError(f"invalid SQLite {name} {getattr(self, name)!r}; "
+                                 f"expected one of {', '.join(sorted(allowed))}")
+            setattr(self, name, value)
+
+    @classmethod
+    def from_env(cls) -> "EngineProfile":
+        env = os.environ.get
+        return cls(
+            journal_mode=env("SQLITE_JOURNAL_MODE", defaults.JOURNAL_MODE),
+            synchronous=env("SQLITE_SYNCHRONOUS", defaults.SYNCHRONOUS),
+            busy_timeout_ms=int(env("SQLITE_BUSY_TIMEOUT_MS", defaults.BUSY_TIMEOUT_MS)),
+            mmap_size=int(env("SQLITE_MMAP_SIZE", defaults.MMAP_SIZE)),
+            cache_size_kb=int(env("SQLITE_CACHE_SIZE_KB", defaults.CACHE_SIZE_KB)),
+            temp_store=env("SQLITE_TEMP_STORE", defaults.TEMP_STORE),
+            reader_pool_size=int(env("DB_READER_POOL_SIZE", defaults.READER_POOL_SIZE)),
+        )
+
+def is_url(target: str) -> bool:
+    return "://" in target
+
+def _apply_pragmas(engine, profile: EngineProfile, readonly: bool) -> None:
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        if not readonly:
+            # persistent in the file; readers pick it up automatically
+            cur.execute(f"PRAGMA journal_mode = {profile.journal_mode}")
+        cur.execute(f"PRAGMA busy_timeout = {int(profile.busy_timeout_ms)}")
+        cur.execute(f"PRAGMA synchronous = {profile.synchronous}")
+        cur.execute(f"PRAGMA mmap_size = {int(profile.mmap_size)}")
+        cur.execute(f"PRAGMA cache_size = -{int(profile.cache_size_kb)}")
+        cur.execute(f"PRAGMA temp_store = {profile.temp_store}")
+        if readonly:
+            cur.execute("PRAGMA query_only = 1")
+        cur.close()
+
+def _sqlite_url(db_path: str, readonly: bool, driver: str = "sqlite") -> str:
+    if readonly:
+        return f"{driver}:///file:{quote(str(Path(db_path).resolve()))}?mode=ro&uri=true"
+    return f"{driver}:///{db_path}"
+
+def get_engine(db_path: str, readonly: bool = False, profile: EngineProfile | None = None):
+    """Engine for a SQLite file path or any SQLAlchemy URL (e.g. PostgreSQL).
+
+    SQLite writers get a single pooled connection; readonly engines open the
+    file with ``mode=ro`` and a larger pool, so readers never contend with
+    the writer for the pool and WAL lets them run alongside it.
+    """
+    profile = profile or EngineProfile.from_env()
+    if is_url(db_path):
+        engine = create_engine(db_path, future=True, pool_pre_ping=True)
+        if readonly and engine.dialect.name == "postgresql":
+            engine = engine.execution_options(postgresql_readonly=True)
+        return engine
+
+    path = Path(db_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    connect_args = {"timeout": profile.busy_timeout_ms / 1000, "check_same_thread": False}
+    pool_size = profile.reader_pool_size if readonly else defaults.WRITER_POOL_SIZE
+    engine = create_engine(
+        _sqlite_url(db_path, readonly), future=True, connect_args=connect_args,
+        pool_size=pool_size, max_overflow=0, pool_timeout=defaults.POOL_TIMEOUT,
+    )
+    _apply_pragmas(engine, profile, readonly)
+    return engine
+
+def _add_missing_columns(engine) -> None:
+    """create_all does not alter existing tables: add nullable columns that
+    were introduced after a database was created."""
+    with engine.begin() as conn:
+        insp = inspect(conn)
+        for table in Base.metadata.sorted_tables:
+            if not insp.has_table(table.name):
+                continue
+            have = {c["name"] for c in insp.get_columns(table.name)}
+            for col in table.columns:
+                if col.name not in have and col.nullable:
+                    kind = col.type.compile(dialect=engine.dialect)
+                    conn.exec_driver_sql(f'ALTER TABLE "{table.name}" ADD COLUMN "{col.name}" {kind}')
+
+def _aiosqlite_connector(db_path: str, readonly: bool, timeout: float):
+    import aiosqlite
+    target = _sqlite_url(db_path, readonly).removeprefix("sqlite:///")
+
+    async def connect():
+        conn = aiosqlite.connect(target, timeout=timeout, uri=readonly, check_same_thread=False)
+        # each connection owns a worker thread; pooled ones live until the
+        # engine is disposed, and must not keep the interpreter from exiting
+        getattr(conn, "_thread", conn).daemon = True
+        return await conn
+    return connect
+
+def get_async_engine(db_path: str, readonly: bool = False, profile: EngineProfile | None = None):
+    """asyncio counterpart of get_engine (aiosqlite for SQLite files): the
+    same pool sizes and pragmas, but queries await instead of holding a
+    thread. URLs must name an async driver, e.g. postgresql+asyncpg://."""
+    profile = profile or EngineProfile.from_env()
+    if is_url(db_path):
+        return create_async_engine(db_path, pool_pre_ping=True)
     Path(db_path).parent.mkdir(parents=True, exist_ok=True)
-    return create_engine(f"sqlite:///{db_path}", future=True)
+    engine = create_async_engine(
+        _sqlite_url(db_path, readonly, defaults.ASYNC_DRIVER),
+        async_creator=_aiosqlite_connector(db_path, readonly, profile.busy_timeout_ms / 1000),
+        # the aiosqlite dialect defaults to NullPool: a thread per connect
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=profile.reader_pool_size if readonly else defaults.WRITER_POOL_SIZE,
+        max_overflow=0, pool_timeout=defaults.POOL_TIMEOUT,
+    )
+    _apply_pragmas(engine.sync_engine, profile, readonly)
+    return engine
+
+def schema_version(engine) -> int | None:
+    """The version stamped by init_db, 0 for a database it has not
+    finished, None where the backend has nowhere to keep it."""
+    if engine.dialect.name != "sqlite":
+        return None
+    with engine.connect() as conn:
+        return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+def _set_aside_rebuilt(conn, found: int | None) -> list[str]:
+    """Rename the tables REBUILT_TABLES lists since version ``found`` to
+    ``<name>_old``, dropping their indexes so create_all can reuse the names."""
+    if found is None:
+        return []
+    existing = set(inspect(conn).get_table_names())
+    rebuilt = [name for version, names in defaults.REBUILT_TABLES.items() if version > found
+               for name in names if name in existing]
+    for name in dict.fromkeys(rebuilt):
+        indexes = conn.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+            (name,),
+        ).scalars().all()
+        for ix in indexes:
+            conn.exec_driver_sql(f'DROP INDEX "{ix}"')
+        conn.exec_driver_sql(f'ALTER TABLE "{name}" RENAME TO "{name}_old"')
+    return list(dict.fromkeys(rebuilt))
 
 def init_db(engine):
-    Base.metadata.create_all(engine)
+    """Create missing tables, columns and indexes. A SQLite file stamped
+    with the current SCHEMA_VERSION is left alone, so a normal start costs
+    one PRAGMA read instead of inspecting every table."""
+    found = schema_version(engine)
+    if found == defaults.SCHEMA_VERSION:
+        return
+    if found is not None and found > defaults.SCHEMA_VERSION:
+        raise RuntimeError(f"database schema version {found} is newer than this build "
+                           f"({defaults.SCHEMA_VERSION}); upgrade mailgate")
+    with engine.begin() as conn:
+        if engine.dialect.name == "sqlite" and not inspect(conn).get_table_names():
+            # only settable before the first table exists; lets retention
+            # hand freed pages back with incremental_vacuum instead of VACUUM
+            conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+        rebuilt = _set_aside_rebuilt(conn, found)
+        Base.metadata.create_all(conn)
+        for name in rebuilt:
+            cols = ", ".join(f'"{c.name}"' for c in Base.metadata.tables[name].columns)
+            conn.exec_driver_sql(f'INSERT INTO "{name}" ({cols}) SELECT {cols} FROM "{name}_old"')
+            conn.exec_driver_sql(f'DROP TABLE "{name}_old"')
+    _add_missing_columns(engine)
+    if found is not None:
+        with engine.begin() as conn:
+            for version, names in defaults.DROPPED_INDEXES.items():
+                if version > found:
+                    for name in names:
+                        conn.exec_driver_sql(f'DROP INDEX IF EXISTS "{name}"')
+    # create_all skips tables that already exist, so indexes added to an
+    # existing table have to be created separately
+    for table in Base.metadata.sorted_tables:
+        for ix in table.indexes:
+            ix.create(engine, checkfirst=True)
+    init_fts(engine)
+    if found is not None:
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f"PRAGMA user_version = {defaults.SCHEMA_VERSION}")
+
+def get_session_factory(db_path: str, readonly: bool = False,
+                        profile: EngineProfile | None = None, init: bool = True) -> sessionmaker:
+    """Pass ``init=False`` when another factory for the same database has
+    already created the schema (e.g. a reader next to its writer)."""
+    if readonly:
+        if init:
+            # the schema has to exist before a read-only connection can open it
+            writer = get_engine(db_path, profile=profile)
+            init_db(writer)
+            writer.dispose()
+        engine = get_engine(db_path, readonly=True, profile=profile)
+    else:
+        engine = get_engine(db_path, profile=profile)
+        if init:
+            init_db(engine)
+    return sessionmaker(bind=engine, expire_on_commit=False)
 
-def get_session_factory(db_path: str) -> sessionmaker:
-    engine = get_engine(db_path)
-    init_db(engine)
-    return sessionmaker(bind=engine, expire_on_commit=False)
\ No newline at end of file
+def get_async_session_factory(db_path: str, readonly: bool = False,
+                              profile: EngineProfile | None = None) -> async_sessionmaker:
+    """AsyncSession factory; the schema must already exist (create it with
+    get_session_factory first)."""
+    return async_sessionmaker(get_async_engine(db_path, readonly, profile), expire_on_commit=False)
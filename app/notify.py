@@ -0,0 +1,285 @@
+from __future__ import annotations
+import asyncio, logging, socket, threading
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
+from app.models import FtsDoc, Message, Recipient
+from app.models.fts import fts_available
+from app.utils.utils import dumps, loads, normalize_address, normalize_namespace
+from app.constants import notify
+
+log = logging.getLogger(__name__)
+
+def message_event(m, recipients: list[str] | None = None) -> dict:
+    """Notification payload for a stored message (ORM object or column row).
+
+    ``recipients`` are its message_recipients addresses (envelope plus
+    header To/Cc/Bcc); without them only the envelope list is matched.
+    """
+    to = loads(m.to_addrs or "[]")
+    if recipients is None:
+        recipients = [normalize_address(a)[0] for a in to]
+    return {
+        "id": m.id,
+        "received_at": m.received_at.isoformat() if m.received_at else None,
+        "from": m.from_addr or "",
+        "to": to[:notify.MAX_EVENT_RCPTS],
+        "recipients": list(dict.fromkeys(recipients))[:notify.MAX_EVENT_RCPTS],
+        "subject": (m.subject or "")[:notify.MAX_EVENT_SUBJECT],
+        "message_id": m.message_id or "",
+        "size": m.size_bytes or 0,
+        "has_attachments": bool(m.has_attachments),
+        "namespace": m.namespace,
+    }
+
+def _norm_message_id(v: str | None) -> str:
+    return (v or "").strip().strip("<>").lower()
+
+def _event_recipients(ev: dict) -> list[str]:
+    # events from an older publisher carry only the envelope list
+    if "recipients" in ev:
+        return ev["recipients"]
+    return [normalize_address(a)[0] for a in ev.get("to", ())]
+
+class Subscription:
+    def __init__(self, bus: MessageBus, *, to: str | None = None, from_addr: str | None = None,
+                 subject: str | None = None, message_id: str | None = None,
+                 namespace: str | None = None):
+        self.bus = bus
+        self.namespace = normalize_namespace(namespace)
+        # the same three forms as storage.recipient_condition: a mailbox,
+        # an @domain, or else a substring of the envelope list
+        self.rcpt = self.domain = self.to = None
+        if to:
+            address, domain = normalize_address(to)
+            if address.startswith("@"):
+                self.domain = domain
+            elif "@" in address and domain:
+                self.rcpt = address
+            else:
+                self.to = to.lower()
+        self.from_addr = from_addr.lower() if from_addr else None
+        self.subject = subject.lower() if subject else None
+        self.message_id = _norm_message_id(message_id) or None
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(notify.SUBSCRIBER_QUEUE)
+
+    def matches(self, ev: dict) -> bool:
+        if self.namespace and self.namespace != ev.get("namespace"):
+            return False
+        if self.rcpt and self.rcpt not in _event_recipients(ev):
+            return False
+        if self.domain and not any(r.rpartition("@")[2] == self.domain for r in _event_recipients(ev)):
+            return False
+        if self.to and not any(self.to in r.lower() for r in ev.get("to", ())):
+            return False
+        if self.from_addr and self.from_addr not in ev.get("from", "").lower():
+            return False
+        if self.subject and self.subject not in ev.get("subject", "").lower():
+            return False
+        if self.message_id and self.message_id != _norm_message_id(ev.get("message_id")):
+            return False
+        return True
+
+    def _deliver(self, ev: dict) -> None:
+        try:
+            self.queue.put_nowait(ev)
+        except asyncio.QueueFull:
+            log.warning("dropping notification for slow subscriber")
+
+    async def get(self) -> dict:
+        return await self.queue.get()
+
+    def close(self) -> None:
+        self.bus._remove(self)
+
+    def __enter__(self) -> Subscription:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+class MessageBus:
+    """In-process fan-out of newly committed messages to waiting requests.
+
+    Subscribers that name a recipient or domain (or else a namespace) are
+    indexed by it, so a publish only evaluates the waiters it could
+    possibly satisfy.
+    publish() is thread-safe and hands events to each subscriber's own
+    event loop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_rcpt: dict[str, set[Subscription]] = {}
+        self._by_domain: dict[str, set[Subscription]] = {}
+        self._by_ns: dict[str, set[Subscription]] = {}
+        self._any: set[Subscription] = set()
+
+    @property
+    def subscribers(self) -> int:
+        with self._lock:
+            return len(self._any) + sum(len(v) for index in (self._by_rcpt, self._by_domain, self._by_ns)
+                                        for v in index.values())
+
+    def _index(self, sub: Subscription) -> tuple[dict | None, str | None]:
+        if sub.rcpt:
+            return self._by_rcpt, sub.rcpt
+        if sub.domain:
+            return self._by_domain, sub.domain
+        if sub.namespace:
+            return self._by_ns, sub.namespace
+        return None, None
+
+    def subscribe(self, **predicate) -> Subscription:
+        sub = Subscription(self, **predicate)
+        index, key = self._index(sub)
+        with self._lock:
+            if index is not None:
+                index.setdefault(key, set()).add(sub)
+            else:
+                self._any.add(sub)
+        return sub
+
+    def _remove(self, sub: Subscription) -> None:
+        index, key = self._index(sub)
+        with self._lock:
+            if index is not None:
+                subs = index.get(key)
+                if subs is not None:
+                    subs.discard(sub)
+                    if not subs:
+                        del index[key]
+            else:
+                self._any.discard(sub)
+
+    def publish(self, events: list[dict]) -> None:
+        for ev in events:
+            with self._lock:
+                candidates = set(self._any)
+                for rcpt in _event_recipients(ev):
+                    candidates.update(self._by_rcpt.get(rcpt, ()))
+                    candidates.update(self._by_domain.get(rcpt.rpartition("@")[2], ()))
+                if ev.get("namespace"):
+                    candidates.update(self._by_ns.get(ev["namespace"], ()))
+            for sub in candidates:
+                if sub.matches(ev):
+                    try:
+                        sub.loop.call_soon_threadsafe(sub._deliver, ev)
+                    except RuntimeError:  # subscriber's loop already closed
+                        sub.close()
+
+bus = MessageBus()
+
+def _parse_addr(addr: str) -> tuple[str, int]:
+    host, _, port = addr.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+class UdpPublisher:
+    """Forwards events as datagrams to API processes listening on ``addrs``."""
+
+    def __init__(self, addrs: str):
+        self.addrs = [_parse_addr(a.strip()) for a in addrs.split(",") if a.strip()]
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+
+    def __call__(self, events: list[dict]) -> None:
+        for ev in events:
+            data = dumps(ev)
+            for addr in self.addrs:
+                try:
+                    self.sock.sendto(data, addr)
+                except OSError:
+                    pass  # nobody listening, or the socket buffer is full
+
+class _UdpReceiver(asyncio.DatagramProtocol):
+    def __init__(self, target: MessageBus):
+        self.target = target
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        try:
+            self.target.publish([loads(data)])
+        except ValueError:
+            log.warning("ignoring malformed notification from %s", addr)
+
+class DbTail:
+    """Cross-process fallback: reads rows committed since the last poll, but
+    only while the bus has subscribers, so an idle API issues no queries.
+
+    Rows are tailed by messages_fts_docs.id, which the single writer hands
+    out in commit order and never reuses, so a batch that commits long
+    after its received_at is still read. Coming back from idle there is no
+    mark yet: the first poll takes the newest id and announces only mail
+    received within ``overlap`` seconds of the first subscriber.
+    """
+
+    def __init__(self, target: MessageBus, session_factory, *,
+                 interval: float = notify.POLL_INTERVAL, overlap: float = notify.POLL_OVERLAP):
+        self.target = target
+        self.Session = session_factory
+        self.interval = interval
+        self.overlap = timedelta(seconds=overlap)
+
+    def _fetch(self, after: int | None, since: datetime | None):
+        """Rows past the ``after`` mark, or, without one, those received
+        from ``since`` up to the newest id; returns (rows, recipients, mark)."""
+        with self.Session() as s:
+            stmt = (
+                select(FtsDoc.id.label("seq"), Message.id, Message.received_at, Message.from_addr,
+                       Message.to_addrs, Message.subject, Message.message_id, Message.size_bytes,
+                       Message.has_attachments, Message.namespace)
+                .join(Message, Message.id == FtsDoc.message_id)
+                .order_by(FtsDoc.id)
+            )
+            if after is None:
+                # read the top first: anything committed after it waits for the next poll
+                after = s.scalar(select(func.max(FtsDoc.id))) or 0
+                rows = s.execute(stmt.where(FtsDoc.id <= after, Message.received_at >= since)).all()
+            else:
+                rows = s.execute(stmt.where(FtsDoc.id > after)).all()
+                if rows:
+                    after = rows[-1].seq
+            # rows stored before message_recipients existed have none and
+            # fall back to the envelope list
+            recipients: dict[str, list[str]] = {}
+            if rows:
+                for mid, address in s.execute(
+                    select(Recipient.message_id, Recipient.address)
+                    .where(Recipient.message_id.in_([r.id for r in rows])).order_by(Recipient.id)
+                ):
+                    recipients.setdefault(mid, []).append(address)
+            return rows, recipients, after
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        mark: int | None = None
+        since: datetime | None = None
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self.target.subscribers:
+                mark = since = None
+                continue
+            if mark is None and since is None:
+                since = datetime.utcnow() - timedelta(seconds=self.interval) - self.overlap
+            try:
+                rows, recipients, mark = await loop.run_in_executor(None, self._fetch, mark, since)
+            except Exception:
+                log.exception("notification poll failed")
+                continue
+            if rows:
+                self.target.publish([message_event(r, recipients.get(r.id)) for r in rows])
+
+async def start_feed(mode: str, target: MessageBus, *, addr: str | None = None, session_factory=None):
+    """Start feeding ``target`` from another process; returns a stop callable."""
+    if mode == notify.MODE_UDP:
+        transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: _UdpReceiver(target), local_addr=_parse_addr(addr)
+        )
+        return transport.close
+    if mode == notify.MODE_POLL:
+        if not fts_available(session_factory.kw["bind"]):
+            raise ValueError("poll notifications tail the SQLite full-text index; use udp on this backend")
+        task = asyncio.create_task(DbTail(target, session_factory).run())
+        return task.cancel
+    if mode == notify.MODE_LOCAL:
+        return lambda: None
+    raise ValueError(f"unknown notify mode: {mode!r}")
@@ -0,0 +1,42 @@
+from __future__ import annotations
+import argparse, time
+from app.storage import Store
+
+def main(argv: list[str] | None = None, prog: str | None = None):
+    ap = argparse.ArgumentParser(prog=prog, description="Back-fill the full-text index, recipients table, MIME part "
+                                                        "index, list display columns and thread/duplicate groups")
+    ap.add_argument("--db", default="./localdata/messages.db")
+    ap.add_argument("--store-dir", default="./localdata")
+    ap.add_argument("--batch-size", type=int, default=500)
+    ap.add_argument("--rebuild", action="store_true", help="drop and re-create every full-text entry")
+    ap.add_argument("--skip-fts", action="store_true")
+    ap.add_argument("--skip-recipients", action="store_true")
+    ap.add_argument("--skip-parts", action="store_true")
+    ap.add_argument("--skip-summaries", action="store_true")
+    ap.add_argument("--skip-groups", action="store_true")
+    args = ap.parse_args(argv)
+
+    store = Store(args.db, args.store_dir)
+    if not args.skip_recipients:
+        started = time.perf_counter()
+        n = store.backfill_recipients(batch_size=args.batch_size)
+        print(f"recipients for {n} messages in {time.perf_counter() - started:.1f}s")
+    if not args.skip_parts:
+        started = time.perf_counter()
+        n = store.backfill_parts(batch_size=args.batch_size)
+        print(f"part index for {n} messages in {time.perf_counter() - started:.1f}s")
+    if not args.skip_summaries:
+        started = time.perf_counter()
+        n = store.backfill_summaries(batch_size=args.batch_size)
+        print(f"display columns for {n} messages in {time.perf_counter() - started:.1f}s")
+    if not args.skip_groups:
+        started = time.perf_counter()
+        n = store.backfill_groups(batch_size=args.batch_size)
+        print(f"grouped {n} messages in {time.perf_counter() - started:.1f}s")
+    if not args.skip_fts:
+        started = time.perf_counter()
+        n = store.reindex(batch_size=args.batch_size, rebuild=args.rebuild)
+        print(f"indexed {n} messages in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
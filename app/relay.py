@@ -0,0 +1,272 @@
+"""Re-deliver captured mail to another SMTP server.
+
+Envelopes come from the ingest log (an offset range, in the order they were
+received) or from the store (any /messages filter, oldest first). A reader
+thread feeds them to a pool of persistent aiosmtplib connections, each
+sending one transaction after another on its session; an optional token
+bucket caps the overall rate.
+
+    mailgate replay --target 127.0.0.1:2525 --log ./localdata/ingest-log --start 1000
+    mailgate replay --target mx.staging:25 --namespace run-42 --rate 50
+"""
+from __future__ import annotations
+import argparse, asyncio, concurrent.futures, json, logging, threading, time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Iterable
+import aiosmtplib
+from app.constants import relay
+
+log = logging.getLogger(__name__)
+
+Envelope = tuple[str, list[str], bytes]   # (mail_from, rcpt_tos, raw message)
+
+
+def log_envelopes(directory: str, start: int = 0, stop: int | None = None) -> Iterable[Envelope]:
+    from app.ingest_log import read_log
+    for r in read_log(directory, start, stop):
+        yield r.mail_from, r.rcpt_tos, r.data
+
+def store_envelopes(session_factory, conds: list) -> Iterable[Envelope]:
+    from app.archive import iter_rows
+    from app.blobs import read_eml
+    for row in iter_rows(session_factory, conds):
+        try:
+            data = read_eml(row.eml_path)
+        except (OSError, TypeError):
+            log.warning("skipping %s: .eml missing", row.id)
+            continue
+        yield row.from_addr or "", json.loads(row.to_addrs or "[]"), data
+
+
+class RateLimiter:
+    """Token bucket shared by the connections of one relay."""
+
+    def __init__(self, rate: float, burst: float | None = None):
+        self.rate = rate
+        self.capacity = max(1.0, burst if burst is not None else rate * relay.RATE_BURST)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def take(self) -> None:
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+@dataclass
+class RelayStats:
+    sent: int = 0
+    failed: int = 0
+    retried: int = 0
+    bytes: int = 0
+    elapsed: float = 0.0
+    errors: dict[str, int] = field(default_factory=dict)
+
+    def error(self, reason: str) -> None:
+        self.failed += 1
+        self.errors[reason] = self.errors.get(reason, 0) + 1
+
+    def as_dict(self) -> dict:
+        return {
+            "sent": self.sent, "failed": self.failed, "retried": self.retried, "bytes": self.bytes,
+            "elapsed_s": round(self.elapsed, 3),
+            "msgs_per_s": round(self.sent / self.elapsed, 1) if self.elapsed else 0.0,
+            "errors": dict(self.errors),
+        }
+
+
+class Relay:
+    """Sends envelopes to ``host:port`` over ``connections`` reused SMTP
+    sessions. A 4xx reply or a dropped connection is retried (on a fresh
+    connection for the latter); a 5xx reply fails that message only.
+    ``mail_from`` / ``rcpt_to`` replace the captured envelope, e.g. to
+    point a replay at one test mailbox. With several connections messages
+    arrive out of order; one connection keeps the source order."""
+
+    def __init__(self, host: str, port: int, *, connections: int = relay.DEFAULT_CONNECTIONS,
+                 rate: float = 0.0, timeout: float = relay.DEFAULT_TIMEOUT,
+                 retries: int = relay.DEFAULT_RETRIES, mail_from: str | None = None,
+                 rcpt_to: list[str] | None = None):
+        self.host = host
+        self.port = port
+        self.connections = max(1, connections)
+        self.limiter = RateLimiter(rate) if rate > 0 else None
+        self.timeout = timeout
+        self.retries = max(0, retries)
+        self.mail_from = mail_from
+        self.rcpt_to = list(rcpt_to or [])
+        self.stats = RelayStats()
+
+    def run(self, envelopes: Iterable[Envelope]) -> RelayStats:
+        return asyncio.run(self.relay(envelopes))
+
+    async def relay(self, envelopes: Iterable[Envelope]) -> RelayStats:
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.connections * relay.FEED_DEPTH)
+        stop = threading.Event()
+        self._feed_error = None
+        reader = threading.Thread(target=self._feed, args=(envelopes, queue, loop, stop),
+                                  name="relay-reader", daemon=True)
+        started = time.perf_counter()
+        reader.start()
+        try:
+            await asyncio.gather(*(self._connection(queue) for _ in range(self.connections)))
+        finally:
+            stop.set()
+            self.stats.elapsed = time.perf_counter() - started
+        await asyncio.to_thread(reader.join)
+        if self._feed_error is not None:
+            raise self._feed_error
+        return self.stats
+
+    def _feed(self, envelopes, queue: asyncio.Queue, loop, stop: threading.Event) -> None:
+        """Reader thread: hands envelopes over in chunks, then one end
+        marker per connection. Gives up once the connections are gone."""
+        def put(item) -> bool:
+            fut = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            while True:
+                try:
+                    fut.result(timeout=0.1)
+                    return True
+                except concurrent.futures.TimeoutError:
+                    if stop.is_set():
+                        fut.cancel()
+                        return False
+        chunk = []
+        try:
+            for env in envelopes:
+                chunk.append(env)
+                if len(chunk) >= relay.FEED_CHUNK:
+                    if not put(chunk):
+                        return
+                    chunk = []
+            if chunk and not put(chunk):
+                return
+        except Exception as e:
+            self._feed_error = e
+        for _ in range(self.connections):
+            if not put(None):
+                return
+
+    async def _connection(self, queue: asyncio.Queue) -> None:
+        smtp = None
+        try:
+            while (chunk := await queue.get()) is not None:
+                for mail_from, rcpt_tos, data in chunk:
+                    smtp = await self._send(smtp, self.mail_from if self.mail_from is not None else mail_from,
+                                            self.rcpt_to or rcpt_tos, data)
+        finally:
+            if smtp is not None:
+                try:
+                    await smtp.quit()
+                except (aiosmtplib.SMTPException, OSError):
+                    smtp.close()
+
+    async def _send(self, smtp, mail_from: str, rcpt_tos: list[str], data: bytes):
+        """One message, with retries; returns the connection to reuse."""
+        if not rcpt_tos:
+            self.stats.error(relay.ERROR_NO_RECIPIENTS)
+            return smtp
+        for attempt in range(self.retries + 1):
+            if self.limiter is not None:
+                await self.limiter.take()
+            try:
+                if smtp is None:
+                    smtp = aiosmtplib.SMTP(hostname=self.host, port=self.port, timeout=self.timeout,
+                                           start_tls=False)
+                    await smtp.connect()
+                refused, _ = await smtp.sendmail(mail_from, rcpt_tos, data)
+            except aiosmtplib.SMTPRecipientsRefused:
+                self.stats.error(relay.ERROR_REFUSED)
+                return await self._reset(smtp)
+            except aiosmtplib.SMTPResponseException as e:
+                smtp = await self._reset(smtp)
+                if e.code < 500 and attempt < self.retries:
+                    self.stats.retried += 1
+                    await asyncio.sleep(relay.RETRY_DELAY * (attempt + 1))
+                    continue
+                self.stats.error(str(e.code))
+                return smtp
+            except (aiosmtplib.SMTPException, OSError):
+                if smtp is not None:
+                    smtp.close()
+                smtp = None
+                if attempt < self.retries:
+                    self.stats.retried += 1
+                    await asyncio.sleep(relay.RETRY_DELAY * (attempt + 1))
+                    continue
+                self.stats.error(relay.ERROR_DISCONNECTED)
+                return None
+            if refused:
+                # accepted for some recipients only: counted as sent
+                log.warning("%d of %d recipients refused", len(refused), len(rcpt_tos))
+            self.stats.sent += 1
+            self.stats.bytes += len(data)
+            return smtp
+        return smtp
+
+    async def _reset(self, smtp):
+        """RSET after a failed transaction; a connection that cannot take
+        it is dropped."""
+        try:
+            await smtp.rset()
+            return smtp
+        except (aiosmtplib.SMTPException, OSError):
+            smtp.close()
+            return None
+
+
+def main(argv: list[str] | None = None, prog: str | None = None):
+    ap = argparse.ArgumentParser(prog=prog, description="Re-deliver captured mail to another SMTP server, "
+                                                        "from the ingest log or from the store")
+    ap.add_argument("--target", required=True, help="host:port to deliver to")
+    ap.add_argument("--log", default=None, help="ingest log directory (default: read the store)")
+    ap.add_argument("--start", type=int, default=0, help="first log offset")
+    ap.add_argument("--stop", type=int, default=None, help="log offset to stop before")
+    ap.add_argument("--db", default="./localdata/messages.db")
+    ap.add_argument("--q", default=None, help="substring of subject, sender or recipients")
+    ap.add_argument("--subject", default=None)
+    ap.add_argument("--from", dest="from_addr", default=None)
+    ap.add_argument("--to", dest="to_addr", default=None, help="mailbox, or @domain")
+    ap.add_argument("--since", type=datetime.fromisoformat, default=None)
+    ap.add_argument("--until", type=datetime.fromisoformat, default=None)
+    ap.add_argument("--older-than", default=None, help="e.g. 7d, 12h")
+    ap.add_argument("--namespace", default=None)
+    ap.add_argument("--thread", dest="thread_id", default=None)
+    ap.add_argument("--connections", type=int, default=relay.DEFAULT_CONNECTIONS,
+                    help="SMTP sessions kept open; 1 preserves the source order")
+    ap.add_argument("--rate", type=float, default=0.0, help="max messages per second (0: unlimited)")
+    ap.add_argument("--timeout", type=float, default=relay.DEFAULT_TIMEOUT)
+    ap.add_argument("--retries", type=int, default=relay.DEFAULT_RETRIES)
+    ap.add_argument("--mail-from", default=None, help="replace the envelope sender")
+    ap.add_argument("--rcpt-to", action="append", default=None, help="replace the envelope recipients (repeatable)")
+    args = ap.parse_args(argv)
+    host, sep, port = args.target.rpartition(":")
+    if not sep or not port.isdigit():
+        ap.error("--target must be host:port")
+
+    if args.log:
+        envelopes = log_envelopes(args.log, args.start, args.stop)
+    else:
+        from app.models import Message, get_session_factory
+        from app.storage import message_filters
+        from app.utils.utils import parse_age
+        conds = message_filters(args.q, subject=args.subject, from_addr=args.from_addr, to_addr=args.to_addr,
+                                since=args.since, until=args.until, namespace=args.namespace,
+                                thread_id=args.thread_id)
+        if args.older_than:
+            conds.append(Message.received_at < datetime.utcnow() - parse_age(args.older_than))
+        envelopes = store_envelopes(get_session_factory(args.db, readonly=True, init=False), conds)
+    stats = Relay(host or "127.0.0.1", int(port), connections=args.connections, rate=args.rate,
+                  timeout=args.timeout, retries=args.retries, mail_from=args.mail_from,
+                  rcpt_to=args.rcpt_to).run(envelopes)
+    print(json.dumps(stats.as_dict()))
+
+if __name__ == "__main__":
+    main()
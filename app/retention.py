@@ -0,0 +1,213 @@
+from __future__ import annotations
+import argparse, json, logging, os, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete, func, tuple_
+from app.blobs import release_blobs, unlink_released
+from app.models import Message, Recipient, delete_related, get_session_factory, group_keys, refresh_groups
+from app.utils.utils import parse_age
+from app.constants import retention
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class RetentionPolicy:
+    recipient: str | None = None   # "user@example.com", "@example.com" or None for everything
+    max_age: timedelta | None = None
+    max_count: int | None = None
+    max_bytes: int | None = None
+
+    @classmethod
+    def from_dict(cls, d: dict) -> RetentionPolicy:
+        return cls(
+            recipient=d.get("recipient"),
+            max_age=parse_age(str(d["max_age"])) if d.get("max_age") else None,
+            max_count=d.get("max_count"),
+            max_bytes=d.get("max_bytes"),
+        )
+
+
+def load_policies(path: str | None = None, retention_days: str | None = None) -> list[RetentionPolicy]:
+    """Policies from a JSON list file, plus a global age limit from RETENTION_DAYS."""
+    policies = []
+    if path:
+        with open(path, encoding="utf-8") as f:
+            policies = [RetentionPolicy.from_dict(d) for d in json.load(f)]
+    if retention_days:
+        policies.append(RetentionPolicy(max_age=timedelta(days=float(retention_days))))
+    return policies
+
+
+def recipient_filter(recipient: str | None) -> list:
+    """``user@example.com`` matches that mailbox, ``@example.com`` the domain."""
+    if not recipient:
+        return []
+    r = recipient.strip().lower()
+    col = Recipient.domain if r.startswith("@") else Recipient.address
+    return [Message.id.in_(select(Recipient.message_id).where(col == r.lstrip("@")))]
+
+
+class Purger:
+    """Deletes matching messages oldest-first in short chunked transactions
+    (``DELETE ... RETURNING``) and unlinks their files in parallel after each
+    chunk commits, so ingestion only ever waits on one small chunk."""
+
+    def __init__(self, session_factory, cache=None, *,
+                 chunk_size: int = retention.CHUNK_SIZE, unlink_workers: int = retention.UNLINK_WORKERS):
+        self.Session = session_factory
+        self.cache = cache
+        self.chunk_size = chunk_size
+        self.unlink_workers = unlink_workers
+
+    def purge(self, conds: list) -> tuple[int, int]:
+        deleted = freed = 0
+        with ThreadPoolExecutor(self.unlink_workers, thread_name_prefix="purge-unlink") as pool:
+            while True:
+                chunk = (
+                    select(Message.id).where(*conds)
+                    .order_by(Message.received_at, Message.id).limit(self.chunk_size)
+                    .scalar_subquery()
+                )
+                with self.Session() as s:
+                    rows = s.execute(
+                        delete(Message).where(Message.id.in_(chunk))
+                        .returning(Message.id, Message.eml_path, Message.size_bytes,
+                                   Message.thread_id, Message.dup_key)
+                    ).all()
+                    if not rows:
+                        return deleted, freed
+                    ids = [r.id for r in rows]
+                    delete_related(s, ids)
+                    unlink = release_blobs(s, [r.eml_path for r in rows])
+                    refresh_groups(s, group_keys(rows))
+                    s.commit()
+                unlink_released(self.Session, unlink, pool)
+                if self.cache is not None:
+                    self.cache.invalidate(*ids)
+                deleted += len(rows)
+                freed += sum(r.size_bytes or 0 for r in rows)
+
+    def _cutoff(self, conds: list, max_count: int | None, max_bytes: int | None):
+        """(received_at, id) of the newest message that falls outside a
+        count or byte quota, or None when the quota is not exceeded."""
+        order = (Message.received_at.desc(), Message.id.desc())
+        with self.Session() as s:
+            if max_count is not None:
+                row = s.execute(
+                    select(Message.received_at, Message.id).where(*conds)
+                    .order_by(*order).offset(max_count).limit(1)
+                ).first()
+            else:
+                running = (
+                    select(Message.received_at, Message.id,
+                           func.sum(Message.size_bytes).over(order_by=order).label("total"))
+                    .where(*conds).subquery()
+                )
+                row = s.execute(
+                    select(running.c.received_at, running.c.id)
+                    .where(running.c.total > max_bytes)
+                    .order_by(running.c.received_at.desc(), running.c.id.desc()).limit(1)
+                ).first()
+        return tuple(row) if row else None
+
+    def apply(self, policy: RetentionPolicy, now: datetime | None = None) -> tuple[int, int]:
+        base = recipient_filter(policy.recipient)
+        deleted = freed = 0
+        if policy.max_age is not None:
+            n, b = self.purge(base + [Message.received_at < (now or datetime.utcnow()) - policy.max_age])
+            deleted, freed = deleted + n, freed + b
+        for quota in ({"max_count": policy.max_count, "max_bytes": None},
+                      {"max_count": None, "max_bytes": policy.max_bytes}):
+            if quota["max_count"] is None and quota["max_bytes"] is None:
+                continue
+            cutoff = self._cutoff(base, **quota)
+            if cutoff:
+                n, b = self.purge(base + [tuple_(Message.received_at, Message.id) <= tuple_(*cutoff)])
+                deleted, freed = deleted + n, freed + b
+        return deleted, freed
+
+
+def incremental_vacuum(session_factory, *, pages: int = retention.VACUUM_PAGES,
+                       steps: int = retention.VACUUM_STEPS, pause: float = retention.VACUUM_PAUSE) -> int:
+    """Return free pages to the filesystem a slice at a time; each slice is
+    a short write transaction so the ingest committer interleaves."""
+    engine = session_factory.kw["bind"]
+    if engine.dialect.name != "sqlite":
+        return 0
+    released = 0
+    raw = engine.raw_connection()
+    try:
+        conn = raw.driver_connection
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return 0
+        for _ in range(steps):
+            free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if not free:
+                break
+            # executescript steps the pragma to completion; execute() would
+            # release a single page
+            conn.executescript(f"PRAGMA incremental_vacuum({min(pages, free)})")
+            released += min(pages, free)
+            time.sleep(pause)
+    finally:
+        raw.close()
+    return released
+
+
+class RetentionWorker(threading.Thread):
+    def __init__(self, session_factory, policies: list[RetentionPolicy], cache=None,
+                 interval: float = retention.INTERVAL):
+        super().__init__(name="retention", daemon=True)
+        self.Session = session_factory
+        self.policies = policies
+        self.purger = Purger(session_factory, cache)
+        self.interval = interval
+        self._halt = threading.Event()
+
+    def run_once(self) -> tuple[int, int]:
+        deleted = freed = 0
+        for policy in self.policies:
+            n, b = self.purger.apply(policy)
+            deleted, freed = deleted + n, freed + b
+        if deleted:
+            incremental_vacuum(self.Session)
+        return deleted, freed
+
+    def run(self) -> None:
+        while not self._halt.wait(self.interval):
+            try:
+                deleted, freed = self.run_once()
+                if deleted:
+                    log.info("retention removed %d messages (%d bytes)", deleted, freed)
+            except Exception:
+                log.exception("retention pass failed")
+
+    def stop(self) -> None:
+        self._halt.set()
+
+
+def main(argv: list[str] | None = None, prog: str | None = None):
+    ap = argparse.ArgumentParser(prog=prog, description="Apply retention policies and reclaim space")
+    ap.add_argument("--db", default="./localdata/messages.db")
+    ap.add_argument("--policies", default=os.getenv("RETENTION_POLICIES"),
+                    help="JSON list of {recipient, max_age, max_count, max_bytes}")
+    ap.add_argument("--retention-days", default=os.getenv("RETENTION_DAYS"))
+    ap.add_argument("--vacuum", action="store_true",
+                    help="run a full VACUUM afterwards (blocks writers; also enables incremental vacuum on old databases)")
+    args = ap.parse_args(argv)
+
+    Session = get_session_factory(args.db)
+    policies = load_policies(args.policies, args.retention_days)
+    deleted, freed = RetentionWorker(Session, policies).run_once()
+    print(f"removed {deleted} messages ({freed} bytes)")
+    if args.vacuum:
+        engine = Session.kw["bind"]
+        with engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.exec_driver_sql("VACUUM")
+        print("vacuumed")
+
+if __name__ == "__main__":
+    main()
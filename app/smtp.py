@@ -1,62 +1,234 @@
 from __future__ import annotations
-import argparse, json, os, uuid
-from email.parser import BytesParser
+import argparse, asyncio, logging, os, signal, socket, threading, time
 from aiosmtpd.controller import Controller
-from app.models import get_session_factory, Message
+from aiosmtpd.smtp import AuthResult
+from app import metrics
+from app.models import get_session_factory
+from app.ingest import IngestPipeline
+from app.notify import bus, UdpPublisher
+from app.blobs import get_blob_store
+from app.retention import RetentionWorker, load_policies
+from app.supervisor import Supervisor
+from app.utils.utils import normalize_namespace, plus_tag
+from app.constants import ingest, ingest_log, blobs, supervisor
 
 class SinkHandler:
-    def __init__(self, store_dir: str, session_factory):
+    def __init__(self, store_dir: str, session_factory, publishers: list | None = None,
+                 blob_store=None, namespace_sources=ingest.NAMESPACE_SOURCES,
+                 namespace_header: str = ingest.NAMESPACE_HEADER_NAME, **pipeline_opts):
         self.store_dir = store_dir
         self.Session = session_factory
         os.makedirs(self.store_dir, exist_ok=True)
+        if publishers is None:
+            publishers = [bus.publish]
+        self.namespace_sources = frozenset(namespace_sources)
+        self.pipeline = IngestPipeline(
+            store_dir, session_factory, listeners=publishers, blob_store=blob_store,
+            namespace_header=namespace_header if ingest.NAMESPACE_HEADER in self.namespace_sources else None,
+            **pipeline_opts,
+        )
+
+    def namespace(self, session, envelope) -> str | None:
+        """Namespace from the AUTH login or a recipient's +tag; the header
+        source is applied later, once the headers are parsed."""
+        if ingest.NAMESPACE_AUTH in self.namespace_sources:
+            login = getattr(getattr(session, "auth_data", None), "login", None)
+            if isinstance(login, bytes):
+                login = login.decode("utf-8", "replace")
+            if ns := normalize_namespace(login):
+                return ns
+        if ingest.NAMESPACE_TAG in self.namespace_sources:
+            for rcpt in envelope.rcpt_tos or ():
+                if ns := plus_tag(rcpt):
+                    return ns
+        return None
 
     async def handle_DATA(self, server, session, envelope):
-        mid = str(uuid.uuid4())
-        eml_path = os.path.join(self.store_dir, f"{mid}.eml")
-
-        with open(eml_path, "wb") as f:
-            f.write(envelope.original_content)
-
-        msg = BytesParser().parsebytes(envelope.content)
-        subject = msg.get("Subject", "") or ""
-        message_id = msg.get("Message-ID", "") or ""
-        has_attachments = 1 if msg.get_content_maintype() == "multipart" else 0
-
-        rec = Message(
-            id=mid,
-            from_addr=envelope.mail_from or "",
-            to_addrs=json.dumps(envelope.rcpt_tos or []),
-            subject=subject,
-            message_id=message_id,
-            size_bytes=len(envelope.original_content),
-            has_attachments=has_attachments,
-            eml_path=eml_path,
+        t0 = time.perf_counter()
+        reply = await self.pipeline.submit(envelope, self.namespace(session, envelope))
+        metrics.SMTP_ACCEPT.observe(time.perf_counter() - t0)
+        return reply
+
+def accept_any_login(server, session, envelope, mechanism, auth_data) -> AuthResult:
+    """A sink has nothing to protect: AUTH only tells us who is sending,
+    and the login doubles as the message namespace."""
+    return AuthResult(success=True, auth_data=auth_data)
+
+class ReusePortController(Controller):
+    """Listens with SO_REUSEPORT so several worker processes can bind the
+    same port; the kernel spreads new connections across them."""
+
+    def _create_server(self):
+        return self.loop.create_server(
+            self._factory_invoker,
+            host=self.hostname,
+            port=self.port,
+            ssl=self.ssl_context,
+            reuse_port=True,
         )
-        with self.Session() as s:
-            s.add(rec)
-            s.commit()
 
-        return "250 OK - captured"
+    def _trigger_server(self):
+        # start() connects once to make aiosmtpd build its SMTP instance;
+        # with a shared port that connection may reach another listener,
+        # so retry from fresh source ports until this one has answered
+        deadline = time.monotonic() + self.ready_timeout
+        while True:
+            super()._trigger_server()
+            if self._factory_invoked.wait(0.05) or time.monotonic() >= deadline:
+                return
+
+def serve(args, index: int = 0, stats=None, retention: bool = True,
+          halt: threading.Event | None = None) -> None:
+    """Run one listener until SIGTERM/SIGINT, then stop accepting, drain
+    the ingest queue and exit. ``stats`` receives pipeline counters.
+    A caller running this off the main thread passes its own ``halt``
+    and keeps the signals for itself."""
+    Session = get_session_factory(args.db)
+    ingest_log = None
+    if args.ingest_log:
+        from app.ingest_log import IngestLog
+        ingest_log = IngestLog(args.ingest_log, segment_bytes=args.ingest_log_segment_mb << 20,
+                               retain_segments=args.ingest_log_retain, fsync=args.ingest_log_fsync)
+    publishers = [bus.publish]
+    if args.notify_addr:
+        publishers.append(UdpPublisher(args.notify_addr))
+    handler = SinkHandler(
+        args.store_dir, Session,
+        publishers=publishers,
+        blob_store=get_blob_store(args.store_dir, args.blob_store, args.compress),
+        workers=args.ingest_workers,
+        batch_size=args.batch_size,
+        max_latency=args.batch_latency_ms / 1000,
+        queue_size=args.queue_size,
+        durability=args.durability,
+        namespace_sources=[s for s in args.namespace_from.split(",") if s],
+        namespace_header=args.namespace_header,
+        ingest_log=ingest_log,
+    )
+    metrics.INGEST_QUEUE_DEPTH.fn = lambda: {(): handler.pipeline.depth}
+    if stats is None and args.metrics_addr:
+        metrics.serve(args.metrics_addr, metrics.registry.snapshot)
+    controller_cls = ReusePortController if stats is not None else Controller
+    auth = {"authenticator": accept_any_login, "auth_require_tls": False} if args.auth else {}
+    controller = controller_cls(handler, hostname=args.host, port=args.port, **auth)
+    if halt is None:
+        halt = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: halt.set())
+        signal.signal(signal.SIGINT, lambda *_: halt.set())
+    controller.start()
+    policies = load_policies(args.retention_policies, args.retention_days) if retention else []
+    worker = RetentionWorker(Session, policies) if policies else None
+    if worker:
+        worker.start()
+    if stats is None:
+        print(f"SMTP capture running on {args.host}:{args.port} - {args.store_dir}")
+    try:
+        while not halt.wait(supervisor.STATS_INTERVAL):
+            if stats is not None:
+                stats.put({"worker": index, "pid": os.getpid(), **handler.pipeline.stats(),
+                           "metrics": metrics.registry.snapshot()})
+    finally:
+        if worker:
+            worker.stop()
+        # stop accepting first so new connections go to the other workers,
+        # then let in-flight sessions and the queue drain
+        controller.loop.call_soon_threadsafe(controller.server.close)
+        asyncio.run_coroutine_threadsafe(handler.pipeline.stop(), controller.loop).result()
+        if ingest_log is not None:
+            ingest_log.close()
+        if stats is not None:
+            stats.put({"worker": index, "pid": os.getpid(), **handler.pipeline.stats(),
+                       "metrics": metrics.registry.snapshot()})
+        controller.stop()
+
+def _worker(index: int, stats, args) -> None:
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s [worker {index}] %(levelname)s %(message)s")
+    logging.getLogger("mail.log").setLevel(logging.WARNING)   # aiosmtpd logs every command at INFO
+    serve(args, index, stats, retention=False)
 
-def main():
-    ap = argparse.ArgumentParser(description="SMTP capture listener")
+def add_arguments(ap: argparse.ArgumentParser) -> argparse.ArgumentParser:
     ap.add_argument("--host", default="127.0.0.1")
     ap.add_argument("--port", type=int, default=1025)
     ap.add_argument("--store-dir", default="./localdata")
     ap.add_argument("--db", default="./localdata/messages.db")
-    args=ap.parse_args()
+    ap.add_argument("--ingest-workers", type=int, default=ingest.DEFAULT_WORKERS,
+                    help="threads writing .eml files and parsing headers")
+    ap.add_argument("--batch-size", type=int, default=ingest.DEFAULT_BATCH_SIZE,
+                    help="max messages committed per transaction")
+    ap.add_argument("--batch-latency-ms", type=float, default=ingest.DEFAULT_MAX_LATENCY * 1000,
+                    help="max time a message waits for its batch to fill")
+    ap.add_argument("--queue-size", type=int, default=ingest.DEFAULT_QUEUE_SIZE,
+                    help="pending messages before DATA is refused with 451")
+    ap.add_argument("--durability", choices=ingest.DURABILITY_MODES, default=ingest.DURABILITY_COMMIT,
+                    help="ack after commit (safe) or after enqueue (fast)")
+    ap.add_argument("--notify-addr", default=os.getenv("NOTIFY_ADDR"),
+                    help="host:port[,host:port] of API processes to notify of new mail over UDP")
+    ap.add_argument("--blob-store", choices=blobs.BACKENDS, default=blobs.BACKEND_FLAT,
+                    help="flat {id}.eml files, or content-addressed deduplicated blobs")
+    ap.add_argument("--compress", choices=blobs.CODECS, default=blobs.CODEC_NONE,
+                    help="compression for the hashed blob store")
+    ap.add_argument("--namespace-from", default=",".join(ingest.NAMESPACE_SOURCES),
+                    help="comma list of namespace sources: header, auth, tag (empty to disable)")
+    ap.add_argument("--namespace-header", default=ingest.NAMESPACE_HEADER_NAME)
+    ap.add_argument("--auth", action="store_true",
+                    help="advertise AUTH and accept any credentials (the login becomes the namespace)")
+    ap.add_argument("--retention-days", default=os.getenv("RETENTION_DAYS"),
+                    help="delete mail older than this many days in the background")
+    ap.add_argument("--retention-policies", default=os.getenv("RETENTION_POLICIES"),
+                    help="JSON file of per-recipient age/count/byte quotas")
+    ap.add_argument("--ingest-log", default=os.getenv("INGEST_LOG_DIR"),
+                    help="directory to append every stored envelope to, for 'mailgate replay'")
+    ap.add_argument("--ingest-log-segment-mb", type=int,
+                    default=ingest_log.DEFAULT_SEGMENT_BYTES >> 20, help="start a new log segment past this size")
+    ap.add_argument("--ingest-log-retain", type=int, default=ingest_log.DEFAULT_RETAIN_SEGMENTS,
+                    help="keep only this many newest segments (0 keeps all)")
+    ap.add_argument("--ingest-log-fsync", action="store_true", help="fsync the log after every batch")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="listener processes sharing the port via SO_REUSEPORT")
+    ap.add_argument("--stats-file", default=None,
+                    help="with --workers, write aggregated per-worker stats here as JSON")
+    ap.add_argument("--metrics-addr", default=os.getenv("METRICS_ADDR"),
+                    help="host:port to serve Prometheus /metrics on (merged across --workers)")
+    ap.add_argument("--drain-timeout", type=float, default=supervisor.DRAIN_TIMEOUT,
+                    help="seconds workers get to flush their queues on shutdown")
+    return ap
 
+def parse_args(ap: argparse.ArgumentParser, argv: list[str] | None = None):
+    args = ap.parse_args(argv)
+    unknown = {s for s in args.namespace_from.split(",") if s} - set(ingest.NAMESPACE_SOURCES)
+    if unknown:
+        ap.error(f"unknown --namespace-from source(s): {', '.join(sorted(unknown))}")
+    if args.ingest_log and args.workers > 1:
+        ap.error("--ingest-log has a single writer; it cannot be combined with --workers")
+    return args
+
+def main(argv: list[str] | None = None, prog: str | None = None):
+    ap = add_arguments(argparse.ArgumentParser(prog=prog, description="SMTP capture listener"))
+    args = parse_args(ap, argv)
+
+    if args.workers <= 1:
+        serve(args)
+        return
+    if not hasattr(socket, "SO_REUSEPORT"):
+        ap.error("--workers needs SO_REUSEPORT, which this platform does not provide")
+    if args.port == 0:
+        ap.error("--workers needs a fixed --port")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [supervisor] %(levelname)s %(message)s")
+    os.makedirs(args.store_dir, exist_ok=True)
+    # create the schema once here rather than racing N workers to it
     Session = get_session_factory(args.db)
-    handler = SinkHandler(args.store_dir, Session)
-    controller = Controller(handler, hostname=args.host, port=args.port)
-    controller.start()
-    print(f"SMTP capture running on {args.host}:{args.port} - {args.store_dir}")
+    # one retention thread for the whole box, not one per worker
+    policies = load_policies(args.retention_policies, args.retention_days)
+    retention = RetentionWorker(Session, policies) if policies else None
+    if retention:
+        retention.start()
+    print(f"SMTP capture running on {args.host}:{args.port} with {args.workers} workers - {args.store_dir}")
     try:
-        import threading; threading.Event().wait()
-    except KeyboardInterrupt:
-        pass
+        Supervisor(_worker, args.workers, (args,), stats_path=args.stats_file,
+                   drain_timeout=args.drain_timeout, metrics_addr=args.metrics_addr).run()
     finally:
-        controller.stop()
+        if retention:
+            retention.stop()
 
 if __name__ == "__main__":
     main()
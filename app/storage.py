@@ -1,36 +1,511 @@
 from __future__ import annotations
-import json, os, shutil
+import base64, functools, json, shutil
+from datetime import datetime, timedelta
+from email import policy
+from email.parser import BytesParser
 from pathlib import Path
-from sqlalchemy import select, delete
-from app.models import get_session_factory, Message
-from app.constants.database import message
+from sqlalchemy import select, delete, insert, update, or_, tuple_
+from app import metrics
+from app.blobs import open_eml, read_eml, release_blobs, unlink_released
+from app.cache import ParsedCache, ParsedMessage, parsed_cache
+from app.mime import scan_message
+from app.models import get_async_session_factory, get_session_factory, Message, MessagePart, FtsDoc, Recipient, delete_related
+from app.models import MessageGroup, add_to_groups, assign_threads, group_keys, refresh_groups
+from app.models.group import GROUP_COLUMNS
+from app.retention import Purger
+from app.models import fts
+from app.ingest_rows import dup_key, fts_document, part_rows, recipient_rows, summary_fields, thread_refs
+from app.utils.utils import normalize_address, normalize_namespace
+from app.constants.database import group, message
+
+def encode_cursor(received_at: datetime, mid: str) -> str:
+    raw = f"{received_at.isoformat()}|{mid}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, mid = raw.split("|", 1)
+        return datetime.fromisoformat(ts), mid
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError(f"invalid cursor: {cursor!r}") from None
+
+def recipient_condition(to_addr: str):
+    """Exact mailbox (``a@b.c``) or domain (``@b.c``) via message_recipients;
+    anything else falls back to a substring match on the display list."""
+    address, domain = normalize_address(to_addr)
+    if address.startswith("@"):
+        return Message.id.in_(select(Recipient.message_id).where(Recipient.domain == domain))
+    if "@" in address and domain:
+        return Message.id.in_(select(Recipient.message_id).where(Recipient.address == address))
+    return Message.to_addrs.contains(to_addr, autoescape=True)
+
+def message_filters(text: str | None = None, *, subject: str | None = None,
+                    from_addr: str | None = None, to_addr: str | None = None,
+                    since: datetime | None = None, until: datetime | None = None,
+                    has_attachments: bool | None = None, namespace: str | None = None,
+                    thread_id: str | None = None, dup_key: str | None = None) -> list:
+    conds = []
+    if ns := normalize_namespace(namespace):
+        conds.append(Message.namespace == ns)
+    if thread_id:
+        conds.append(Message.thread_id == thread_id)
+    if dup_key:
+        conds.append(Message.dup_key == dup_key)
+    if text:
+        conds.append(or_(
+            Message.subject.contains(text, autoescape=True),
+            Message.from_addr.contains(text, autoescape=True),
+            Message.to_addrs.contains(text, autoescape=True),
+        ))
+    if subject:
+        conds.append(Message.subject.contains(subject, autoescape=True))
+    if from_addr:
+        conds.append(Message.from_addr.contains(from_addr, autoescape=True))
+    if to_addr:
+        conds.append(recipient_condition(to_addr))
+    if since:
+        conds.append(Message.received_at >= since)
+    if until:
+        conds.append(Message.received_at < until)
+    if has_attachments is not None:
+        conds.append(Message.has_attachments == (1 if has_attachments else 0))
+    return conds
+
+def page_query(columns, text: str | None = None, *, cursor: str | None = None,
+               limit: int = 100, **filters):
+    """Newest-first keyset page over ``(received_at, id)``; fetches one extra
+    row so ``split_page`` can tell whether there is a next page."""
+    stmt = select(*columns).where(*message_filters(text, **filters))
+    if cursor:
+        stmt = stmt.where(tuple_(Message.received_at, Message.id) < tuple_(*decode_cursor(cursor)))
+    return stmt.order_by(Message.received_at.desc(), Message.id.desc()).limit(limit + 1)
+
+def mailbox_page_query(address: str, *, cursor: str | None = None, limit: int = 100):
+    """Keyset page of (received_at, id) for one mailbox (or ``@domain``),
+    read straight off the message_recipients index."""
+    addr, domain = normalize_address(address)
+    col, value = (Recipient.domain, domain) if addr.startswith("@") else (Recipient.address, addr)
+    stmt = select(Recipient.received_at, Recipient.message_id.label("id")).distinct().where(col == value)
+    if cursor:
+        stmt = stmt.where(tuple_(Recipient.received_at, Recipient.message_id) < tuple_(*decode_cursor(cursor)))
+    return stmt.order_by(Recipient.received_at.desc(), Recipient.message_id.desc()).limit(limit + 1)
+
+def group_page_query(kind: str, text: str | None = None, *, cursor: str | None = None,
+                     limit: int = 100, namespace: str | None = None, **filters):
+    """Newest-first keyset page of thread or duplicate groups over
+    ``(latest_at, group_key)``, labelled like a message page so
+    ``split_page`` applies. Other filters keep the groups that have at
+    least one matching message."""
+    if kind not in group.KINDS:
+        raise ValueError(f"unknown group kind: {kind!r}")
+    stmt = select(
+        MessageGroup.latest_at.label("received_at"), MessageGroup.group_key.label("id"),
+        MessageGroup.latest_id, MessageGroup.count, MessageGroup.first_at,
+    ).where(MessageGroup.kind == kind)
+    if namespace:
+        stmt = stmt.where(MessageGroup.namespace == normalize_namespace(namespace))
+    conds = message_filters(text, **filters)
+    if conds:
+        stmt = stmt.where(MessageGroup.group_key.in_(select(GROUP_COLUMNS[kind]).where(*conds)))
+    if cursor:
+        stmt = stmt.where(tuple_(MessageGroup.latest_at, MessageGroup.group_key) < tuple_(*decode_cursor(cursor)))
+    return stmt.order_by(MessageGroup.latest_at.desc(), MessageGroup.group_key.desc()).limit(limit + 1)
+
+def scan_parts(mid: str, path: str) -> list[MessagePart]:
+    """Part index parsed from the file, for messages stored before
+    message_parts existed. Nothing is written: ``mailgate reindex`` stores
+    the rows (Store.backfill_parts)."""
+    data = read_eml(path)
+    return [MessagePart(**r) for r in part_rows(mid, scan_message(data), data)]
+
+def split_page(rows, limit: int):
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].received_at, rows[-1].id)
+
+# what a list row shows: a page walks ix_messages_list and reads these
+# from the table, never the .eml
+SUMMARY_COLUMNS = (
+    Message.id, Message.received_at, Message.namespace, Message.from_addr, Message.to_addrs,
+    Message.subject, Message.size_bytes, Message.has_attachments, Message.display_from,
+    Message.display_to, Message.snippet, Message.sent_at, Message.part_count, Message.thread_id,
+    Message.dup_key,
+)
+
+def _summary(m) -> dict:
+    """List row from SUMMARY_COLUMNS. Rows stored before the display
+    columns existed fall back to the envelope until backfill_summaries."""
+    to_addrs = ", ".join(json.loads(m.to_addrs or "[]"))
+    return {
+        message.COL_ID: m.id,
+        message.COL_RECEIVED_AT: m.received_at,
+        message.COL_FROM_ADDR: m.from_addr or "",
+        message.COL_TO_ADDRS: to_addrs,
+        message.COL_SUBJECT: m.subject or "",
+        message.COL_SIZE: m.size_bytes or 0,
+        message.COL_HAS_ATTACHMENTS: bool(m.has_attachments),
+        message.COL_NAMESPACE: m.namespace,
+        message.COL_DISPLAY_FROM: m.display_from or m.from_addr or "",
+        message.COL_DISPLAY_TO: m.display_to or to_addrs,
+        message.COL_SNIPPET: m.snippet or "",
+        message.COL_SENT_AT: m.sent_at,
+        message.COL_PART_COUNT: m.part_count,
+        message.COL_THREAD_ID: m.thread_id,
+        message.COL_DUP_KEY: m.dup_key,
+    }
+
+def _group_summary(g, m) -> dict:
+    """A group row: its newest message's summary plus the group's size."""
+    return {**_summary(m), "group": g.id, "count": g.count, "first_at": g.first_at}
+
+# Statements and row handling shared by the sync Store methods and their
+# async twins, which differ only in how the session is driven.
+
+def _summaries_stmt(ids: list[str]):
+    return select(*SUMMARY_COLUMNS).where(Message.id.in_(ids))
+
+def _by_id_stmt(ids: list[str], text: str | None = None, **filters):
+    return (
+        select(*SUMMARY_COLUMNS).where(Message.id.in_(ids), *message_filters(text, **filters))
+        .order_by(Message.received_at.desc(), Message.id.desc())
+    )
+
+def _summary_page(rows, limit: int) -> tuple[list[dict], str | None]:
+    rows, next_cursor = split_page(rows, limit)
+    return [_summary(m) for m in rows], next_cursor
+
+def _group_rows(groups, rows) -> list[dict]:
+    """Groups in page order, each joined to its newest message's row."""
+    by_id = {m.id: m for m in rows}
+    return [_group_summary(g, by_id[g.latest_id]) for g in groups if g.latest_id in by_id]
 
 class Store:
-    def __init__(self, db_path: str, store_dir: str):
+    def __init__(self, db_path: str, store_dir: str, cache: ParsedCache | None = None):
         self.Session = get_session_factory(db_path)
+        self.ReadSession = get_session_factory(db_path, readonly=True, init=False)
+        self.db_path = db_path
         self.store_dir = Path(store_dir)
         self.store_dir.mkdir(parents=True, exist_ok=True)
+        self.cache = cache if cache is not None else parsed_cache
+
+    @functools.cached_property
+    def AsyncReadSession(self):
+        # built on first use: each pooled aiosqlite connection owns a thread,
+        # and CLI callers of Store never need them
+        return get_async_session_factory(self.db_path, readonly=True)
 
     def list_messages(self, limit: int = 500):
-        from sqlalchemy import select
-        with self.Session() as s:
+        with self.ReadSession() as s:
             rows = s.execute(
-                select(Message).order_by(Message.received_at.desc()).limit(limit)
-            ).scalars().all()
+                select(*SUMMARY_COLUMNS).order_by(Message.received_at.desc(), Message.id.desc()).limit(limit)
+            ).all()
             for m in rows:
-                yield {
-                    message.COL_ID: m.id,
-                    message.COL_RECEIVED_AT: m.received_at,
-                    message.COL_FROM_ADDR: m.from_addr or "",
-                    message.COL_TO_ADDRS: ", ".join(json.loads(m.to_addrs or "[]")),
-                    message.COL_SUBJECT: m.subject or "",
-                    message.COL_SIZE: m.size_bytes or 0,
-                    message.COL_EML_PATH: m.eml_path or "",
-                    message.COL_HAS_ATTACHMENTS: bool(m.has_attachments),
-                }
+                yield _summary(m)
 
-    def get_message(self, mid: str) -> dict | None:
+    @metrics.timed(metrics.STORE_QUERY, op="search_messages")
+    def search_messages(self, text: str | None = None, *, cursor: str | None = None,
+                        limit: int = 100, **filters) -> tuple[list[dict], str | None]:
+        """Return one page of messages newest-first plus the cursor of the next page.
+
+        Filters are pushed into SQL (see ``message_filters``) and paging is
+        keyset-based on ``(received_at, id)``, so the cost of a page does not
+        depend on how deep into the mailbox it is.
+        """
+        stmt = page_query(SUMMARY_COLUMNS, text, cursor=cursor, limit=limit, **filters)
+        with self.ReadSession() as s:
+            return _summary_page(s.execute(stmt).all(), limit)
+
+    @metrics.timed(metrics.STORE_QUERY, op="asearch_messages")
+    async def asearch_messages(self, text: str | None = None, *, cursor: str | None = None,
+                               limit: int = 100, **filters) -> tuple[list[dict], str | None]:
+        """``search_messages`` for callers running on an event loop."""
+        stmt = page_query(SUMMARY_COLUMNS, text, cursor=cursor, limit=limit, **filters)
+        async with self.AsyncReadSession() as s:
+            return _summary_page((await s.execute(stmt)).all(), limit)
+
+    @metrics.timed(metrics.STORE_QUERY, op="messages_by_id")
+    def messages_by_id(self, ids: list[str], text: str | None = None, **filters) -> list[dict]:
+        """Summaries of ``ids`` that match the filters, newest first; used to
+        apply change-feed events to an already loaded listing."""
+        if not ids:
+            return []
+        with self.ReadSession() as s:
+            return [_summary(m) for m in s.execute(_by_id_stmt(ids, text, **filters)).all()]
+
+    @metrics.timed(metrics.STORE_QUERY, op="amessages_by_id")
+    async def amessages_by_id(self, ids: list[str], text: str | None = None, **filters) -> list[dict]:
+        """``messages_by_id`` for callers running on an event loop."""
+        if not ids:
+            return []
+        async with self.AsyncReadSession() as s:
+            return [_summary(m) for m in (await s.execute(_by_id_stmt(ids, text, **filters))).all()]
+
+    @metrics.timed(metrics.STORE_QUERY, op="group_messages")
+    def group_messages(self, kind: str, text: str | None = None, *, cursor: str | None = None,
+                       limit: int = 100, **filters) -> tuple[list[dict], str | None]:
+        """One page of threads or duplicate sets (``group.KIND_*``), newest
+        activity first, each shown by its newest message. Expand one with
+        the ``thread_id`` / ``dup_key`` filter of ``search_messages``."""
+        with self.ReadSession() as s:
+            groups, next_cursor = split_page(s.execute(
+                group_page_query(kind, text, cursor=cursor, limit=limit, **filters)).all(), limit)
+            rows = s.execute(_summaries_stmt([g.latest_id for g in groups])).all()
+        return _group_rows(groups, rows), next_cursor
+
+    @metrics.timed(metrics.STORE_QUERY, op="agroup_messages")
+    async def agroup_messages(self, kind: str, text: str | None = None, *, cursor: str | None = None,
+                              limit: int = 100, **filters) -> tuple[list[dict], str | None]:
+        """``group_messages`` for callers running on an event loop."""
+        async with self.AsyncReadSession() as s:
+            groups, next_cursor = split_page((await s.execute(
+                group_page_query(kind, text, cursor=cursor, limit=limit, **filters))).all(), limit)
+            rows = (await s.execute(_summaries_stmt([g.latest_id for g in groups]))).all()
+        return _group_rows(groups, rows), next_cursor
+
+    @metrics.timed(metrics.STORE_QUERY, op="mailbox_messages")
+    def mailbox_messages(self, address: str, *, cursor: str | None = None,
+                         limit: int = 100) -> tuple[list[dict], str | None]:
+        with self.ReadSession() as s:
+            keys, next_cursor = split_page(s.execute(mailbox_page_query(address, cursor=cursor, limit=limit)).all(), limit)
+            rows = s.execute(_summaries_stmt([k.id for k in keys])).all()
+        by_id = {m.id: m for m in rows}
+        return [_summary(by_id[k.id]) for k in keys if k.id in by_id], next_cursor
+
+    def backfill_summaries(self, batch_size: int = 500) -> int:
+        """Online migration: fill the display columns of messages stored
+        before they existed. A message whose file is gone gets its envelope
+        instead, so it is not read again on the next run."""
+        done = 0
+        last = ""
+        while True:
+            with self.Session() as s:
+                rows = s.execute(
+                    select(Message.id, Message.from_addr, Message.to_addrs, Message.eml_path)
+                    .where(Message.id > last, Message.part_count.is_(None))
+                    .order_by(Message.id).limit(batch_size)
+                ).all()
+                if not rows:
+                    return done
+                last = rows[-1].id
+                for r in rows:
+                    rcpts = json.loads(r.to_addrs or "[]")
+                    try:
+                        data = read_eml(r.eml_path) if r.eml_path else None
+                    except OSError:
+                        data = None
+                    if data is None:
+                        values = {
+                            message.COL_DISPLAY_FROM: r.from_addr or "",
+                            message.COL_DISPLAY_TO: ", ".join(rcpts),
+                            message.COL_SNIPPET: "",
+                            message.COL_PART_COUNT: 0,
+                        }
+                    else:
+                        mime = scan_message(data)
+                        values = summary_fields(mime.headers, rcpts, mime.text(data),
+                                                len(part_rows(r.id, mime, data)))
+                    s.execute(update(Message).where(Message.id == r.id).values(**values))
+                s.commit()
+                done += len(rows)
+
+    def backfill_groups(self, batch_size: int = 500) -> int:
+        """Online migration: give messages stored before grouping existed a
+        thread and duplicate key and count them into message_groups. Walks
+        oldest first, so parents are threaded before their replies."""
+        done = 0
+        last = None
+        while True:
+            with self.Session() as s:
+                stmt = select(Message).where(or_(Message.thread_id.is_(None), Message.dup_key.is_(None)))
+                if last:
+                    stmt = stmt.where(tuple_(Message.received_at, Message.id) > tuple_(*last))
+                rows = s.scalars(stmt.order_by(Message.received_at, Message.id).limit(batch_size)).all()
+                if not rows:
+                    return done
+                last = (rows[-1].received_at, rows[-1].id)
+                items = []
+                for m in rows:
+                    try:
+                        data = read_eml(m.eml_path) if m.eml_path else None
+                    except OSError:
+                        data = None
+                    mime = scan_message(data) if data is not None else None
+                    m.dup_key = dup_key(m.namespace, m.from_addr or "", json.loads(m.to_addrs or "[]"),
+                                        m.subject or "", mime.text(data) if mime else "")
+                    items.append((m, thread_refs(mime.headers) if mime else []))
+                assign_threads(s, items)
+                add_to_groups(s, rows)
+                s.commit()
+                done += len(rows)
+
+    def backfill_recipients(self, batch_size: int = 500) -> int:
+        """Online migration: create message_recipients rows for messages
+        stored before the table existed, one short transaction per batch."""
+        done = 0
+        last = ""
+        while True:
+            with self.Session() as s:
+                rows = s.execute(
+                    select(Message.id, Message.received_at, Message.to_addrs, Message.eml_path)
+                    .where(Message.id > last,
+                           ~Message.id.in_(select(Recipient.message_id).where(Recipient.message_id > last)))
+                    .order_by(Message.id).limit(batch_size)
+                ).all()
+                if not rows:
+                    return done
+                last = rows[-1].id
+                out = []
+                for r in rows:
+                    try:
+                        with open_eml(r.eml_path) as f:
+                            msg = BytesParser(policy=policy.default).parse(f, headersonly=True)
+                    except (OSError, TypeError):
+                        msg = None
+                    out.extend(recipient_rows(r.id, r.received_at, json.loads(r.to_addrs or "[]"), msg))
+                if out:
+                    s.execute(insert(Recipient), out)
+                s.commit()
+                done += len(rows)
+
+    def backfill_parts(self, batch_size: int = 500) -> int:
+        """Online migration: index the MIME parts of messages stored before
+        message_parts existed, one short transaction per batch."""
+        done = 0
+        last = ""
+        while True:
+            with self.Session() as s:
+                rows = s.execute(
+                    select(Message.id, Message.eml_path)
+                    .where(Message.id > last,
+                           ~Message.id.in_(select(MessagePart.message_id).where(MessagePart.message_id > last)))
+                    .order_by(Message.id).limit(batch_size)
+                ).all()
+                if not rows:
+                    return done
+                last = rows[-1].id
+                out = []
+                for r in rows:
+                    try:
+                        data = read_eml(r.eml_path)
+                    except (OSError, TypeError):
+                        continue
+                    out.extend(part_rows(r.id, scan_message(data), data))
+                if out:
+                    s.execute(insert(MessagePart).prefix_with("OR IGNORE"), out)
+                s.commit()
+                done += len(rows)
+
+    @metrics.timed(metrics.STORE_QUERY, op="search_text")
+    def search_text(self, q: str, *, limit: int = 50, offset: int = 0, **marks) -> list[dict]:
+        """Full-text search over headers and bodies, best match first.
+
+        Each hit is the usual message summary plus ``rank`` (bm25, lower is
+        better) and a highlighted ``snippet``.
+        """
+        with self.ReadSession() as s:
+            hits = fts.search(s, q, limit=limit, offset=offset, **marks)
+            rows = s.execute(_summaries_stmt([h[message.COL_ID] for h in hits])).all()
+        by_id = {m.id: m for m in rows}
+        return [
+            {**_summary(by_id[h[message.COL_ID]]), "rank": h["rank"], "snippet": h["snippet"]}
+            for h in hits if h[message.COL_ID] in by_id
+        ]
+
+    def reindex(self, batch_size: int = 500, rebuild: bool = False) -> int:
+        """Back-fill the full-text index for messages that have no entry yet.
+        Returns 0 on a backend without one, where no entry would be written."""
+        done = 0
         with self.Session() as s:
+            if not fts.fts_available(s.bind):
+                return 0
+            if rebuild:
+                fts.remove_documents(s, s.execute(select(FtsDoc.message_id)).scalars().all())
+                s.commit()
+            while True:
+                rows = s.execute(
+                    select(Message)
+                    .outerjoin(FtsDoc, FtsDoc.message_id == Message.id)
+                    .where(FtsDoc.id.is_(None))
+                    .limit(batch_size)
+                ).scalars().all()
+                if not rows:
+                    return done
+                docs = []
+                for m in rows:
+                    try:
+                        with open_eml(m.eml_path) as f:
+                            msg = BytesParser(policy=policy.default).parse(f)
+                    except (OSError, TypeError):
+                        msg = BytesParser(policy=policy.default).parsebytes(b"")
+                        msg["Subject"] = m.subject or ""
+                    docs.append(fts_document(m.id, msg, m.from_addr or "", json.loads(m.to_addrs or "[]")))
+                fts.index_documents(s, docs)
+                s.commit()
+                done += len(docs)
+
+    def migrate_blobs(self, blob_store, batch_size: int = 500) -> tuple[int, int]:
+        """Move every message into ``blob_store`` (e.g. flat files into the
+        hashed, compressed layout). Returns (migrated, missing files)."""
+        migrated = missing = 0
+        last = ""
+        while True:
+            with self.Session() as s:
+                rows = s.execute(
+                    select(Message.id, Message.eml_path)
+                    .where(Message.id > last).order_by(Message.id).limit(batch_size)
+                ).all()
+                if not rows:
+                    return migrated, missing
+                last = rows[-1].id
+                moved = []
+                for mid, path in rows:
+                    if not path:
+                        continue
+                    try:
+                        data = read_eml(path)
+                    except OSError:
+                        missing += 1
+                        continue
+                    ref = blob_store.write(mid, data)
+                    if ref.path != path:
+                        moved.append((mid, path, ref, data))
+                if not moved:
+                    continue
+                blob_store.acquire(s, [ref for _, _, ref, _ in moved])
+                unlink = release_blobs(s, [path for _, path, _, _ in moved])
+                for mid, _, ref, _ in moved:
+                    s.execute(update(Message).where(Message.id == mid).values(eml_path=ref.path))
+                s.commit()
+            unlink_released(self.Session, unlink)
+            for mid, _, ref, data in moved:
+                blob_store.ensure(ref, data)
+            self.cache.invalidate(*[mid for mid, _, _, _ in moved])
+            migrated += len(moved)
+
+    @metrics.timed(metrics.STORE_QUERY, op="purge")
+    def purge(self, text: str | None = None, *, older_than: timedelta | None = None,
+              **filters) -> tuple[int, int]:
+        """Bulk-delete every message matching the filters (and older than
+        ``older_than``); returns (messages, bytes) removed."""
+        conds = message_filters(text, **filters)
+        if older_than is not None:
+            conds.append(Message.received_at < datetime.utcnow() - older_than)
+        if not conds:
+            raise ValueError("refusing to purge without a filter")
+        return Purger(self.Session, self.cache).purge(conds)
+
+    def drop_namespace(self, namespace: str) -> tuple[int, int]:
+        """Delete one namespace's mail when its test finishes; only that
+        namespace's rows are visited, via its (namespace, received_at) index."""
+        if not normalize_namespace(namespace):
+            raise ValueError("empty namespace")
+        return self.purge(namespace=namespace)
+
+    @metrics.timed(metrics.STORE_QUERY, op="get_message")
+    def get_message(self, mid: str) -> dict | None:
+        with self.ReadSession() as s:
             m = s.get(Message, mid)
             if not m:
                 return None
@@ -45,24 +520,42 @@ class Store:
                 message.COL_HAS_ATTACHMENTS: bool(m.has_attachments),
             }
 
+    @metrics.timed(metrics.STORE_QUERY, op="get_parsed")
+    def get_parsed(self, mid: str) -> ParsedMessage | None:
+        """Parsed headers/bodies/part tree, served from the shared cache
+        without touching the database when the entry is still fresh."""
+        entry = self.cache.lookup(mid)
+        if entry is not None:
+            return entry
+        info = self.get_message(mid)
+        if not info or not info[message.COL_EML_PATH]:
+            return None
+        try:
+            return self.cache.load(mid, info[message.COL_EML_PATH])
+        except OSError:
+            return None
+
+    @metrics.timed(metrics.STORE_QUERY, op="delete_message")
     def delete_message(self, mid: str) -> bool:
         with self.Session() as s:
             m = s.get(Message, mid)
             if not m: return False
 
-            try:
-                if m.eml_path and os.path.exists(m.eml_path):
-                    os.remove(m.eml_path)
-            except Exception:
-                pass
+            delete_related(s, [mid])
+            unlink = release_blobs(s, [m.eml_path])
             s.execute(delete(Message).where(Message.id == mid))
+            refresh_groups(s, group_keys([m]))
             s.commit()
-            return True
+        unlink_released(self.Session, unlink)
+        self.cache.invalidate(mid)
+        return True
 
+    @metrics.timed(metrics.STORE_QUERY, op="export_message")
     def export_message(self, mid:str, dest_dir: str) -> str | None:
         info = self.get_message(mid)
         if not info: return None
         Path(dest_dir).mkdir(parents=True, exist_ok=True)
         dest = Path(dest_dir) / f"{mid}.eml"
-        shutil.copy(info["eml_path"], dest)
-        return str(dest)
\ No newline at end of file
+        with open_eml(info["eml_path"]) as src, open(dest, "wb") as out:
+            shutil.copyfileobj(src, out)
+        return str(dest)
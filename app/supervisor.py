@@ -0,0 +1,162 @@
+from __future__ import annotations
+import logging, multiprocessing, os, queue, signal, threading, time
+from datetime import datetime
+from app import metrics
+from app.utils.utils import dumps
+from app.constants import supervisor
+
+log = logging.getLogger(__name__)
+
+
+class Supervisor:
+    """Keeps ``count`` worker processes running ``target(index, stats, *args)``.
+
+    Workers report a stats dict on ``stats`` every few seconds; the
+    supervisor keeps the latest one per worker, restarts workers that exit
+    (backing off if they keep dying young) and on SIGTERM/SIGINT asks every
+    worker to drain, killing the ones that outlive ``drain_timeout``.
+    """
+
+    def __init__(self, target, count: int, args: tuple = (), *,
+                 stats_path: str | None = None,
+                 stats_interval: float = supervisor.STATS_INTERVAL,
+                 drain_timeout: float = supervisor.DRAIN_TIMEOUT,
+                 metrics_addr: str | None = None):
+        # spawn, not fork: the parent may already hold threads and DB handles
+        self.ctx = multiprocessing.get_context("spawn")
+        self.target = target
+        self.count = max(1, count)
+        self.args = args
+        self.stats_path = stats_path
+        self.stats_interval = stats_interval
+        self.drain_timeout = drain_timeout
+        self.metrics_addr = metrics_addr
+        self.stats = self.ctx.Queue()
+        self.latest: dict[int, dict] = {}
+        self.metrics: dict[int, dict] = {}   # latest registry snapshot per worker
+        self.restarts = 0
+        self._procs: dict[int, multiprocessing.Process] = {}
+        self._started: dict[int, float] = {}
+        self._backoff: dict[int, float] = {}
+        self._respawn_at: dict[int, float] = {}
+        self._halt = threading.Event()
+
+    def _spawn(self, index: int) -> None:
+        p = self.ctx.Process(target=self.target, args=(index, self.stats, *self.args),
+                             name=f"smtp-worker-{index}", daemon=False)
+        p.start()
+        self._procs[index] = p
+        self._started[index] = time.monotonic()
+        log.info("started worker %d (pid %d)", index, p.pid)
+
+    def _reap(self) -> None:
+        now = time.monotonic()
+        for index, p in list(self._procs.items()):
+            if p.is_alive():
+                continue
+            if index not in self._respawn_at:
+                uptime = now - self._started[index]
+                if uptime >= supervisor.MIN_UPTIME:
+                    self._backoff[index] = 0.0
+                else:
+                    self._backoff[index] = min(
+                        max(self._backoff.get(index, 0.0) * 2, supervisor.RESTART_BACKOFF),
+                        supervisor.MAX_RESTART_BACKOFF,
+                    )
+                self._respawn_at[index] = now + self._backoff[index]
+                log.warning("worker %d (pid %d) exited with %s; restarting in %.1fs",
+                            index, p.pid, p.exitcode, self._backoff[index])
+            if now >= self._respawn_at[index]:
+                del self._respawn_at[index]
+                self.latest.pop(index, None)
+                self.restarts += 1
+                self._spawn(index)
+
+    def _collect(self, timeout: float) -> None:
+        try:
+            report = self.stats.get(timeout=timeout)
+        except queue.Empty:
+            return
+        while True:
+            snap = report.pop("metrics", None)
+            if snap is not None:
+                self.metrics[report["worker"]] = snap
+            self.latest[report["worker"]] = report
+            try:
+                report = self.stats.get_nowait()
+            except queue.Empty:
+                return
+
+    def snapshot(self) -> dict:
+        workers = [self.latest[i] for i in sorted(self.latest)]
+        total: dict[str, int] = {}
+        for w in workers:
+            for k, v in w.items():
+                if k not in ("worker", "pid") and isinstance(v, (int, float)):
+                    total[k] = total.get(k, 0) + v
+        return {
+            "updated": datetime.utcnow().isoformat(),
+            "workers": workers,
+            "total": total,
+            "restarts": self.restarts,
+        }
+
+    def collect_metrics(self) -> dict:
+        """Worker metrics summed, plus the supervisor's own gauges. Counters
+        of a restarted worker start again from zero."""
+        own = {
+            "mailgate_smtp_workers": {"kind": "gauge", "help": "Listener processes running",
+                                      "labels": (), "values": {(): sum(p.is_alive() for p in list(self._procs.values()))}},
+            "mailgate_smtp_worker_restarts_total": {"kind": "counter", "help": "Listener processes restarted",
+                                                    "labels": (), "values": {(): self.restarts}},
+        }
+        return metrics.merge([*list(self.metrics.values()), own])
+
+    def _publish(self) -> None:
+        if not self.latest:
+            return
+        snap = self.snapshot()
+        log.info("workers=%d %s", len(snap["workers"]),
+                 " ".join(f"{k}={v}" for k, v in sorted(snap["total"].items())))
+        if self.stats_path:
+            tmp = f"{self.stats_path}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(dumps(snap))
+            os.replace(tmp, self.stats_path)
+
+    def stop(self, *_) -> None:
+        self._halt.set()
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for index in range(self.count):
+            self._spawn(index)
+        server = metrics.serve(self.metrics_addr, self.collect_metrics) if self.metrics_addr else None
+        next_publish = time.monotonic() + self.stats_interval
+        try:
+            while not self._halt.is_set():
+                self._collect(timeout=0.5)
+                self._reap()
+                if time.monotonic() >= next_publish:
+                    self._publish()
+                    next_publish = time.monotonic() + self.stats_interval
+        finally:
+            if server is not None:
+                server.shutdown()
+            self._shutdown()
+
+    def _shutdown(self) -> None:
+        procs = [p for p in self._procs.values() if p.is_alive()]
+        for p in procs:
+            p.terminate()   # SIGTERM: the worker stops accepting and drains
+        deadline = time.monotonic() + self.drain_timeout
+        for p in procs:
+            p.join(max(0.0, deadline - time.monotonic()))
+        for p in procs:
+            if p.is_alive():
+                log.warning("worker %s did not drain in %.0fs; killing it", p.name, self.drain_timeout)
+                p.kill()
+                p.join()
+        self._collect(timeout=0)
+        self._publish()
@@ -1,32 +1,77 @@
 from __future__ import annotations
+import argparse, asyncio, os, threading
 from pathlib import Path
+from textual import work
 from textual.app import App
-from app.storage import Store
+from app.constants import notify
 from .screens.welcome import WelcomeScreen
-from .screens.emails import EmailsScreen
 
 class SinkTUI(App):
     CSS_PATH = Path(__file__).with_name("sink.tcss")
 
-    def __init__(self, db_path: str, store_dir: str, export_dir: str = "./exports"):
+    def __init__(self, db_path: str, store_dir: str, export_dir: str = "./exports",
+                 notify_mode: str = notify.MODE_POLL, notify_addr: str | None = None,
+                 namespace: str | None = None):
         super().__init__()
-        self.store = Store(db_path, store_dir)
+        self.db_path = db_path
+        self.store_dir = store_dir
         self.export_dir = export_dir
+        self.notify_mode = notify_mode
+        self.notify_addr = notify_addr
+        self.namespace = namespace
+        self._store = None
+        self._store_lock = threading.Lock()
+        self._stop_feed = None
 
-    def on_mount(self) -> None:
+    @property
+    def store(self):
+        # SQLAlchemy and the schema check are only paid for once the store
+        # is first used, which on_mount arranges after the first paint
+        with self._store_lock:
+            if self._store is None:
+                from app.storage import Store
+                self._store = Store(self.db_path, self.store_dir)
+            return self._store
+
+    def _emails_screen(self):
+        from .screens.emails import EmailsScreen
+        return EmailsScreen(namespace=self.namespace)
+
+    async def on_mount(self) -> None:
         self.install_screen(WelcomeScreen(), name="welcome")
-        self.install_screen(EmailsScreen(),  name="emails")
+        # a factory, so the message list's imports wait until it is opened
+        self.install_screen(self._emails_screen, name="emails")
         self.push_screen("welcome")
+        self._open_store()
+
+    @work(exclusive=True, group="store")
+    async def _open_store(self) -> None:
+        store = await asyncio.to_thread(lambda: self.store)
+        from app.notify import bus, start_feed
+        # new mail reaches the message list through the bus, from the
+        # listener's UDP datagrams or by tailing the database
+        self._stop_feed = await start_feed(self.notify_mode, bus, addr=self.notify_addr,
+                                           session_factory=store.ReadSession)
 
-def _parse_args():
-    import argparse
-    ap = argparse.ArgumentParser()
+    def on_unmount(self) -> None:
+        if self._stop_feed:
+            self._stop_feed()
+
+def main(argv: list[str] | None = None, prog: str | None = None) -> None:
+    ap = argparse.ArgumentParser(prog=prog, description="Terminal UI for browsing captured mail")
     ap.add_argument("--db", default="./localdata/messages.db")
     ap.add_argument("--store-dir", default="./localdata")
     ap.add_argument("--export-dir", default="./exports")
-    return ap.parse_args()
+    ap.add_argument("--notify-mode", choices=notify.MODES, default=notify.MODE_POLL,
+                    help="udp: listen for the SMTP listener's datagrams; poll: tail the database")
+    ap.add_argument("--notify-addr", default=os.getenv("TUI_NOTIFY_ADDR"),
+                    help="host:port to receive notifications on in udp mode")
+    ap.add_argument("--namespace", default=None,
+                    help="start with the list scoped to one namespace (ns: in the filter box)")
+    args = ap.parse_args(argv)
+    Path(args.store_dir).mkdir(parents=True, exist_ok=True)
+    SinkTUI(args.db, args.store_dir, args.export_dir, args.notify_mode, args.notify_addr,
+            args.namespace).run()
 
 if __name__ == "__main__":
-    args = _parse_args()
-    Path(args.store_dir).mkdir(parents=True, exist_ok=True)
-    SinkTUI(args.db, args.store_dir, args.export_dir).run()
+    main()
@@ -1,36 +1,83 @@
+import asyncio
+from datetime import datetime
+from pathlib import Path
+
+from textual import work
 from textual.screen import Screen
 from textual.app import ComposeResult
-from textual.widgets import Header, Footer, Static, Button
-from textual.containers import Center, Vertical, Horizontal
+from textual.widgets import Header, Footer, Static
+from textual.containers import Vertical, Horizontal
 from textual.widgets import DataTable, Input
+from textual.widgets.data_table import CellDoesNotExist
 from textual.reactive import reactive
+from textual.timer import Timer
+from textual.worker import get_current_worker
 
-from app.utils.utils import read_text_part
+from app.archive import iter_export
+from app.notify import bus
+from app.storage import message_filters
+from app.utils.utils import parse_search
+from app.constants import archive
+from app.constants.database import group, message
 
 
 class EmailsScreen(Screen):
+    """Message list that is updated in place.
+
+    Pages are fetched in thread workers and appended as the user scrolls;
+    new arrivals come from the notification bus and are merged into the
+    loaded rows, so the cursor stays on the message it was on.
+    """
+
     BINDINGS = [
-        ("r", "refresh", "Refresh"),
+        ("r", "refresh", "Reload"),
         ("d", "delete", "Delete"),
         ("e", "export", "Export .eml"),
+        ("E", "export_all", "Export filtered .mbox"),
         ("/", "focus_search", "Search"),
         ("escape", "clear_search", "Clear search"),
         ("tab", "focus_table", "To table"),
         ("shift+tab", "focus_search", "To search"),
         ("w", "to_welcome", "Welcome"),
+        ("m", "load_more", "More"),
+        ("x", "purge", "Purge filtered"),
+        ("v", "mailbox", "Recipient's mailbox"),
+        ("g", "cycle_grouping", "Group"),
+        ("t", "thread", "Thread"),
     ]
 
+    PAGE_SIZE = 200
+    PREFETCH_ROWS = 50       # fetch the next page this close to the bottom
+    SEARCH_DEBOUNCE = 0.25   # seconds of typing quiet before querying
+    FEED_COALESCE = 0.2      # gather a burst of arrivals into one update
+
     filter_text: reactive[str] = reactive("")
+    _next_cursor: str | None = None
+    _purge_armed: str | None = None
+    _grouping: str | None = None    # group.KIND_* while the list shows groups
+
+    def __init__(self, *args, namespace: str | None = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        if namespace:
+            self.set_reactive(EmailsScreen.filter_text, f"ns:{namespace}")
+        self._order: dict[str, tuple] = {}    # row key -> (received_at, id)
+        self._rows: dict[str, dict] = {}      # row key -> list summary, for preview headers
+        self._floor: tuple | None = None      # oldest loaded key while more pages exist
+        self._generation = 0                  # bumped whenever the listing is reset
+        self._paging = False
+        self._debounce: Timer | None = None
 
     def compose(self) -> ComposeResult:
         yield Header(show_clock=True)
         with Horizontal():
             with Vertical(id="sidebar"):
-                yield Input(placeholder="type to filter (subject/from/to)...", id="search")
+                yield Input(self.filter_text, placeholder="filter: text from: to: subject: ns: thread: dup: "
+                                                          "after: before: has:attachment", id="search")
                 t = DataTable(id="table")
                 t.cursor_type = "row"
                 t.show_cursor = True
-                t.add_columns("Received", "From", "To", "Subject", "Size", "ID")
+                for label in ("Received", "From", "To", "Subject", "Size", "ID"):
+                    t.add_column(label, key=label.lower())
                 yield t
             with Vertical(id="preview"):
                 yield Static("Select a message to preview.", id="preview_text")
@@ -38,17 +85,17 @@ class EmailsScreen(Screen):
         yield Footer()
 
     def on_mount(self) -> None:
-        self.load_rows()
         table = self.query_one("#table", DataTable)
         table.focus()
-        if table.row_count:
-            table.cursor_coordinate = (0, 0)
-            mid = self._get_cell((0, 5))
-            if isinstance(mid, str):
-                self.show_preview(mid)
+        self.watch(table, "scroll_y", self._on_table_scroll, init=False)
+        self.load_rows()
+        self._follow()
 
     def action_refresh(self) -> None:
-        self.load_rows(status="refreshed")
+        self.load_rows(status="reloaded")
+
+    def action_load_more(self) -> None:
+        self.load_more()
 
     def action_focus_search(self) -> None:
         self.query_one("#search", Input).focus()
@@ -65,94 +112,352 @@ class EmailsScreen(Screen):
         self.load_rows(status="filter cleared")
 
     def on_input_changed(self, ev: Input.Changed) -> None:
-        if ev.input.id == "search":
-            self.filter_text = ev.value
-            self.load_rows()
+        # actions that set filter_text themselves reload directly
+        if ev.input.id != "search" or ev.value == self.filter_text:
+            return
+        self.filter_text = ev.value
+        if self._debounce is not None:
+            self._debounce.stop()
+        self._debounce = self.set_timer(self.SEARCH_DEBOUNCE, self.load_rows)
 
     def on_input_submitted(self, ev: Input.Submitted) -> None:
         if ev.input.id == "search":
             self.query_one("#table", DataTable).focus()
 
     def on_data_table_row_highlighted(self, ev: DataTable.RowHighlighted) -> None:
-        mid = self._get_cell((ev.cursor_row, 5), ev.data_table)
-        if isinstance(mid, str):
-            self.show_preview(mid)
+        if ev.row_key.value:
+            self.show_preview(ev.row_key.value)
+        # fetch the next page once the cursor reaches the last loaded row
+        if ev.cursor_row >= ev.data_table.row_count - 1:
+            self.load_more()
 
     def on_data_table_row_selected(self, ev: DataTable.RowSelected) -> None:
-        tbl = ev.data_table
-        idx = ev.row_key if isinstance(ev.row_key, int) else tbl.cursor_row
-        mid = self._get_cell((idx, 5), tbl)
-        if isinstance(mid, str):
-            self.show_preview(mid)
+        if not ev.row_key.value:
+            return
+        row = self._rows.get(ev.row_key.value)
+        if self._grouping and row:
+            # open the group as a plain list of its messages
+            self._show_group(self._grouping, row["group"])
+        else:
+            self.show_preview(ev.row_key.value)
 
-    def action_delete(self) -> None:
+    def _on_table_scroll(self, scroll_y: float) -> None:
         tbl = self.query_one("#table", DataTable)
-        if not tbl.row_count:
-            return
-        row = tbl.cursor_row
-        mid = self._get_cell((row, 5))
-        if isinstance(mid, str) and self.app.store.delete_message(mid):
-            self.set_status(f"deleted {mid}")
-            self.load_rows()
+        if tbl.max_scroll_y - scroll_y <= self.PREFETCH_ROWS:
+            self.load_more()
+
+    def action_delete(self) -> None:
+        mid = self._current_mid()
+        if mid:
+            self._delete(mid)
 
     def action_export(self) -> None:
-        tbl = self.query_one("#table", DataTable)
-        if not tbl.row_count:
-            return
-        row = tbl.cursor_row
-        mid = self._get_cell((row, 5))
-        if isinstance(mid, str):
+        mid = self._current_mid()
+        if mid:
             path = self.app.store.export_message(mid, self.app.export_dir)
             if path:
                 self.set_status(f"exported -> {path}")
 
+    def action_export_all(self) -> None:
+        filters = self._filters()
+        if filters is not None:
+            self.set_status("exporting...")
+            self._export_all(filters)
+
+    def action_mailbox(self) -> None:
+        mid = self._current_mid()
+        if not mid:
+            return
+        to = self.query_one("#table", DataTable).get_cell(mid, "to")
+        addr = to.split(",", 1)[0].strip() if isinstance(to, str) else ""
+        if not addr:
+            return
+        self.filter_text = f"to:{addr}"
+        self.query_one("#search", Input).value = self.filter_text
+        self.query_one("#table", DataTable).focus()
+        self.load_rows()
+
+    def action_cycle_grouping(self) -> None:
+        kinds = [None, *group.KINDS]
+        self._grouping = kinds[(kinds.index(self._grouping) + 1) % len(kinds)]
+        self.load_rows(status=f"grouped by {self._grouping}" if self._grouping else "ungrouped")
+
+    def action_thread(self) -> None:
+        row = self._rows.get(self._current_mid() or "")
+        if row and row.get(message.COL_THREAD_ID):
+            self._show_group(group.KIND_THREAD, row[message.COL_THREAD_ID])
+
+    def _show_group(self, kind: str, key: str) -> None:
+        filters = self._filters() or {}
+        ns = f"ns:{filters['namespace']} " if filters.get("namespace") else ""
+        self._grouping = None
+        self.filter_text = f"{ns}{kind}:{key}"
+        self.query_one("#search", Input).value = self.filter_text
+        self.query_one("#table", DataTable).focus()
+        self.load_rows()
+
+    def action_purge(self) -> None:
+        ft = self.filter_text.strip()
+        if not ft:
+            self.set_status("type a filter first; purge deletes every message matching it")
+            return
+        # first press arms, second press with the same filter deletes
+        if self._purge_armed != ft:
+            self._purge_armed = ft
+            self.set_status(f"press x again to delete ALL messages matching '{ft}'")
+            return
+        self._purge_armed = None
+        try:
+            filters = parse_search(ft)
+        except ValueError as e:
+            self.set_status(str(e))
+            return
+        self.set_status(f"purging messages matching '{ft}'...")
+        self._purge(filters)
+
     def action_to_welcome(self) -> None:
         self.app.pop_screen()
 
-    def _get_cell(self, coord, tbl: DataTable | None = None):
-        tbl = tbl or self.query_one("#table", DataTable)
-        cell = tbl.get_cell_at(coord)
-        return getattr(cell, "value", cell)
+    def _current_mid(self) -> str | None:
+        tbl = self.query_one("#table", DataTable)
+        if not tbl.row_count:
+            return None
+        try:
+            return tbl.coordinate_to_cell_key(tbl.cursor_coordinate).row_key.value
+        except CellDoesNotExist:
+            return None
+
+    def _restore_cursor(self, mid: str | None) -> bool:
+        if mid is None or mid not in self._order:
+            return False
+        tbl = self.query_one("#table", DataTable)
+        tbl.move_cursor(row=tbl.get_row_index(mid))
+        return True
+
+    def _filters(self) -> dict | None:
+        try:
+            return parse_search(self.filter_text.strip())
+        except ValueError as e:
+            self.set_status(str(e))
+            return None
+
+    # -- loading ---------------------------------------------------------
 
     def load_rows(self, status: str | None = None) -> None:
+        """Replace the listing with the first page for the current filter."""
+        if self._debounce is not None:
+            self._debounce.stop()
+            self._debounce = None
+        filters = self._filters()
+        if filters is None:
+            return
+        self._generation += 1
+        self._paging = True
+        if status:
+            self.set_status(status)
+        self._fetch_page(self._generation, filters, None)
+
+    def load_more(self) -> None:
+        if self._next_cursor and not self._paging:
+            filters = self._filters()
+            if filters is None:
+                return
+            self._paging = True
+            self._fetch_page(self._generation, filters, self._next_cursor)
+
+    @work(exclusive=True, group="page")
+    async def _fetch_page(self, generation: int, filters: dict, cursor: str | None) -> None:
+        # exclusive: a newer query cancels this one while it awaits
+        try:
+            if self._grouping:
+                rows, next_cursor = await self.app.store.agroup_messages(
+                    self._grouping, cursor=cursor, limit=self.PAGE_SIZE, **filters
+                )
+            else:
+                rows, next_cursor = await self.app.store.asearch_messages(
+                    cursor=cursor, limit=self.PAGE_SIZE, **filters
+                )
+        except ValueError as e:
+            self.set_status(str(e))
+            return
+        finally:
+            # a failed or cancelled load must not leave paging stuck; a
+            # newer generation has set the flag for its own load
+            if generation == self._generation:
+                self._paging = False
+        self._apply_page(generation, rows, next_cursor, cursor is None)
+
+    def _apply_page(self, generation: int, rows: list[dict], next_cursor: str | None, reset: bool) -> None:
+        if generation != self._generation:
+            return
         tbl = self.query_one("#table", DataTable)
-        tbl.clear()
-        rows = list(self.app.store.list_messages(limit=500))
-        ft = self.filter_text.strip().lower()
-        if ft:
-            def ok(r):
-                return (ft in (r["subject"] or "").lower()
-                        or ft in (r["from_addr"] or "").lower()
-                        or ft in (r["to_addrs"] or "").lower())
-            rows = [r for r in rows if ok(r)]
+        keep = self._current_mid() if reset else None
+        if reset:
+            tbl.clear()
+            self._order.clear()
+            self._rows.clear()
+        self._add_rows(rows)
+        self._next_cursor = next_cursor
+        self._floor = _order_key(rows[-1]) if next_cursor and rows else None
+        if reset:
+            if not self._restore_cursor(keep) and tbl.row_count:
+                tbl.move_cursor(row=0)
+            mid = self._current_mid()
+            if mid:
+                self.show_preview(mid)
+            else:
+                self.query_one("#preview_text", Static).update("No messages.")
 
+    def _add_rows(self, rows: list[dict]) -> int:
+        tbl = self.query_one("#table", DataTable)
+        added = 0
         for r in rows:
+            if r["id"] in self._order:
+                continue
+            self._order[r["id"]] = _order_key(r)
+            self._rows[r["id"]] = r
             rec = r.get("received_at")
             received_str = rec.strftime("%Y-%m-%d %H:%M:%S") if hasattr(rec, "strftime") else str(rec or "")
             tbl.add_row(
                 received_str,
-                r.get("from_addr", "") or "",
-                r.get("to_addrs", "") or "",
-                (r.get("subject", "") or "")[:120],
+                r.get("display_from") or "",
+                r.get("display_to") or "",
+                (f"({r['count']}) " if r.get("count", 1) > 1 else "") + (r.get("subject", "") or "")[:120],
                 str(r.get("size", 0)),
                 r["id"],
+                key=r["id"],
             )
+            added += 1
+        return added
 
-        if status:
-            self.set_status(status)
-        if rows:
-            tbl.cursor_coordinate = (0, 0)
-            self.show_preview(rows[0]["id"])
+    def _merge_rows(self, rows: list[dict]) -> None:
+        """Insert arrivals at their sorted position without a reload."""
+        if self._floor is not None:
+            # older than what is loaded: the next page will bring them
+            rows = [r for r in rows if _order_key(r) > self._floor]
+        rows = sorted((r for r in rows if r["id"] not in self._order), key=_order_key, reverse=True)
+        if not rows:
+            return
+        keep = self._current_mid()
+        tbl = self.query_one("#table", DataTable)
+        loaded = [tbl.ordered_rows[i].key for i in range(tbl.row_count)]
+        added = self._add_rows(rows)
+        # the listing is already newest first: walk it once, splicing each
+        # arrival in ahead of the first older row, instead of re-sorting
+        # every row. DataTable has no positional insert, so set the row
+        # positions the way its own sort() does.
+        merged, i = [], 0
+        for r in rows:
+            new = _order_key(r)
+            while i < len(loaded) and self._order[loaded[i].value] > new:
+                merged.append(loaded[i])
+                i += 1
+            merged.append(tbl.rows[r["id"]].key)
+        merged.extend(loaded[i:])
+        tbl._row_locations = type(tbl._row_locations)({key: n for n, key in enumerate(merged)})
+        tbl._update_count += 1
+        tbl.refresh()
+        if not self._restore_cursor(keep) and tbl.row_count:
+            tbl.move_cursor(row=0)
+            self.show_preview(self._current_mid())
+        self.set_status(f"{added} new message{'s' if added != 1 else ''}")
+
+    def _remove_rows(self, mids: list[str], status: str) -> None:
+        tbl = self.query_one("#table", DataTable)
+        for mid in mids:
+            self._rows.pop(mid, None)
+            if self._order.pop(mid, None) is not None:
+                tbl.remove_row(mid)
+        if tbl.row_count:
+            tbl.move_cursor(row=min(tbl.cursor_row, tbl.row_count - 1))
+        self.set_status(status)
+        mid = self._current_mid()
+        if mid:
+            self.show_preview(mid)
+
+    @work(exclusive=True, group="feed")
+    async def _follow(self) -> None:
+        """Merge newly received messages as the change feed reports them."""
+        with bus.subscribe() as sub:
+            while True:
+                events = [await sub.get()]
+                await asyncio.sleep(self.FEED_COALESCE)
+                while not sub.queue.empty():
+                    events.append(sub.queue.get_nowait())
+                generation, filters = self._generation, self._filters()
+                if filters is None:
+                    continue
+                if self._grouping:
+                    # arrivals move groups and change their counts: re-read
+                    # the first page rather than patching rows in place
+                    if not self._paging:
+                        self.load_rows()
+                    continue
+                rows = await self.app.store.amessages_by_id([ev["id"] for ev in events], **filters)
+                # a reset since the query already picked these up
+                if generation == self._generation and not self._paging:
+                    self._merge_rows(rows)
+
+    # -- writes ----------------------------------------------------------
+
+    @work(thread=True, group="write")
+    def _delete(self, mid: str) -> None:
+        if self.app.store.delete_message(mid):
+            self.app.call_from_thread(self._remove_rows, [mid], f"deleted {mid}")
+
+    @work(thread=True, group="write")
+    def _purge(self, filters: dict) -> None:
+        try:
+            deleted, freed = self.app.store.purge(**filters)
+        except ValueError as e:
+            self.app.call_from_thread(self.set_status, str(e))
+            return
+        self.app.call_from_thread(self.load_rows, f"purged {deleted} messages ({freed} bytes)")
+
+    @work(thread=True, group="write")
+    def _export_all(self, filters: dict) -> None:
+        dest = Path(self.app.export_dir)
+        dest.mkdir(parents=True, exist_ok=True)
+        path = dest / f"messages-{datetime.utcnow():%Y%m%dT%H%M%S}.mbox"
+        with open(path, "wb") as f:
+            for chunk in iter_export(self.app.store.ReadSession, archive.FORMAT_MBOX, message_filters(**filters)):
+                f.write(chunk)
+        self.app.call_from_thread(self.set_status, f"exported -> {path}")
 
     def show_preview(self, mid: str) -> None:
-        info = self.app.store.get_message(mid)
+        # the header comes from the list row straight away; the body needs
+        # the .eml and follows from a worker
+        row = self._rows.get(mid)
+        if row:
+            sent = row.get("sent_at") or row.get("received_at")
+            sent_str = sent.strftime("%Y-%m-%d %H:%M:%S") if hasattr(sent, "strftime") else ""
+            self.query_one("#preview_text", Static).update(
+                f"[b]ID[/b]: {mid}\nFrom: {row.get('display_from') or ''}\nTo: {row.get('display_to') or ''}\n"
+                f"Date: {sent_str}\nSubject: {row.get('subject') or ''}\n"
+                f"Parts: {row.get('part_count') if row.get('part_count') is not None else '?'}\n"
+                + (f"Group: {row['count']} messages ({self._grouping})\n" if self._grouping and "count" in row else "")
+                + "\n"
+                f"{row.get('snippet') or ''}"
+            )
+        self._load_preview(mid)
+
+    @work(thread=True, exclusive=True, group="preview")
+    def _load_preview(self, mid: str) -> None:
+        parsed = self.app.store.get_parsed(mid)
+        if not get_current_worker().is_cancelled:
+            self.app.call_from_thread(self._render_preview, mid, parsed)
+
+    def _render_preview(self, mid: str, parsed) -> None:
         preview = self.query_one("#preview_text", Static)
-        if not info:
+        if not parsed:
             preview.update("Message not found.")
             return
-        headers, body = read_text_part(info["eml_path"])
-        header_text = "\n".join(f"{k}: {v}" for k, v in headers.items())
-        preview.update(f"[b]ID[/b]: {info['id']}\n{header_text}\n\n[b]Body:[/b]\n{body[:5000]}")
+        header_text = "\n".join(f"{k}: {v}" for k, v in parsed.headers.items())
+        preview.update(f"[b]ID[/b]: {mid}\n{header_text}\n\n[b]Body:[/b]\n{parsed.text[:5000]}")
 
     def set_status(self, msg: str) -> None:
         self.query_one("#status", Static).update(msg)
+
+
+def _order_key(row: dict) -> tuple:
+    return (row.get("received_at") or datetime.min, row["id"])
@@ -1,28 +1,128 @@
-import os
+import json, os, shlex
+from datetime import datetime, timedelta
 from email import policy
 from email.parser import BytesParser
+from app.constants import ingest, retention
+
+try:
+    import orjson
+except ImportError:  # optional speedup; the stdlib encoder is the fallback
+    orjson = None
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+def loads(data: bytes | str):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def text_body(msg) -> str:
+    """Best text body of a message parsed with ``policy.default``: the first
+    text/plain part, else the first text/* part."""
+    if not msg.is_multipart():
+        return msg.get_content() if msg.get_content_maintype() == "text" else ""
+    for part in msg.walk():
+        if part.get_content_type() == "text/plain":
+            return part.get_content()
+    for part in msg.walk():
+        if part.get_content_maintype() == "text":
+            return part.get_content()
+    return ""
+
+def html_body(msg) -> str:
+    for part in msg.walk():
+        if part.get_content_type() == "text/html":
+            return part.get_content()
+    return ""
+
+def part_tree(msg) -> list[dict]:
+    """Leaf MIME parts in walk order with their decoded sizes."""
+    parts = []
+    for part in msg.walk():
+        if part.is_multipart():
+            continue
+        payload = part.get_payload(decode=True) or b""
+        parts.append({
+            "index": len(parts),
+            "content_type": part.get_content_type(),
+            "filename": part.get_filename(),
+            "disposition": part.get_content_disposition(),
+            "size": len(payload),
+        })
+    return parts
 
 def read_text_part(eml_path: str) -> tuple[dict, str]:
     headers, body = {}, ""
     if not eml_path or not os.path.exists(eml_path):
         return headers, body
-    with open(eml_path, "rb") as f:
+    from app.blobs import open_eml   # blobs needs the models; utils must not
+    with open_eml(eml_path) as f:
         msg = BytesParser(policy=policy.default).parse(f)
     for k in ("From", "To", "Subject", "Date", "Message-ID"):
         v = msg.get(k)
         if v:
             headers[k] = str(v)
-    if msg.is_multipart():
-        for part in msg.walk():
-            if part.get_content_type() == "text/plain":
-                body = part.get_content()
-                break
-        if not body:
-            for part in msg.walk():
-                if part.get_content_maintype() == "text":
-                    body = part.get_content()
-                    break
-    else:
-        if msg.get_content_maintype() == "text":
-            body = msg.get_content()
+    body = text_body(msg)
     return headers, body or ""
+
+_SEARCH_KEYS = {"from": "from_addr", "to": "to_addr", "subject": "subject", "ns": "namespace",
+                "thread": "thread_id", "dup": "dup_key"}
+
+def parse_search(text: str) -> dict:
+    """Split a search box string into Store.search_messages filters.
+
+    Supports ``from:``, ``to:``, ``subject:``, ``ns:``, ``thread:``, ``dup:``,
+    ``after:YYYY-MM-DD``, ``before:YYYY-MM-DD`` and ``has:attachment``;
+    anything else is free text matched against subject/from/to.
+    """
+    try:
+        tokens = shlex.split(text or "")
+    except ValueError:
+        tokens = (text or "").split()
+    filters, free = {}, []
+    for tok in tokens:
+        key, sep, val = tok.partition(":")
+        key = key.lower()
+        if sep and val and key in _SEARCH_KEYS:
+            filters[_SEARCH_KEYS[key]] = val
+        elif sep and key in ("after", "before"):
+            try:
+                when = datetime.strptime(val, "%Y-%m-%d")
+            except ValueError:
+                free.append(tok)
+                continue
+            filters["since" if key == "after" else "until"] = when
+        elif sep and key == "has" and val.lower().startswith("attachment"):
+            filters["has_attachments"] = True
+        else:
+            free.append(tok)
+    if free:
+        filters["text"] = " ".join(free)
+    return filters
+
+def parse_age(value: str) -> timedelta:
+    """``7d`` / ``12h`` / ``30m`` / ``45s`` (or a bare number of days)."""
+    v = (value or "").strip().lower()
+    try:
+        if v and v[-1] in retention.AGE_UNITS:
+            return timedelta(seconds=float(v[:-1]) * retention.AGE_UNITS[v[-1]])
+        return timedelta(days=float(v))
+    except ValueError:
+        raise ValueError(f"invalid age: {value!r}") from None
+
+def normalize_address(addr: str) -> tuple[str, str]:
+    address = (addr or "").strip().strip("<>").lower()
+    return address, address.rpartition("@")[2]
+
+def normalize_namespace(value) -> str | None:
+    ns = str(value or "").strip().lower()[:ingest.NAMESPACE_MAX_LEN]
+    return ns or None
+
+def plus_tag(addr: str) -> str | None:
+    """``ci+run-42@example.com`` -> ``run-42``."""
+    local = (addr or "").rpartition("@")[0] if "@" in (addr or "") else ""
+    _, sep, tag = local.partition("+")
+    return normalize_namespace(tag) if sep else None
@@ -0,0 +1,730 @@
+"""Load generator and benchmarks for the sink.
+
+    python scripts/bench.py smtp --connections 32 --messages 5000 --json smtp.json
+    python scripts/bench.py query --sizes 10000,100000 --json query.json
+    python scripts/bench.py api --concurrency 64 --json api.json
+    python scripts/bench.py startup --repeat 5 --json startup.json
+    python scripts/bench.py replay --messages 1m --connections 16 --json replay.json
+    python scripts/bench.py compare old.json new.json
+    python scripts/bench.py smoke            # the old smoke_send.py: 10 mails to :1025
+
+``smtp`` starts an in-process SinkHandler on a free port unless --target is
+given, then drives it with aiosmtplib over N persistent connections.
+``query`` grows one database through the requested sizes and times Store and
+API reads at each. ``api`` serves the API from a uvicorn subprocess and
+compares requests/s of its async handlers with sync (threadpool) replicas
+of the same routes under concurrent clients. ``startup`` times each
+``mailgate`` command from spawn until it serves (or paints), and exits 1 if
+a median is over its budget. ``replay`` writes an ingest log and re-delivers
+it with the relay to a counting stand-in server (or to --target). Results are JSON so runs from two versions can
+be diffed with ``compare``.
+"""
+from __future__ import annotations
+import argparse, asyncio, json, multiprocessing, os, platform, random, socket, string, subprocess, sys, tempfile, time, uuid
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import aiosmtplib
+
+DEFAULT_SIZES = "2k:70,32k:20,512k:8,4m:2"    # body/attachment size : weight
+DEFAULT_FANOUT = "1:80,3:15,20:5"             # recipients per message : weight
+MESSAGE_POOL = 200                            # distinct messages generated up front
+DOMAINS = 20
+# median ms from spawn to ready, per mailgate command; scale with --budget-scale
+STARTUP_BUDGET_MS = {"help": 150, "smtp": 800, "api": 1300, "all": 1400, "tui": 650}
+
+
+def parse_size(v: str) -> int:
+    v = v.strip().lower()
+    mult = {"k": 1 << 10, "m": 1 << 20}.get(v[-1:], 1)
+    return int(float(v.rstrip("km")) * mult)
+
+def parse_count(v: str) -> int:
+    v = v.strip().lower()
+    mult = {"k": 1000, "m": 1000000}.get(v[-1:], 1)
+    return int(float(v.rstrip("km")) * mult)
+
+def parse_dist(spec: str, conv=int) -> list[tuple]:
+    """``"2k:70,4m:2"`` -> [(2048, 70), (4194304, 2)]"""
+    out = []
+    for item in spec.split(","):
+        value, _, weight = item.partition(":")
+        out.append((conv(value), float(weight or 1)))
+    return out
+
+def pick(dist: list[tuple], rng: random.Random):
+    values, weights = zip(*dist)
+    return rng.choices(values, weights)[0]
+
+def percentile(samples: list[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(q * len(s)))]
+
+def summarize(samples: list[float]) -> dict:
+    """Latency samples in seconds -> milliseconds."""
+    return {
+        "n": len(samples),
+        "mean_ms": round(1000 * sum(samples) / len(samples), 3) if samples else 0.0,
+        "p50_ms": round(1000 * percentile(samples, 0.50), 3),
+        "p99_ms": round(1000 * percentile(samples, 0.99), 3),
+        "max_ms": round(1000 * max(samples), 3) if samples else 0.0,
+    }
+
+def environment() -> dict:
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=Path(__file__).parent).stdout.strip() or None
+    except OSError:
+        rev = None
+    return {
+        "git": rev,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "when": datetime.utcnow().isoformat(),
+    }
+
+def emit(result: dict, path: str | None) -> None:
+    text = json.dumps(result, indent=2)
+    if path:
+        Path(path).write_text(text)
+    print(text)
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# -- SMTP load ---------------------------------------------------------------
+
+def build_pool(n: int, sizes: list[tuple], fanout: list[tuple], attach_ratio: float,
+               seed: int) -> list[tuple[list[str], bytes]]:
+    rng = random.Random(seed)
+    pool = []
+    for i in range(n):
+        rcpts = [f"user{rng.randrange(1000)}@bench{rng.randrange(DOMAINS)}.test"
+                 for _ in range(pick(fanout, rng))]
+        size = pick(sizes, rng)
+        msg = EmailMessage()
+        msg["From"] = "bench@load.test"
+        msg["To"] = ", ".join(rcpts)
+        msg["Subject"] = f"bench {i} " + "".join(rng.choices(string.ascii_letters, k=12))
+        msg["Message-ID"] = f"<{uuid.uuid4()}@load.test>"
+        if rng.random() < attach_ratio:
+            msg.set_content("see attachment\n")
+            msg.add_attachment(rng.randbytes(size), maintype="application",
+                               subtype="octet-stream", filename=f"blob{i}.bin")
+        else:
+            words = " ".join(rng.choices(["alpha", "beta", "gamma", "delta", "report", "invoice"], k=size // 6))
+            msg.set_content(words[:size] + "\n")
+        pool.append((rcpts, msg.as_bytes()))
+    return pool
+
+async def drive(host: str, port: int, pool, connections: int, total: int, duration: float | None):
+    latencies: list[float] = []
+    errors: dict[str, int] = {}
+    sent = 0
+    sent_bytes = 0
+    deadline = time.perf_counter() + duration if duration else None
+
+    async def client(cid: int):
+        nonlocal sent, sent_bytes
+        smtp = aiosmtplib.SMTP(hostname=host, port=port, timeout=60)
+        await smtp.connect()
+        i = cid
+        try:
+            while True:
+                if deadline is not None:
+                    if time.perf_counter() >= deadline:
+                        return
+                elif sent >= total:
+                    return
+                sent += 1
+                rcpts, raw = pool[i % len(pool)]
+                i += connections
+                t0 = time.perf_counter()
+                try:
+                    await smtp.sendmail("bench@load.test", rcpts, raw)
+                except aiosmtplib.SMTPResponseException as e:
+                    errors[str(e.code)] = errors.get(str(e.code), 0) + 1
+                    continue
+                latencies.append(time.perf_counter() - t0)
+                sent_bytes += len(raw)
+        finally:
+            try:
+                await smtp.quit()
+            except aiosmtplib.SMTPException:
+                pass
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(c) for c in range(connections)))
+    return latencies, errors, sent_bytes, time.perf_counter() - started
+
+def cmd_smtp(args) -> None:
+    pool = build_pool(args.pool, parse_dist(args.sizes, parse_size), parse_dist(args.fanout),
+                      args.attach_ratio, args.seed)
+    controller = handler = None
+    if args.target:
+        host, _, port = args.target.rpartition(":")
+        port = int(port)
+    else:
+        from aiosmtpd.controller import Controller
+        from app.blobs import get_blob_store
+        from app.models import get_session_factory
+        from app.smtp import SinkHandler
+        workdir = Path(args.workdir or tempfile.mkdtemp(prefix="sink-bench-"))
+        host, port = "127.0.0.1", free_port()
+        handler = SinkHandler(
+            str(workdir), get_session_factory(str(workdir / "messages.db")),
+            publishers=[], blob_store=get_blob_store(str(workdir), args.blob_store, args.compress),
+            workers=args.ingest_workers, batch_size=args.batch_size,
+            max_latency=args.batch_latency_ms / 1000, durability=args.durability,
+        )
+        controller = Controller(handler, hostname=host, port=port, data_size_limit=0)
+        controller.start()
+    try:
+        latencies, errors, sent_bytes, elapsed = asyncio.run(
+            drive(host, port, pool, args.connections, args.messages, args.duration)
+        )
+    finally:
+        if controller is not None:
+            asyncio.run_coroutine_threadsafe(handler.pipeline.stop(), controller.loop).result()
+            controller.stop()
+    emit({
+        "benchmark": "smtp",
+        "env": environment(),
+        "params": {k: v for k, v in vars(args).items() if k != "func"},
+        "results": {
+            "accepted": len(latencies),
+            "rejected": errors,
+            "elapsed_s": round(elapsed, 3),
+            "msgs_per_s": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+            "mb_per_s": round(sent_bytes / elapsed / (1 << 20), 2) if elapsed else 0.0,
+            "latency": summarize(latencies),
+        },
+    }, args.json)
+
+
+# -- replay ------------------------------------------------------------------
+
+class _CountingServer:
+    """Stand-in relay target: accepts everything and stores nothing."""
+
+    def __init__(self):
+        self.received = 0
+        self.bytes = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        self.bytes += len(envelope.content)
+        return "250 OK"
+
+def write_log(directory: str, pool, total: int, segment_mb: int, batch: int = 1000) -> float:
+    from app.ingest_log import IngestLog, LogRecord
+    started = time.perf_counter()
+    ingest_log = IngestLog(directory, segment_bytes=segment_mb << 20)
+    now = datetime.utcnow()
+    for base in range(0, total, batch):
+        ingest_log.append([
+            LogRecord(uuid.uuid4().hex, now, "bench@load.test", *pool[i % len(pool)])
+            for i in range(base, min(total, base + batch))
+        ])
+    ingest_log.close()
+    return time.perf_counter() - started
+
+def cmd_replay(args) -> None:
+    from app.ingest_log import read_log
+    from app.relay import Relay, log_envelopes
+    pool = build_pool(args.pool, parse_dist(args.sizes, parse_size), parse_dist(args.fanout),
+                      args.attach_ratio, args.seed)
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="replay-bench-"))
+    log_dir = str(workdir / "ingest-log")
+    write_s = write_log(log_dir, pool, args.messages, args.segment_mb)
+    started = time.perf_counter()
+    read_bytes = sum(len(r.data) for r in read_log(log_dir))
+    read_s = time.perf_counter() - started
+
+    controller = counter = None
+    if args.target:
+        host, _, port = args.target.rpartition(":")
+        port = int(port)
+    else:
+        from aiosmtpd.controller import Controller
+        host, port, counter = "127.0.0.1", free_port(), _CountingServer()
+        controller = Controller(counter, hostname=host, port=port, data_size_limit=0)
+        controller.start()
+    try:
+        stats = Relay(host, port, connections=args.connections, rate=args.rate).run(log_envelopes(log_dir))
+    finally:
+        if controller is not None:
+            controller.stop()
+    results = stats.as_dict()
+    results.update(
+        mb_per_s=round(stats.bytes / stats.elapsed / (1 << 20), 2) if stats.elapsed else 0.0,
+        log_write_msgs_per_s=round(args.messages / write_s, 1) if write_s else 0.0,
+        log_read_mb_per_s=round(read_bytes / read_s / (1 << 20), 2) if read_s else 0.0,
+    )
+    if counter is not None:
+        results["target_received"] = counter.received
+    emit({
+        "benchmark": "replay",
+        "env": environment(),
+        "params": {k: v for k, v in vars(args).items() if k != "func"},
+        "results": results,
+    }, args.json)
+
+
+# -- query latency -----------------------------------------------------------
+
+def populate(store, start: int, stop: int, batch: int = 5000) -> None:
+    """Rows only (no .eml files), with recipients, search documents and
+    groups: threads of four, and resends of a few hundred templates."""
+    from types import SimpleNamespace
+    from sqlalchemy import insert
+    from app.models import Message, Recipient, add_to_groups, group_key
+    from app.models.fts import index_documents
+    from app.ingest_rows import recipient_rows
+    from app.constants.database import fts
+    rng = random.Random(start)
+    base = datetime(2024, 1, 1)
+    for lo in range(start, stop, batch):
+        msgs, rcpts, docs = [], [], []
+        for i in range(lo, min(stop, lo + batch)):
+            mid = str(uuid.uuid4())
+            to = f"user{rng.randrange(1000)}@bench{rng.randrange(DOMAINS)}.test"
+            received = base + timedelta(seconds=i)
+            kind = rng.choice(['report', 'invoice', 'welcome', 'reset'])
+            subject = f"bench {i} {kind}"
+            msgs.append({"id": mid, "received_at": received, "from_addr": "bench@load.test",
+                         "to_addrs": json.dumps([to]), "subject": subject, "message_id": f"<{mid}@load.test>",
+                         "size_bytes": 2048, "has_attachments": i % 7 == 0, "eml_path": "", "namespace": None,
+                         "thread_id": group_key(None, f"<t{i // 4}@load.test>"),
+                         "dup_key": group_key(None, kind, str(rng.randrange(300)))})
+            rcpts.extend(recipient_rows(mid, received, [to]))
+            docs.append({fts.COL_MESSAGE_ID: mid, fts.COL_SUBJECT: subject, fts.COL_FROM_ADDR: "bench@load.test",
+                         fts.COL_TO_ADDRS: to, fts.COL_BODY: subject})
+        with store.Session() as s:
+            s.execute(insert(Message), msgs)
+            s.execute(insert(Recipient), rcpts)
+            add_to_groups(s, [SimpleNamespace(**m) for m in msgs])
+            index_documents(s, docs)
+            s.commit()
+
+def timeit(fn, repeat: int) -> dict:
+    fn()  # warm caches and the connection pool
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return summarize(samples)
+
+def query_cases(store, client, auth) -> dict:
+    def deep_page():
+        cursor = None
+        for _ in range(10):
+            _, cursor = store.search_messages(cursor=cursor, limit=100)
+    cases = {
+        "store_list_500": lambda: list(store.list_messages(500)),
+        "store_first_page": lambda: store.search_messages(limit=100),
+        "store_tenth_page": deep_page,
+        "store_filter_to": lambda: store.search_messages(to_addr="user7@bench3.test", limit=100),
+        "store_filter_domain": lambda: store.search_messages(to_addr="@bench3.test", limit=100),
+        "store_filter_text": lambda: store.search_messages("invoice", limit=100),
+        "store_fts": lambda: store.search_text("invoice", limit=50),
+        "store_mailbox": lambda: store.mailbox_messages("user7@bench3.test", limit=100),
+        "store_threads_first_page": lambda: store.group_messages("thread", limit=100),
+        "store_dups_first_page": lambda: store.group_messages("dup", limit=100),
+    }
+    if client is not None:
+        cases["api_list_100"] = lambda: client.get("/messages", headers=auth, params={"limit": 100}).content
+        cases["api_list_1000_ndjson"] = lambda: client.get(
+            "/messages", headers=auth, params={"limit": 1000, "format": "ndjson"}).content
+        cases["api_threads_100"] = lambda: client.get("/threads", headers=auth, params={"limit": 100}).content
+    return cases
+
+def cmd_query(args) -> None:
+    from app.models import get_async_session_factory, get_session_factory
+    from app.storage import Store
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="sink-bench-"))
+    db = str(workdir / "messages.db")
+    store = Store(db, str(workdir / "store"))
+    client = auth = None
+    try:
+        from fastapi.testclient import TestClient
+        import app.api as api
+        api.Session = get_session_factory(db)
+        api.ReadSession = get_session_factory(db, readonly=True, init=False)
+        api.AsyncReadSession = get_async_session_factory(db, readonly=True)
+        client, auth = TestClient(api.app), {"Authorization": f"Bearer {api.API_TOKEN}"}
+    except ImportError:
+        print("httpx not installed; skipping API cases", file=sys.stderr)
+
+    results, have = {}, 0
+    for size in sorted(parse_count(s) for s in args.sizes.split(",")):
+        t0 = time.perf_counter()
+        populate(store, have, size)
+        have = size
+        print(f"{size} rows ({time.perf_counter() - t0:.1f}s to insert)", file=sys.stderr)
+        results[str(size)] = {name: timeit(fn, args.repeat) for name, fn in query_cases(store, client, auth).items()}
+    emit({
+        "benchmark": "query",
+        "env": environment(),
+        "params": {k: v for k, v in vars(args).items() if k != "func"},
+        "results": results,
+    }, args.json)
+
+
+# -- API throughput ----------------------------------------------------------
+
+API_CASES = {
+    "list_100": lambda ids, i: ("/messages", {"limit": 100}),
+    "mailbox": lambda ids, i: (f"/mailboxes/user{i % 1000}@bench3.test/messages", {"limit": 50}),
+    "body": lambda ids, i: (f"/messages/{ids[i % len(ids)]}/body", None),
+    "raw": lambda ids, i: (f"/messages/{ids[i % len(ids)]}/raw", None),
+}
+
+def serve_api(db: str, data_dir: str, port: int, max_concurrency: int) -> None:
+    """Subprocess body: the real app, plus the sync handlers it replaced
+    mounted under /sync so both run in the same server."""
+    os.environ.update(DB_PATH=db, DATA_DIR=data_dir, API_MAX_CONCURRENCY=str(max_concurrency),
+                      NOTIFY_MODE="local", METRICS_ENABLED="0")
+    import uvicorn
+    from fastapi import APIRouter, Header, HTTPException, Query
+    from fastapi.responses import FileResponse, StreamingResponse
+    from sqlalchemy import select
+    import app.api as api
+    from app.models import Message
+    from app.storage import mailbox_page_query, page_query, split_page
+
+    sync = APIRouter(prefix="/sync")
+
+    def eml_path(mid):
+        with api.ReadSession() as s:
+            path = s.execute(select(Message.eml_path).where(Message.id == mid)).scalar()
+        if not path:
+            raise HTTPException(404, "Not found")
+        return path
+
+    @sync.get("/messages")
+    def list_messages(authorization: str | None = Header(None), limit: int = Query(100)):
+        api._auth(authorization)
+        with api.ReadSession() as s:
+            rows, _ = split_page(s.execute(page_query(api.LIST_COLUMNS, None, limit=limit)).all(), limit)
+        return StreamingResponse(api._stream(rows, "json"), media_type="application/json")
+
+    @sync.get("/mailboxes/{address}/messages")
+    def mailbox_messages(address: str, authorization: str | None = Header(None), limit: int = Query(100)):
+        api._auth(authorization)
+        with api.ReadSession() as s:
+            keys, _ = split_page(s.execute(mailbox_page_query(address, limit=limit)).all(), limit)
+            rows = s.execute(select(*api.LIST_COLUMNS).where(Message.id.in_([k.id for k in keys]))).all()
+        return StreamingResponse(api._stream(rows, "json"), media_type="application/json")
+
+    @sync.get("/messages/{mid}/body")
+    def body(mid: str, authorization: str | None = Header(None)):
+        api._auth(authorization)
+        parsed = api.parsed_cache.lookup(mid) or api.parsed_cache.load(mid, eml_path(mid))
+        return {"id": mid, "headers": parsed.headers, "text": parsed.text, "html": parsed.html}
+
+    @sync.get("/messages/{mid}/raw")
+    def raw(mid: str, authorization: str | None = Header(None)):
+        api._auth(authorization)
+        return FileResponse(eml_path(mid), media_type="message/rfc822", filename=f"{mid}.eml")
+
+    api.app.include_router(sync)
+    uvicorn.run(api.app, host="127.0.0.1", port=port, log_level="warning")
+
+def write_emls(store, count: int) -> list[str]:
+    """Give the newest ``count`` rows a real .eml so body/raw have something to read."""
+    from sqlalchemy import select, update
+    from app.models import Message
+    rng = random.Random(count)
+    with store.Session() as s:
+        ids = s.execute(select(Message.id).order_by(Message.received_at.desc()).limit(count)).scalars().all()
+        for mid in ids:
+            msg = EmailMessage()
+            msg["From"], msg["To"], msg["Subject"] = "bench@load.test", "user7@bench3.test", f"bench {mid}"
+            msg.set_content(" ".join(rng.choices(["alpha", "beta", "report", "invoice"], k=4000)) + "\n")
+            path = store.store_dir / f"{mid}.eml"
+            path.write_bytes(msg.as_bytes())
+            s.execute(update(Message).where(Message.id == mid).values(eml_path=str(path)))
+        s.commit()
+    return list(ids)
+
+async def hammer(base: str, auth: dict, case, ids: list[str], concurrency: int, total: int) -> dict:
+    import httpx
+    samples, errors, issued = [], 0, 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base, headers=auth, limits=limits, timeout=60) as client:
+        async def worker():
+            nonlocal errors, issued
+            while issued < total:
+                i, issued = issued, issued + 1
+                path, params = case(ids, i)
+                t0 = time.perf_counter()
+                r = await client.get(path, params=params)
+                samples.append(time.perf_counter() - t0)
+                errors += r.status_code != 200
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - t0
+    return {"req_per_s": round(total / elapsed, 1), "errors": errors, **summarize(samples)}
+
+def cmd_api(args) -> None:
+    from app.storage import Store
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="sink-bench-"))
+    db = str(workdir / "messages.db")
+    store = Store(db, str(workdir / "store"))
+    populate(store, 0, parse_count(args.rows))
+    ids = write_emls(store, args.emls)
+    port = free_port()
+    server = multiprocessing.get_context("spawn").Process(
+        target=serve_api, args=(db, str(workdir), port, args.max_concurrency), daemon=True)
+    server.start()
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline or not server.is_alive():
+                    sys.exit("API server did not start")
+                time.sleep(0.1)
+        auth = {"Authorization": f"Bearer {os.getenv('API_TOKEN', 'change_me')}"}
+        results = {}
+        for name in args.cases.split(","):
+            case = API_CASES[name]
+            for mode, prefix in (("async", ""), ("sync", "/sync")):
+                base = f"http://127.0.0.1:{port}{prefix}"
+                asyncio.run(hammer(base, auth, case, ids, args.concurrency, args.concurrency))  # warm up
+                results.setdefault(name, {})[mode] = r = asyncio.run(
+                    hammer(base, auth, case, ids, args.concurrency, args.requests))
+                print(f"{name:10} {mode:5} {r['req_per_s']:>9} req/s  p50 {r['p50_ms']} ms  "
+                      f"p99 {r['p99_ms']} ms  errors {r['errors']}", file=sys.stderr)
+    finally:
+        server.terminate()
+        server.join()
+    emit({
+        "benchmark": "api",
+        "env": environment(),
+        "params": {k: v for k, v in vars(args).items() if k != "func"},
+        "results": results,
+    }, args.json)
+
+
+# -- startup time ------------------------------------------------------------
+
+TUI_PROBE = """
+import sys
+from app.tui.__main__ import SinkTUI
+
+async def painted(pilot):
+    # called once the first screen is up; the store may still be opening
+    print("ready", flush=True)
+    pilot.app.exit()
+
+SinkTUI(sys.argv[1], sys.argv[2]).run(headless=True, auto_pilot=painted)
+"""
+
+def _reachable(port: int) -> bool:
+    try:
+        socket.create_connection(("127.0.0.1", port), timeout=1).close()
+        return True
+    except OSError:
+        return False
+
+def time_start(cmd: list[str], cwd: Path, ports: list[int] = (), timeout: float = 30.0) -> float:
+    """Seconds from spawn until every port accepts, or, with no ports,
+    until the process prints a line (tui probe) or exits (--help)."""
+    env = {**os.environ, "PYTHONPATH": str(Path(__file__).resolve().parent.parent), "METRICS_ENABLED": "0"}
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        if not ports:
+            proc.stdout.readline()
+            return time.perf_counter() - t0
+        pending = list(ports)
+        while pending:
+            if proc.poll() is not None or time.perf_counter() - t0 > timeout:
+                raise RuntimeError(f"{' '.join(cmd)} did not come up")
+            if _reachable(pending[0]):
+                pending.pop(0)
+            else:
+                time.sleep(0.005)
+        return time.perf_counter() - t0
+    finally:
+        proc.terminate()
+        proc.wait()
+
+def cmd_startup(args) -> None:
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="sink-bench-"))
+    cli = [sys.executable, "-m", "app.cli"]
+    results, over = {}, []
+    for name in args.commands.split(","):
+        samples = []
+        for i in range(args.repeat):
+            run_dir = workdir / (f"{name}-{i}" if args.fresh else "shared")
+            run_dir.mkdir(parents=True, exist_ok=True)
+            db, store = str(run_dir / "messages.db"), str(run_dir / "store")
+            smtp_port, api_port = free_port(), free_port()
+            storage = ["--db", db, "--store-dir", store]
+            cmd, ports = {
+                "help": (cli + ["--help"], []),
+                "smtp": (cli + ["smtp", "--port", str(smtp_port), *storage], [smtp_port]),
+                "api": (cli + ["api", "--port", str(api_port), "--log-level", "warning", *storage], [api_port]),
+                "all": (cli + ["all", "--port", str(smtp_port), "--api-port", str(api_port),
+                               "--log-level", "warning", *storage], [smtp_port, api_port]),
+                "tui": ([sys.executable, "-c", TUI_PROBE, db, store], []),
+            }[name]
+            samples.append(time_start(cmd, run_dir, ports))
+        results[name] = summarize(samples)
+        budget = STARTUP_BUDGET_MS[name] * args.budget_scale
+        results[name]["budget_ms"] = budget
+        if results[name]["p50_ms"] > budget:
+            over.append(name)
+        print(f"{name:5} p50 {results[name]['p50_ms']:8.1f} ms  max {results[name]['max_ms']:8.1f} ms  "
+              f"budget {budget:.0f} ms{'  OVER' if name in over else ''}", file=sys.stderr)
+    emit({
+        "benchmark": "startup",
+        "env": environment(),
+        "params": {k: v for k, v in vars(args).items() if k != "func"},
+        "results": results,
+    }, args.json)
+    sys.exit(1 if over else 0)
+
+
+# -- comparison --------------------------------------------------------------
+
+def _flatten(results: dict, prefix: str = "") -> dict[str, float]:
+    out = {}
+    for k, v in results.items():
+        key = f"{prefix}{k}"
+        if isinstance(v, dict):
+            out.update(_flatten(v, key + "."))
+        elif isinstance(v, (int, float)):
+            out[key] = v
+    return out
+
+def cmd_compare(args) -> None:
+    old, new = (json.loads(Path(p).read_text()) for p in (args.old, args.new))
+    a, b = _flatten(old["results"]), _flatten(new["results"])
+    regressions = 0
+    for key in sorted(a.keys() & b.keys()):
+        if not key.endswith(("_ms", "msgs_per_s", "mb_per_s", "req_per_s")) or key.endswith("budget_ms") or not a[key]:
+            continue
+        change = (b[key] - a[key]) / a[key] * 100
+        # latency going up or throughput going down is a regression
+        worse = change > args.threshold if key.endswith("_ms") else change < -args.threshold
+        regressions += worse
+        print(f"{'REGRESSION ' if worse else '           '}{key:60} {a[key]:>12} -> {b[key]:>12} ({change:+.1f}%)")
+    sys.exit(1 if regressions else 0)
+
+
+# -- smoke -------------------------------------------------------------------
+
+def cmd_smoke(args) -> None:
+    async def run():
+        rng = random.Random()
+        async with aiosmtplib.SMTP(hostname=args.host, port=args.port) as smtp:
+            for i in range(args.count):
+                msg = EmailMessage()
+                msg["From"] = "dev@local"
+                msg["To"] = rng.choice(["test1@example.com", "test2@example.com", "test3@example.com"])
+                msg["Subject"] = f"Smoke Test {i + 1}/{args.count} - " + "".join(rng.choices(string.ascii_letters, k=8))
+                msg.set_content(f"This is automated test message #{i + 1}.\n")
+                await smtp.send_message(msg)
+                print(f"Sent email {i + 1} to {msg['To']} with subject: '{msg['Subject']}'")
+    asyncio.run(run())
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(required=True)
+
+    p = sub.add_parser("smtp", help="sustained accept rate and latency")
+    p.add_argument("--target", help="host:port of a running sink (default: in-process SinkHandler)")
+    p.add_argument("--connections", type=int, default=16)
+    p.add_argument("--messages", type=int, default=2000)
+    p.add_argument("--duration", type=float, help="run for this many seconds instead of --messages")
+    p.add_argument("--sizes", default=DEFAULT_SIZES, help="size:weight list, e.g. 2k:70,4m:2")
+    p.add_argument("--attach-ratio", type=float, default=0.3, help="share of messages carrying the size as an attachment")
+    p.add_argument("--fanout", default=DEFAULT_FANOUT, help="recipients:weight list")
+    p.add_argument("--pool", type=int, default=MESSAGE_POOL)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--workdir", help="in-process sink data directory (default: a temp dir)")
+    p.add_argument("--ingest-workers", type=int, default=4)
+    p.add_argument("--batch-size", type=int, default=200)
+    p.add_argument("--batch-latency-ms", type=float, default=50)
+    p.add_argument("--durability", default="commit")
+    p.add_argument("--blob-store", default="flat")
+    p.add_argument("--compress", default="none")
+    p.add_argument("--json", help="also write the result here")
+    p.set_defaults(func=cmd_smtp)
+
+    p = sub.add_parser("replay", help="ingest log write/read rate and relay msgs/s to a stand-in server")
+    p.add_argument("--target", help="host:port to relay to (default: an in-process counting server)")
+    p.add_argument("--messages", type=parse_count, default=20000)
+    p.add_argument("--connections", type=int, default=16)
+    p.add_argument("--rate", type=float, default=0.0, help="relay rate limit, msgs/s (0: unlimited)")
+    p.add_argument("--segment-mb", type=int, default=256)
+    p.add_argument("--sizes", default="2k:90,32k:10", help="size:weight list")
+    p.add_argument("--attach-ratio", type=float, default=0.0)
+    p.add_argument("--fanout", default=DEFAULT_FANOUT, help="recipients:weight list")
+    p.add_argument("--pool", type=int, default=MESSAGE_POOL)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--workdir")
+    p.add_argument("--json")
+    p.set_defaults(func=cmd_replay)
+
+    p = sub.add_parser("query", help="list/search/API latency by database size")
+    p.add_argument("--sizes", default="10k,100k", help="comma list of row counts, e.g. 10k,100k,1m")
+    p.add_argument("--repeat", type=int, default=20)
+    p.add_argument("--workdir")
+    p.add_argument("--json")
+    p.set_defaults(func=cmd_query)
+
+    p = sub.add_parser("api", help="requests/s of the async handlers vs sync replicas")
+    p.add_argument("--rows", default="50k")
+    p.add_argument("--emls", type=int, default=200, help="rows given a real .eml for body/raw")
+    p.add_argument("--cases", default=",".join(API_CASES))
+    p.add_argument("--concurrency", type=int, default=64)
+    p.add_argument("--requests", type=int, default=2000, help="per case and mode")
+    p.add_argument("--max-concurrency", type=int, default=0, help="API_MAX_CONCURRENCY for the server")
+    p.add_argument("--workdir")
+    p.add_argument("--json")
+    p.set_defaults(func=cmd_api)
+
+    p = sub.add_parser("startup", help="spawn-to-ready time of each mailgate command, against a budget")
+    p.add_argument("--commands", default=",".join(STARTUP_BUDGET_MS))
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--fresh", action="store_true", help="a new database per run instead of one reused one")
+    p.add_argument("--budget-scale", type=float, default=1.0, help="multiply every budget, for slow machines")
+    p.add_argument("--workdir")
+    p.add_argument("--json")
+    p.set_defaults(func=cmd_startup)
+
+    p = sub.add_parser("compare", help="diff two result files; exit 1 on regressions")
+    p.add_argument("old")
+    p.add_argument("new")
+    p.add_argument("--threshold", type=float, default=10.0, help="percent change tolerated")
+    p.set_defaults(func=cmd_compare)
+
+    p = sub.add_parser("smoke", help="send a few messages to a running sink")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=1025)
+    p.add_argument("--count", type=int, default=10)
+    p.set_defaults(func=cmd_smoke)
+
+    args = ap.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import json
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("httpx")  # required by fastapi.testclient
+from app.ingest import IngestPipeline, Pending
+from app.models import Message
+
+AUTH = {"Authorization": "Bearer change_me"}
+BASE = datetime(2024, 1, 1, 12, 0, 0)
+
+def add_messages(Session, n: int, start: int = 0, namespace: str | None = None):
+    with Session() as s:
+        for i in range(start, start + n):
+            s.add(Message(
+                id=str(uuid.uuid4()),
+                received_at=BASE + timedelta(seconds=i),
+                from_addr="a@b",
+                to_addrs=json.dumps([f"user{i}@example.com"]),
+                subject=f"msg {i}",
+                size_bytes=10,
+                has_attachments=0,
+                namespace=namespace,
+            ))
+        s.commit()
+
+def test_cursor_pagination_walks_all_messages(api):
+    client, Session = api
+    add_messages(Session, 7)
+    seen, params = [], {"limit": 3}
+    while True:
+        r = client.get("/messages", headers=AUTH, params=params)
+        assert r.status_code == 200
+        seen.extend(r.json())
+        if "X-Next-Cursor" not in r.headers:
+            break
+        params = {"limit": 3, "cursor": r.headers["X-Next-Cursor"]}
+    assert [m["subject"] for m in seen] == [f"msg {i}" for i in range(6, -1, -1)]
+    assert seen[0]["to"] == ["user6@example.com"]
+    # stored without summaries: nulls until reindex fills them
+    assert (seen[0]["snippet"], seen[0]["part_count"], seen[0]["sent_at"]) == (None, None, None)
+
+def test_ndjson_format(api):
+    client, Session = api
+    add_messages(Session, 2)
+    r = client.get("/messages", headers=AUTH, params={"format": "ndjson"})
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(line)["subject"] for line in r.text.splitlines()] == ["msg 1", "msg 0"]
+
+def test_etag_returns_304_until_new_mail(api):
+    client, Session = api
+    add_messages(Session, 2)
+    etag = client.get("/messages", headers=AUTH).headers["ETag"]
+    r = client.get("/messages", headers={**AUTH, "If-None-Match": etag})
+    assert r.status_code == 304
+    add_messages(Session, 1, start=2)
+    r = client.get("/messages", headers={**AUTH, "If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["ETag"] != etag
+
+def test_limit_is_bounded_and_cursor_validated(api):
+    client, _ = api
+    assert client.get("/messages", headers=AUTH, params={"limit": 100000}).status_code == 422
+    assert client.get("/messages", headers=AUTH, params={"cursor": "garbage"}).status_code == 400
+
+def test_bulk_delete_by_age(api):
+    client, Session = api
+    add_messages(Session, 3)
+    assert client.delete("/messages", headers=AUTH).status_code == 400
+    r = client.delete("/messages", headers=AUTH, params={"older_than": "1d"})
+    assert r.json() == {"deleted": 3, "bytes": 30}
+    assert client.get("/messages", headers=AUTH).json() == []
+    add_messages(Session, 2)
+    r = client.delete("/messages", headers=AUTH, params={"all": "true"})
+    assert r.json() == {"deleted": 2, "bytes": 20}
+
+def test_metrics_endpoint_reports_request_latency(api):
+    client, Session = api
+    add_messages(Session, 1)
+    client.get("/messages", headers=AUTH)
+    r = client.get("/metrics", headers=AUTH)
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    assert 'mailgate_http_request_seconds_count{method="GET",route="/messages",status="200"}' in r.text
+    assert 'mailgate_parsed_cache{stat="max_bytes"}' in r.text
+    assert client.get("/metrics").status_code == 401
+
+def test_request_latency_is_skipped_when_metrics_are_off(api, monkeypatch):
+    from app import metrics
+    client, _ = api
+    monkeypatch.setattr(metrics, "enabled", False)
+    assert client.get("/duplicates", headers=AUTH).status_code == 200
+    monkeypatch.setattr(metrics, "enabled", True)
+    assert 'route="/duplicates"' not in client.get("/metrics", headers=AUTH).text
+
+def test_import_then_export_mbox(api, tmp_path, monkeypatch):
+    client, _ = api
+    import app.api as api_module
+    monkeypatch.setattr(api_module, "DATA_DIR", str(tmp_path / "store"))
+    mbox = b"".join(
+        b"From ci@build.test Fri Mar  1 09:0%d:00 2024\n" % i
+        + b"From: ci@build.test\nTo: qa@example.com\nSubject: run %d\n\n>From the log\n\n" % i
+        for i in range(3)
+    )
+    r = client.post("/messages/import", headers=AUTH, content=mbox)
+    assert r.json() == {"imported": 3, "failed": 0}
+    assert client.post("/messages/import", headers=AUTH, params={"format": "zip"}, content=mbox).status_code == 400
+
+    r = client.get("/messages/export", headers=AUTH, params={"to": "qa@example.com", "since": "2024-03-01T09:01:00"})
+    assert r.headers["content-type"] == "application/mbox"
+    assert r.headers["content-disposition"].endswith('.mbox"')
+    assert r.content == mbox[mbox.index(b"From ci@build.test Fri Mar  1 09:01"):]
+
+    hits = client.get("/messages/search", headers=AUTH, params={"q": "run 2"}).json()
+    assert hits[0]["subject"] == "run 2" and hits[0]["to"] == ["qa@example.com"]
+    assert hits[0]["part_count"] == 1 and "rank" in hits[0] and "snippet" in hits[0]
+
+def test_dropped_upload_removes_its_spool(api, tmp_path, monkeypatch):
+    import asyncio, tempfile
+    from starlette.requests import ClientDisconnect
+    import app.api as api_module
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path / "spool"))
+    (tmp_path / "spool").mkdir()
+
+    class Dropped:
+        async def stream(self):
+            yield b"From ci@build.test Fri Mar  1 09:00:00 2024\n"
+            raise ClientDisconnect()
+
+    with pytest.raises(ClientDisconnect):
+        asyncio.run(api_module.import_messages(Dropped(), authorization=AUTH["Authorization"]))
+    assert list((tmp_path / "spool").iterdir()) == []
+
+def test_namespace_scoping_and_drop(api):
+    client, Session = api
+    add_messages(Session, 3, namespace="run-1")
+    add_messages(Session, 2, start=3, namespace="run-2")
+    add_messages(Session, 1, start=5)
+    r = client.get("/messages", headers=AUTH, params={"namespace": "run-1"})
+    assert [m["subject"] for m in r.json()] == ["msg 2", "msg 1", "msg 0"]
+    assert {m["namespace"] for m in r.json()} == {"run-1"}
+    r = client.get("/messages/wait", headers=AUTH, params={"namespace": "run-2", "timeout": 1})
+    assert r.json()["subject"] == "msg 4"
+
+    r = client.delete("/namespaces/run-1", headers=AUTH)
+    assert r.json() == {"namespace": "run-1", "deleted": 3, "bytes": 30}
+    assert client.get("/messages", headers=AUTH, params={"namespace": "run-1"}).json() == []
+    assert len(client.get("/messages", headers=AUTH).json()) == 3
+
+def test_blank_namespace_is_not_the_unnamespaced_mail(api):
+    client, Session = api
+    add_messages(Session, 2)
+    add_messages(Session, 1, start=2, namespace="run-1")
+    assert client.delete("/namespaces/%20", headers=AUTH).status_code == 400
+    assert len(client.get("/messages", headers=AUTH, params={"namespace": " "}).json()) == 3
+    assert len(client.get("/messages", headers=AUTH).json()) == 3
+
+def test_thread_and_duplicate_views(api, tmp_path):
+    client, Session = api
+    raw = "From: a@b\r\nTo: c@d\r\nSubject: {s}\r\nMessage-ID: <{n}@x>\r\n{extra}\r\nbody\r\n"
+    items = [Pending("a@b", ["c@d"], raw.format(s="code", n=i, extra="").encode(),
+                     received_at=BASE + timedelta(seconds=i)) for i in range(3)]
+    items.append(Pending("a@b", ["c@d"], raw.format(s="Re: code", n=9, extra="In-Reply-To: <0@x>\r\n").encode(),
+                         received_at=BASE + timedelta(seconds=9)))
+    IngestPipeline(str(tmp_path / "store"), Session).ingest_many(items)
+
+    threads = client.get("/threads", headers=AUTH).json()
+    assert [(t["subject"], t["count"]) for t in threads] == [("Re: code", 2), ("code", 1), ("code", 1)]
+    dups = client.get("/duplicates", headers=AUTH, params={"limit": 1}).json()
+    assert [(d["subject"], d["count"]) for d in dups] == [("Re: code", 4)]   # Re: is ignored
+    members = client.get("/messages", headers=AUTH, params={"thread": threads[0]["group"]}).json()
+    assert [m["subject"] for m in members] == ["Re: code", "code"]
+    assert all(m["thread"] == threads[0]["group"] for m in members)
+
+def test_concurrency_limit_sheds_excess_requests():
+    import asyncio, httpx
+    from fastapi import FastAPI
+    from app.api import ConcurrencyLimit
+
+    release = asyncio.Event()
+    app = FastAPI()
+    app.add_middleware(ConcurrencyLimit, limit=1, timeout=0.05, exempt=("/free",))
+
+    @app.get("/slow")
+    async def slow():
+        await release.wait()
+        return "done"
+
+    @app.get("/free")
+    async def free():
+        return "ok"
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app), base_url="http://t") as c:
+            first = asyncio.create_task(c.get("/slow"))
+            await asyncio.sleep(0.01)
+            busy = await c.get("/slow")
+            exempt = await c.get("/free")
+            release.set()
+            return (await first).status_code, busy, exempt.status_code
+
+    done, busy, exempt = asyncio.run(run())
+    assert (done, busy.status_code, exempt) == (200, 503, 200)
+    assert busy.headers["Retry-After"] == "1"
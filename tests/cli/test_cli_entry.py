@@ -0,0 +1,43 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from app import cli
+
+ROOT = Path(__file__).resolve().parents[2]
+HEAVY = ("sqlalchemy", "fastapi", "textual", "aiosmtpd")
+
+def loaded_after(code: str) -> set[str]:
+    """Top-level packages a fresh interpreter has imported after ``code``."""
+    probe = code + "\nimport sys; print(' '.join(sorted({m.split('.')[0] for m in sys.modules})))"
+    out = subprocess.run([sys.executable, "-c", probe], cwd=ROOT, capture_output=True, text=True, check=True)
+    return set(out.stdout.split())
+
+def test_help_lists_commands_without_loading_them(capsys):
+    with pytest.raises(SystemExit) as e:
+        cli.main(["--help"])
+    assert e.value.code == 0
+    out = capsys.readouterr().out
+    assert all(name in out for name in cli.COMMANDS)
+    assert not loaded_after("from app import cli\ntry: cli.main(['--help'])\nexcept SystemExit: pass") & set(HEAVY)
+
+def test_unknown_command_is_a_usage_error():
+    with pytest.raises(SystemExit) as e:
+        cli.main(["bogus"])
+    assert e.value.code == 2
+
+def test_tui_module_does_not_load_the_database_layer():
+    assert "sqlalchemy" not in loaded_after("import app.tui.__main__")
+
+def test_retention_runs_through_the_entry_point(tmp_path, capsys):
+    from app.models import get_session_factory
+    db = str(tmp_path / "messages.db")
+    get_session_factory(db)
+    cli.main(["retention", "--db", db, "--retention-days", "7", "--vacuum"])
+    assert capsys.readouterr().out.splitlines() == ["removed 0 messages (0 bytes)", "vacuumed"]
+    with pytest.raises(SystemExit) as e:
+        cli.main(["retention", "--help"])
+    assert e.value.code == 0
+    assert "mailgate retention" in capsys.readouterr().out
@@ -0,0 +1,47 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+from aiosmtpd.smtp import Envelope
+
+from app.models import get_async_session_factory, get_session_factory
+from app.smtp import SinkHandler
+from app.storage import Store
+
+@pytest.fixture()
+def store(tmp_path: Path):
+    return Store(str(tmp_path / "messages.db"), str(tmp_path / "store"))
+
+@pytest.fixture()
+def deliver():
+    """Push raw messages through SinkHandler.handle_DATA and wait for the pipeline to commit them."""
+    def run(store: Store, *messages: bytes, blob_store=None):
+        handler = SinkHandler(str(store.store_dir), store.Session, blob_store=blob_store)
+
+        async def send():
+            for raw in messages:
+                env = Envelope()
+                env.mail_from, env.rcpt_tos = "a@b", ["c@d"]
+                env.content = env.original_content = raw
+                await handler.handle_DATA(None, None, env)
+            await handler.pipeline.stop()
+
+        asyncio.run(send())
+
+    return run
+
+@pytest.fixture()
+def api(tmp_path: Path, monkeypatch):
+    """TestClient for app.api with its session factories pointed at tmp_path/messages.db."""
+    pytest.importorskip("httpx")  # required by fastapi.testclient
+    from fastapi.testclient import TestClient
+
+    db = str(tmp_path / "messages.db")
+    # only read if this is the first import of app.api; the factories are replaced below either way
+    monkeypatch.setenv("DB_PATH", db)
+    import app.api as api_module
+    Session = get_session_factory(db)
+    monkeypatch.setattr(api_module, "Session", Session)
+    monkeypatch.setattr(api_module, "ReadSession", get_session_factory(db, readonly=True, init=False))
+    monkeypatch.setattr(api_module, "AsyncReadSession", get_async_session_factory(db, readonly=True))
+    return TestClient(api_module.app), Session
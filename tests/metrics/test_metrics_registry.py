@@ -0,0 +1,61 @@
+import pytest
+
+from app import metrics
+
+@pytest.fixture()
+def registry():
+    metrics.set_enabled(True)
+    yield metrics.Registry()
+    metrics.set_enabled(True)
+
+def test_histogram_renders_cumulative_buckets(registry):
+    h = registry.histogram("t_seconds", "test", ("stage",), buckets=(0.1, 1.0))
+    for v in (0.05, 0.5, 0.5, 3.0):
+        h.observe(v, stage="write")
+    text = metrics.render(registry.snapshot())
+    assert '# TYPE t_seconds histogram' in text
+    assert 't_seconds_bucket{stage="write",le="0.1"} 1' in text
+    assert 't_seconds_bucket{stage="write",le="1.0"} 3' in text
+    assert 't_seconds_bucket{stage="write",le="+Inf"} 4' in text
+    assert 't_seconds_sum{stage="write"} 4.05' in text
+    assert 't_seconds_count{stage="write"} 4' in text
+
+def test_merge_sums_processes(registry):
+    c = registry.counter("t_total", "test", ("reason",))
+    c.inc(reason="full")
+    c.inc(2, reason="failed")
+    snap = registry.snapshot()
+    merged = metrics.merge([snap, snap])
+    assert merged["t_total"]["values"] == {("full",): 2, ("failed",): 4}
+
+def test_disabled_instruments_record_nothing(registry):
+    c = registry.counter("t_total", "test")
+    registry.gauge("t_depth", "test", fn=lambda: {(): 7})
+    metrics.set_enabled(False)
+    c.inc()
+    snap = registry.snapshot()
+    assert snap["t_total"]["values"] == {}
+    assert snap["t_depth"]["values"] == {(): 7}
+
+def test_queue_depth_gauge_follows_the_latest_listener(tmp_path, monkeypatch):
+    import argparse, socket, threading
+    from types import SimpleNamespace
+    from app import smtp
+
+    handlers = []
+    real = smtp.SinkHandler
+    monkeypatch.setattr(smtp, "SinkHandler", lambda *a, **kw: handlers.append(real(*a, **kw)) or handlers[-1])
+    for _ in range(2):
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        args = smtp.parse_args(smtp.add_arguments(argparse.ArgumentParser()), [
+            "--host", "127.0.0.1", "--port", str(port),
+            "--db", str(tmp_path / "messages.db"), "--store-dir", str(tmp_path / "store"),
+        ])
+        halt = threading.Event()
+        halt.set()
+        smtp.serve(args, retention=False, halt=halt)
+        if len(handlers) == 1:
+            handlers[0].pipeline = SimpleNamespace(depth=5)   # the stopped listener
+    assert metrics.INGEST_QUEUE_DEPTH.snapshot()["values"] == {(): 0}
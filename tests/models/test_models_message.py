@@ -1,9 +1,11 @@
 import json
+import sqlite3
 import uuid
 from datetime import datetime, timedelta
 from pathlib import Path
 
 import pytest
+from sqlalchemy.exc import OperationalError
 
 from app.models import get_session_factory, Message
 
@@ -66,3 +68,94 @@ def test_indicies_exist_logically(temp_db):
         got = s.query(Message).filter_by(message_id="<m-3>").one()
         assert got is not None
 
+
+def test_sqlite_profile_and_read_only_factory(temp_db):
+    Session, db_path = temp_db
+    with Session() as s:
+        conn = s.connection()
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1  # NORMAL
+        s.add(Message(id="m1", subject="hi"))
+        s.commit()
+
+    ReadSession = get_session_factory(str(db_path), readonly=True, init=False)
+    with ReadSession() as s:
+        assert s.get(Message, "m1").subject == "hi"
+        s.add(Message(id="m2"))
+        with pytest.raises(OperationalError):
+            s.commit()
+
+def test_columns_added_after_creation_are_migrated(tmp_path: Path):
+    db_path = tmp_path / "old.db"
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE messages (id VARCHAR PRIMARY KEY, received_at DATETIME, subject TEXT)")
+    conn.execute("INSERT INTO messages VALUES ('m1', '2024-01-01 00:00:00', 'old')")
+    conn.commit()
+    conn.close()
+
+    Session = get_session_factory(str(db_path))
+    with Session() as s:
+        got = s.get(Message, "m1")
+        assert (got.subject, got.namespace) == ("old", None)
+        got.namespace = "run-1"
+        s.commit()
+    assert Session().query(Message).filter_by(namespace="run-1").count() == 1
+
+def test_schema_version_is_stamped_and_checked(tmp_path: Path):
+    from app.constants.database.engine import SCHEMA_VERSION
+    from app.models import get_engine, init_db, schema_version
+
+    db_path = tmp_path / "v.db"
+    get_session_factory(str(db_path))
+    engine = get_engine(str(db_path))
+    assert schema_version(engine) == SCHEMA_VERSION
+
+    # a current stamp short-circuits: a dropped index is not recreated...
+    def indexes():
+        with engine.connect() as conn:
+            return {r[1] for r in conn.exec_driver_sql("PRAGMA index_list(messages)")}
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DROP INDEX ix_messages_message_id")
+    init_db(engine)
+    assert "ix_messages_message_id" not in indexes()
+    # ...until the stamp is stale
+    with engine.begin() as conn:
+        conn.exec_driver_sql("PRAGMA user_version = 0")
+    init_db(engine)
+    assert "ix_messages_message_id" in indexes()
+    assert schema_version(engine) == SCHEMA_VERSION
+
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION + 1}")
+    with pytest.raises(RuntimeError, match="newer than this build"):
+        init_db(engine)
+
+def test_fts_docs_are_rebuilt_with_autoincrement(tmp_path: Path):
+    db_path = tmp_path / "v4.db"
+    with sqlite3.connect(db_path) as conn:
+        conn.executescript("""
+            CREATE TABLE messages_fts_docs (id INTEGER NOT NULL PRIMARY KEY, message_id VARCHAR NOT NULL);
+            CREATE UNIQUE INDEX ix_messages_fts_docs_message_id ON messages_fts_docs (message_id);
+            INSERT INTO messages_fts_docs VALUES (1, 'a'), (7, 'b');
+            PRAGMA user_version = 4;
+        """)
+    get_session_factory(str(db_path))
+    with sqlite3.connect(db_path) as conn:
+        assert "AUTOINCREMENT" in conn.execute(
+            "SELECT sql FROM sqlite_master WHERE name = 'messages_fts_docs'").fetchone()[0]
+        assert conn.execute("SELECT id, message_id FROM messages_fts_docs ORDER BY id").fetchall() == [(1, "a"), (7, "b")]
+        # the newest id is not handed out again once its row is gone
+        conn.execute("DELETE FROM messages_fts_docs WHERE id = 7")
+        conn.execute("INSERT INTO messages_fts_docs (message_id) VALUES ('c')")
+        assert conn.execute("SELECT id FROM messages_fts_docs WHERE message_id = 'c'").fetchone() == (8,)
+        assert "messages_fts_docs_old" not in {r[0] for r in conn.execute("SELECT name FROM sqlite_master")}
+
+def test_engine_profile_rejects_unknown_pragma_values(monkeypatch):
+    from app.models.session import EngineProfile
+    monkeypatch.setenv("SQLITE_SYNCHRONOUS", "normal")
+    assert EngineProfile.from_env().synchronous == "NORMAL"
+    monkeypatch.setenv("SQLITE_SYNCHRONOUS", "normall")
+    with pytest.raises(ValueError, match="synchronous"):
+        EngineProfile.from_env()
+    with pytest.raises(ValueError, match="journal_mode"):
+        EngineProfile(journal_mode="wall")
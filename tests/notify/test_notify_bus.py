@@ -0,0 +1,164 @@
+import asyncio
+import socket
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from aiosmtpd.smtp import Envelope
+
+from app.models import get_session_factory
+from app.notify import MessageBus, UdpPublisher, start_feed
+from app.smtp import SinkHandler
+from app.constants import notify
+
+def event(to="dev@example.com", subject="hello", message_id="<a@b>"):
+    return {"id": "1", "to": [to], "from": "qa@example.com", "subject": subject, "message_id": message_id}
+
+def test_predicates_and_recipient_index():
+    bus = MessageBus()
+
+    async def run():
+        by_rcpt = bus.subscribe(to="DEV@example.com")
+        by_subject = bus.subscribe(subject="RESET")
+        by_mid = bus.subscribe(message_id="a@b")
+        other = bus.subscribe(to="someone@else.com")
+        by_domain = bus.subscribe(to="@Example.com")
+        by_text = bus.subscribe(to="dev@")
+        bus.publish([event(subject="Password reset")])
+        await asyncio.sleep(0)
+        subs = (by_rcpt, by_subject, by_mid, other, by_domain, by_text)
+        got = [s.queue.qsize() for s in subs]
+        for s in subs:
+            s.close()
+        return got
+
+    assert asyncio.run(run()) == [1, 1, 1, 0, 1, 1]
+    assert bus.subscribers == 0
+
+def test_namespace_index():
+    bus = MessageBus()
+
+    async def run():
+        mine = bus.subscribe(namespace="Run-1")
+        theirs = bus.subscribe(namespace="run-2")
+        scoped_rcpt = bus.subscribe(to="dev@example.com", namespace="run-2")
+        bus.publish([{**event(), "namespace": "run-1"}])
+        await asyncio.sleep(0)
+        got = [s.queue.qsize() for s in (mine, theirs, scoped_rcpt)]
+        for s in (mine, theirs, scoped_rcpt):
+            s.close()
+        return got
+
+    assert asyncio.run(run()) == [1, 0, 0]
+    assert bus.subscribers == 0
+
+def test_handler_publishes_after_commit(tmp_path: Path):
+    bus = MessageBus()
+    Session = get_session_factory(str(tmp_path / "messages.db"))
+    handler = SinkHandler(str(tmp_path / "store"), Session, publishers=[bus.publish])
+    raw = b"Subject: welcome\r\nMessage-ID: <x1@test>\r\n\r\nhi\r\n"
+
+    async def run():
+        with bus.subscribe(to="new@example.com") as sub:
+            env = Envelope()
+            env.mail_from, env.rcpt_tos = "qa@example.com", ["new@example.com"]
+            env.content = env.original_content = raw
+            await handler.handle_DATA(None, None, env)
+            ev = await asyncio.wait_for(sub.get(), 2)
+        await handler.pipeline.stop()
+        return ev
+
+    ev = asyncio.run(run())
+    assert ev["subject"] == "welcome"
+    assert ev["message_id"] == "<x1@test>"
+    assert ev["to"] == ["new@example.com"]
+
+def test_header_recipients_and_domains_wake_subscribers(tmp_path: Path):
+    bus = MessageBus()
+    Session = get_session_factory(str(tmp_path / "messages.db"))
+    handler = SinkHandler(str(tmp_path / "store"), Session, publishers=[bus.publish])
+    raw = b"To: Team <team@example.com>\r\nCc: boss@corp.test\r\nSubject: hi\r\n\r\nhi\r\n"
+
+    async def run():
+        subs = [bus.subscribe(to=to) for to in ("@example.com", "BOSS@corp.test", "@corp", "team")]
+        env = Envelope()
+        env.mail_from, env.rcpt_tos = "qa@example.com", ["inbox@relay.test"]
+        env.content = env.original_content = raw
+        await handler.handle_DATA(None, None, env)
+        await handler.pipeline.stop()
+        await asyncio.sleep(0.01)
+        got = [s.queue.qsize() for s in subs]
+        for s in subs:
+            s.close()
+        return got
+
+    # a mailbox or @domain matches envelope and header recipients, like
+    # the database lookup; anything else is a substring of the envelope
+    assert asyncio.run(run()) == [1, 1, 0, 0]
+
+def test_udp_feed_crosses_processes():
+    bus = MessageBus()
+
+    async def run():
+        port = free_udp_port()
+        stop = await start_feed(notify.MODE_UDP, bus, addr=f"127.0.0.1:{port}")
+        try:
+            with bus.subscribe(subject="hello") as sub:
+                UdpPublisher(f"127.0.0.1:{port}")([event()])
+                return await asyncio.wait_for(sub.get(), 2)
+        finally:
+            stop()
+
+    assert asyncio.run(run())["subject"] == "hello"
+
+def free_udp_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def test_db_tail_follows_commit_order(tmp_path: Path):
+    from datetime import datetime, timedelta
+    from app.models import FtsDoc, Message
+    from app.notify import DbTail
+
+    bus = MessageBus()
+    Session = get_session_factory(str(tmp_path / "messages.db"))
+    tail = DbTail(bus, Session, interval=0.01, overlap=1.0)
+
+    def add(mid, received_at):
+        with Session() as s:
+            s.add(Message(id=mid, received_at=received_at, to_addrs='["dev@example.com"]'))
+            s.add(FtsDoc(message_id=mid))
+            s.commit()
+
+    def delete(mid):
+        with Session() as s:
+            s.query(FtsDoc).filter_by(message_id=mid).delete()
+            s.query(Message).filter_by(id=mid).delete()
+            s.commit()
+
+    async def run():
+        add("before", datetime.utcnow() - timedelta(seconds=30))   # stored while idle
+        task = asyncio.create_task(tail.run())
+        got = []
+        with bus.subscribe(to="dev@example.com") as sub:
+            await asyncio.sleep(0.05)
+            now = datetime.utcnow()
+            add("new", now)
+            got.append((await asyncio.wait_for(sub.get(), 2))["id"])
+            add("late", now - timedelta(seconds=60))       # queued long before it committed
+            got.append((await asyncio.wait_for(sub.get(), 2))["id"])
+            delete("late")                                 # its id is not handed out again
+            add("after-delete", now)
+            got.append((await asyncio.wait_for(sub.get(), 2))["id"])
+            await asyncio.sleep(0.05)
+            assert sub.queue.empty()
+        task.cancel()
+        return got
+
+    assert asyncio.run(run()) == ["new", "late", "after-delete"]
+
+def test_poll_feed_needs_the_fts_index():
+    other = SimpleNamespace(kw={"bind": SimpleNamespace(dialect=SimpleNamespace(name="postgresql"))})
+    with pytest.raises(ValueError, match="udp"):
+        asyncio.run(start_feed(notify.MODE_POLL, MessageBus(), session_factory=other))
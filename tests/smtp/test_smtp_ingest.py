@@ -0,0 +1,143 @@
+import asyncio
+import json
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from aiosmtpd.smtp import Envelope
+
+from app.models import get_session_factory, Message, MessagePart
+from app.smtp import SinkHandler
+from app.constants import ingest
+
+RAW = b"From: a@b\r\nTo: c@d\r\nSubject: hello\r\nMessage-ID: <m-1@local>\r\n\r\nbody\r\n"
+
+def make_envelope(raw: bytes = RAW, rcpts=("c@d",)) -> Envelope:
+    env = Envelope()
+    env.mail_from = "a@b"
+    env.rcpt_tos = list(rcpts)
+    env.content = raw
+    env.original_content = raw
+    return env
+
+@pytest.fixture()
+def sink(tmp_path: Path):
+    Session = get_session_factory(str(tmp_path / "messages.db"))
+    return Session, tmp_path / "store"
+
+def test_commit_mode_acks_after_row_exists(sink):
+    Session, store = sink
+    handler = SinkHandler(str(store), Session, batch_size=10, max_latency=0.01)
+
+    async def run():
+        reply = await handler.handle_DATA(None, None, make_envelope())
+        with Session() as s:
+            rows = s.query(Message).all()
+            parts = s.query(MessagePart).all()
+        await handler.pipeline.stop()
+        return reply, rows, parts
+
+    reply, rows, parts = asyncio.run(run())
+    assert reply == ingest.REPLY_ACCEPTED
+    assert len(rows) == 1
+    assert rows[0].subject == "hello"
+    assert json.loads(rows[0].to_addrs) == ["c@d"]
+    assert Path(rows[0].eml_path).read_bytes() == RAW
+    assert [(p.content_type, p.size_bytes) for p in parts] == [("text/plain", len(b"body\r\n"))]
+
+def test_burst_is_batched_and_drained_on_stop(sink):
+    Session, store = sink
+    handler = SinkHandler(str(store), Session, batch_size=50, durability=ingest.DURABILITY_ENQUEUE)
+
+    async def run():
+        replies = await asyncio.gather(*(handler.handle_DATA(None, None, make_envelope()) for _ in range(120)))
+        await handler.pipeline.stop()
+        return replies
+
+    replies = asyncio.run(run())
+    assert set(replies) == {ingest.REPLY_ACCEPTED}
+    with Session() as s:
+        assert s.query(Message).count() == 120
+    assert len(list(store.glob("*.eml"))) == 120
+    stats = handler.pipeline.stats()
+    assert (stats["received"], stats["committed"], stats["depth"]) == (120, 120, 0)
+    assert stats["batches"] >= 3
+
+def test_full_queue_is_refused_with_4xx(sink):
+    Session, store = sink
+    handler = SinkHandler(str(store), Session, queue_size=1, durability=ingest.DURABILITY_ENQUEUE)
+
+    async def run():
+        handler.pipeline.start()
+        # nothing yields to the workers between the two submits
+        first = await handler.handle_DATA(None, None, make_envelope())
+        second = await handler.handle_DATA(None, None, make_envelope())
+        await handler.pipeline.stop()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == ingest.REPLY_ACCEPTED
+    assert second.startswith("451")
+    assert handler.pipeline.stats()["refused"] == 1
+
+def test_post_commit_failure_keeps_the_stored_batch(sink, monkeypatch):
+    Session, store = sink
+    handler = SinkHandler(str(store), Session, batch_size=10, max_latency=0.01)
+
+    def disk_full(ref, data):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(handler.pipeline.blobs, "ensure", disk_full)
+
+    async def run():
+        reply = await handler.handle_DATA(None, None, make_envelope())
+        await handler.pipeline.stop()
+        return reply
+
+    assert asyncio.run(run()) == ingest.REPLY_ACCEPTED
+    with Session() as s:
+        row = s.query(Message).one()
+    assert Path(row.eml_path).read_bytes() == RAW
+    assert handler.pipeline.stats()["committed"] == 1
+
+def test_namespace_from_header_auth_or_plus_tag(sink):
+    Session, store = sink
+    handler = SinkHandler(str(store), Session, batch_size=10, max_latency=0.01)
+    tagged = RAW.replace(b"To: c@d", b"To: qa+Run-7@example.com")
+
+    async def run():
+        await handler.handle_DATA(None, None, make_envelope(tagged, rcpts=("qa+Run-7@example.com",)))
+        await handler.handle_DATA(None, SimpleNamespace(auth_data=SimpleNamespace(login=b"alice")),
+                                  make_envelope(tagged, rcpts=("qa+Run-7@example.com",)))
+        await handler.handle_DATA(None, SimpleNamespace(auth_data=SimpleNamespace(login=b"alice")),
+                                  make_envelope(b"X-Mailgate-Namespace: suite-3\r\n" + RAW))
+        await handler.handle_DATA(None, None, make_envelope())
+        await handler.pipeline.stop()
+
+    asyncio.run(run())
+    with Session() as s:
+        got = [m.namespace for m in s.query(Message).order_by(Message.received_at)]
+    assert got == ["run-7", "alice", "suite-3", None]
+
+    handler = SinkHandler(str(store), Session, namespace_sources=(), max_latency=0.01)
+    assert handler.namespace(SimpleNamespace(auth_data=SimpleNamespace(login=b"alice")), make_envelope(rcpts=("a+b@c",))) is None
+
+def test_summary_fields_are_computed_at_ingest(sink):
+    Session, store = sink
+    raw = (b"From: =?utf-8?q?Jos=C3=A9?= <a@b>\r\nTo: Bob <c@d>, e@f\r\nCc: \"Ann\" <g@h>\r\n"
+           b"Subject: hi\r\nDate: Tue, 02 Jan 2024 10:00:00 +0200\r\n\r\nfirst   line\r\n\r\nsecond\r\n")
+    handler = SinkHandler(str(store), Session, batch_size=10, max_latency=0.01)
+
+    async def run():
+        await handler.handle_DATA(None, None, make_envelope(raw))
+        await handler.pipeline.stop()
+
+    asyncio.run(run())
+    with Session() as s:
+        row = s.query(Message).one()
+    assert row.display_from == "José <a@b>"
+    assert row.display_to == "c@d, e@f, g@h"
+    assert row.snippet == "first line second"
+    assert row.sent_at == datetime(2024, 1, 2, 8, 0)
+    assert row.part_count == 1
@@ -0,0 +1,56 @@
+import base64
+from email.message import EmailMessage
+
+from app.mime import iter_part, scan_message
+
+def alternative() -> EmailMessage:
+    m = EmailMessage()
+    m["Subject"] = "=?utf-8?q?Caf=C3=A9_weekly?="
+    m["To"] = "a@b.test"
+    m.set_content("plain body\n")
+    m.add_alternative("<p>html body</p>", subtype="html")
+    return m
+
+def test_text_and_html_is_not_an_attachment():
+    raw = alternative().as_bytes()
+    summary = scan_message(raw)
+    assert str(summary.headers["Subject"]) == "Café weekly"
+    assert [p.content_type for p in summary.parts] == ["text/plain", "text/html"]
+    assert not summary.has_attachments
+    assert summary.text(raw) == "plain body\n"
+
+def test_attachment_offsets_point_at_the_encoded_body():
+    m = alternative()
+    payload = bytes(range(256)) * 40
+    m.add_attachment(payload, maintype="application", subtype="pdf", filename="r.pdf")
+    raw = m.as_bytes()
+    summary = scan_message(raw)
+    assert summary.has_attachments and not summary.truncated
+    pdf = summary.parts[-1]
+    assert (pdf.content_type, pdf.filename, pdf.encoding) == ("application/pdf", "r.pdf", "base64")
+    assert base64.b64decode(raw[pdf.body:pdf.end]) == payload
+    assert summary.text(raw) == "plain body\n"
+
+def test_single_part_and_headerless_messages():
+    raw = b"Subject: hi\r\nContent-Type: application/octet-stream; name=x.bin\r\n\r\n\x00\x01"
+    summary = scan_message(raw)
+    assert summary.has_attachments
+    assert summary.text(raw) == ""
+    assert scan_message(b"Subject: only headers").parts[0].end == len(b"Subject: only headers")
+
+def test_iter_part_decodes_ranges_across_chunks(tmp_path):
+    m = alternative()
+    payload = bytes(range(256)) * 40 + b"xy"   # unpadded would need "==" at the end
+    m.add_attachment(payload, maintype="application", subtype="pdf", filename="r.pdf")
+    m.add_attachment("naïve résumé\n" * 50, subtype="plain", charset="utf-8",
+                     cte="quoted-printable", filename="r.txt")
+    raw = m.as_bytes()
+    path = tmp_path / "m.eml"
+    path.write_bytes(raw)
+    pdf, txt = scan_message(raw).parts[-2:]
+    for part, want in ((pdf, payload), (txt, ("naïve résumé\n" * 50).encode())):
+        assert part.decoded_size(raw) == len(want)
+        for start, stop in ((0, None), (1000, 5003), (len(want) - 3, None)):
+            got = b"".join(iter_part(str(path), part.encoding, part.body, part.end,
+                                     start, stop, chunk_size=97))
+            assert got == want[start:stop]
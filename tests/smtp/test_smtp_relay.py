@@ -0,0 +1,142 @@
+import asyncio
+import socket
+import time
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import Envelope
+
+from app.ingest_log import IngestLog, LogRecord, read_log, segments
+from app.models import get_session_factory
+from app.relay import Relay, log_envelopes, store_envelopes
+from app.smtp import SinkHandler
+from app.storage import message_filters
+from app.constants import ingest
+
+def make_envelope(raw: bytes = b"Subject: hi\r\n\r\nbody\r\n", rcpts=("c@d",)) -> Envelope:
+    env = Envelope()
+    env.mail_from = "a@b"
+    env.rcpt_tos = list(rcpts)
+    env.content = env.original_content = raw
+    return env
+
+def record(i: int, size: int = 100) -> LogRecord:
+    return LogRecord(f"m{i}", datetime(2024, 1, 1), "a@b", [f"r{i}@x", "c@d"],
+                     f"Subject: {i}\r\n\r\n".encode() + b"x" * size, namespace="ns" if i % 2 else None)
+
+class Collector:
+    def __init__(self, tempfail: int = 0):
+        self.tempfail = tempfail
+        self.received = []
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.tempfail:
+            self.tempfail -= 1
+            return "451 try again"
+        self.received.append((envelope.mail_from, envelope.rcpt_tos, envelope.content))
+        return "250 OK"
+
+@pytest.fixture()
+def target():
+    handlers = []
+
+    def start(handler):
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        controller = Controller(handler, hostname="127.0.0.1", port=port)
+        controller.start()
+        handlers.append(controller)
+        return port
+
+    yield start
+    for controller in handlers:
+        controller.stop()
+
+def test_log_rotates_and_reads_offset_ranges(tmp_path: Path):
+    log = IngestLog(str(tmp_path), segment_bytes=1000)
+    assert log.append([record(i) for i in range(10)]) == 0
+    assert log.append([record(i) for i in range(10, 25)]) == 10
+    log.close()
+    assert len(segments(str(tmp_path))) > 3
+
+    rows = list(read_log(str(tmp_path)))
+    assert [r.offset for r in rows] == list(range(25))
+    assert rows[3].mid == "m3" and rows[3].rcpt_tos == ["r3@x", "c@d"] and rows[3].namespace == "ns"
+    assert rows[3].data == record(3).data
+    assert [r.offset for r in read_log(str(tmp_path), 7, 19)] == list(range(7, 19))
+
+def test_log_drops_torn_tail_and_old_segments(tmp_path: Path):
+    log = IngestLog(str(tmp_path))
+    log.append([record(i) for i in range(5)])
+    log.close()
+    (_, path), = segments(str(tmp_path))
+    with open(path, "r+b") as f:
+        f.truncate(f.seek(0, 2) - 7)
+
+    log = IngestLog(str(tmp_path), segment_bytes=300, retain_segments=2)
+    assert log.next_offset == 4
+    log.append([record(i) for i in range(4, 12)])
+    log.close()
+    kept = segments(str(tmp_path))
+    assert len(kept) == 2
+    assert [r.offset for r in read_log(str(tmp_path))] == list(range(kept[0][0], 12))
+
+def test_pipeline_appends_committed_mail(tmp_path: Path):
+    Session = get_session_factory(str(tmp_path / "messages.db"))
+    log = IngestLog(str(tmp_path / "log"))
+    handler = SinkHandler(str(tmp_path / "store"), Session, batch_size=10, max_latency=0.01, ingest_log=log)
+
+    async def run():
+        replies = [await handler.handle_DATA(None, None, make_envelope(rcpts=(f"u{i}@d",))) for i in range(3)]
+        await handler.pipeline.stop()
+        return replies
+
+    assert asyncio.run(run()) == [ingest.REPLY_ACCEPTED] * 3
+    log.close()
+    rows = list(read_log(str(tmp_path / "log")))
+    assert [r.rcpt_tos for r in rows] == [["u0@d"], ["u1@d"], ["u2@d"]]
+    assert rows[0].data == make_envelope().content
+
+def test_relay_replays_log_in_order_on_one_connection(tmp_path: Path, target):
+    log = IngestLog(str(tmp_path))
+    log.append([record(i) for i in range(30)])
+    log.close()
+    collector = Collector()
+    stats = Relay("127.0.0.1", target(collector), connections=1).run(log_envelopes(str(tmp_path), 10, 20))
+    assert (stats.sent, stats.failed) == (10, 0)
+    assert [rcpts[0] for _, rcpts, _ in collector.received] == [f"r{i}@x" for i in range(10, 20)]
+
+def test_relay_from_store_with_override_and_retry(tmp_path: Path, target):
+    Session = get_session_factory(str(tmp_path / "messages.db"))
+    handler = SinkHandler(str(tmp_path / "store"), Session, batch_size=10, max_latency=0.01)
+
+    async def ingest_some():
+        for i in range(4):
+            raw = f"From: a@b\r\nTo: c@d\r\nSubject: s{i % 2}\r\n\r\nbody\r\n".encode()
+            await handler.handle_DATA(None, None, make_envelope(raw))
+        await handler.pipeline.stop()
+
+    asyncio.run(ingest_some())
+    collector = Collector(tempfail=1)
+    relay = Relay("127.0.0.1", target(collector), connections=2, rcpt_to=["qa@test"])
+    relay_stats = relay.run(store_envelopes(Session, message_filters(subject="s1")))
+    assert (relay_stats.sent, relay_stats.retried, relay_stats.failed) == (2, 1, 0)
+    assert sorted(rcpts for _, rcpts, _ in collector.received) == [["qa@test"], ["qa@test"]]
+    assert all(b"Subject: s1" in data for _, _, data in collector.received)
+
+def test_relay_rate_limit_and_failures(tmp_path: Path, target):
+    collector = Collector()
+    port = target(collector)
+    envelopes = [("a@b", ["c@d"], b"Subject: x\r\n\r\nbody\r\n")] * 10 + [("a@b", [], b"")]
+    started = time.perf_counter()
+    stats = Relay("127.0.0.1", port, connections=4, rate=40).run(envelopes)
+    assert time.perf_counter() - started >= 0.15
+    assert (stats.sent, stats.failed, stats.errors) == (10, 1, {"no_recipients": 1})
+
+    stats = Relay("127.0.0.1", port, retries=0).run(iter([("a@b", ["c@d"], b"x\r\n")] * 2))
+    assert stats.sent == 2
+    closed = Relay("127.0.0.1", 1, retries=1).run([("a@b", ["c@d"], b"x\r\n")])
+    assert (closed.sent, closed.retried, closed.errors) == (0, 1, {"disconnected": 1})
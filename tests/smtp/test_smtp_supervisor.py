@@ -0,0 +1,104 @@
+import asyncio
+import signal
+import socket
+import time
+
+import aiosmtplib
+import pytest
+
+from app import metrics, supervisor as supervisor_module
+from app.smtp import ReusePortController
+from app.supervisor import Supervisor
+
+# spawn targets: module level so the child process can import them
+
+def exit_at_once(index, stats):
+    pass
+
+def ignore_sigterm(index, stats, ready):
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    ready.set()
+    time.sleep(60)
+
+def test_snapshot_sums_latest_report_per_worker():
+    sup = Supervisor(print, 2)
+    sup.latest = {
+        1: {"worker": 1, "pid": 11, "received": 5, "committed": 4, "depth": 1},
+        0: {"worker": 0, "pid": 10, "received": 3, "committed": 3, "depth": 0},
+    }
+    snap = sup.snapshot()
+    assert [w["worker"] for w in snap["workers"]] == [0, 1]
+    assert snap["total"] == {"received": 8, "committed": 7, "depth": 1}
+    assert snap["restarts"] == 0
+
+def test_worker_dying_young_is_restarted_with_growing_backoff(monkeypatch):
+    monkeypatch.setattr(supervisor_module.supervisor, "RESTART_BACKOFF", 0.05)
+    monkeypatch.setattr(supervisor_module.supervisor, "MAX_RESTART_BACKOFF", 0.1)
+    sup = Supervisor(exit_at_once, 1)
+    sup._spawn(0)
+    backoffs = []
+    deadline = time.monotonic() + 30
+    while sup.restarts < 3 and time.monotonic() < deadline:
+        sup._procs[0].join()
+        sup._reap()
+        if 0 in sup._respawn_at and (not backoffs or backoffs[-1][0] != sup.restarts):
+            backoffs.append((sup.restarts, sup._backoff[0]))
+        time.sleep(0.01)
+    sup._procs[0].join()
+    assert sup.restarts == 3
+    assert [b for _, b in backoffs] == [0.05, 0.1, 0.1]
+
+def test_shutdown_kills_a_worker_that_does_not_drain():
+    sup = Supervisor(ignore_sigterm, 1, drain_timeout=0.5)
+    ready = sup.ctx.Event()
+    sup.args = (ready,)
+    sup._spawn(0)
+    assert ready.wait(30)
+    started = time.monotonic()
+    sup._shutdown()
+    assert time.monotonic() - started >= 0.5
+    assert sup._procs[0].exitcode == -signal.SIGKILL
+
+def test_collect_metrics_sums_workers_and_adds_own_gauges():
+    sup = Supervisor(print, 2)
+    for index, n in ((0, 3), (1, 4)):
+        registry = metrics.Registry()
+        registry.counter("mailgate_smtp_messages_total", "Messages accepted by DATA").inc(n)
+        sup.metrics[index] = registry.snapshot()
+    sup.restarts = 2
+    merged = sup.collect_metrics()
+    assert merged["mailgate_smtp_messages_total"]["values"] == {(): 7}
+    assert merged["mailgate_smtp_worker_restarts_total"]["values"] == {(): 2}
+    assert merged["mailgate_smtp_workers"]["values"] == {(): 0}
+
+class Collect:
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return "250 OK"
+
+@pytest.mark.skipif(not hasattr(socket, "SO_REUSEPORT"), reason="needs SO_REUSEPORT")
+def test_reuse_port_controllers_share_a_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    handlers = [Collect(), Collect()]
+    controllers = [ReusePortController(h, hostname="127.0.0.1", port=port) for h in handlers]
+    for c in controllers:
+        c.start()
+    try:
+        async def send():
+            await aiosmtplib.send(b"Subject: x\r\n\r\nbody\r\n", sender="a@b", recipients=["c@d"],
+                                  hostname="127.0.0.1", port=port)
+
+        # the kernel picks the listener per connection; try until both took one
+        for _ in range(200):
+            if all(h.received for h in handlers):
+                break
+            asyncio.run(send())
+        assert all(h.received for h in handlers)
+    finally:
+        for c in controllers:
+            c.stop()
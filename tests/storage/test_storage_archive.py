@@ -0,0 +1,59 @@
+import zipfile
+from datetime import datetime
+from email.message import EmailMessage
+from pathlib import Path
+
+import pytest
+from sqlalchemy import select
+
+from app.archive import import_archive, iter_export, write_maildir
+from app.ingest import IngestPipeline, Pending
+from app.models import get_session_factory, Message
+from app.storage import message_filters
+
+def raw_message(i: int) -> bytes:
+    m = EmailMessage()
+    m["From"] = "ci@build.test"
+    m["To"] = f"user{i % 2}@example.com"
+    m["Subject"] = f"run {i}"
+    m["Date"] = f"Fri, 01 Mar 2024 09:0{i}:00 +0000"
+    # a body line that mbox has to quote
+    m.set_content(f"step {i}\nFrom here on it fails\n>From already quoted\n")
+    return m.as_bytes()
+
+@pytest.fixture()
+def source(tmp_path: Path):
+    Session = get_session_factory(str(tmp_path / "src.db"))
+    pipeline = IngestPipeline(str(tmp_path / "src"), Session, batch_size=2)
+    assert pipeline.ingest_many(
+        Pending("ci@build.test", [f"user{i % 2}@example.com"], raw_message(i),
+                received_at=datetime(2024, 3, 1, 9, i)) for i in range(5)
+    ) == 5
+    return get_session_factory(str(tmp_path / "src.db"), readonly=True, init=False)
+
+def reimport(tmp_path: Path, path: Path, fmt=None) -> list:
+    Session = get_session_factory(str(tmp_path / f"{path.name}.db"))
+    pipeline = IngestPipeline(str(tmp_path / f"{path.name}.store"), Session, batch_size=2)
+    import_archive(str(path), fmt, pipeline)
+    with Session() as s:
+        return s.execute(select(Message).order_by(Message.received_at)).scalars().all()
+
+@pytest.mark.parametrize("fmt", ["mbox", "zip", "maildir"])
+def test_export_round_trips_byte_for_byte(tmp_path, source, fmt):
+    out = tmp_path / f"export.{fmt}"
+    with open(out, "wb") as f:
+        for chunk in iter_export(source, fmt, []):
+            f.write(chunk)
+    if fmt != "mbox":
+        assert zipfile.ZipFile(out).testzip() is None
+    rows = reimport(tmp_path, out)
+    assert [r.subject for r in rows] == [f"run {i}" for i in range(5)]
+    assert [Path(r.eml_path).read_bytes() for r in rows] == [raw_message(i) for i in range(5)]
+    assert rows[0].from_addr == "ci@build.test"
+
+def test_filtered_export_to_maildir_directory(tmp_path, source):
+    assert write_maildir(source, message_filters(to_addr="user1@example.com"), str(tmp_path / "md")) == 2
+    assert not list((tmp_path / "md" / "tmp").iterdir())
+    rows = reimport(tmp_path, tmp_path / "md")
+    assert [r.subject for r in rows] == ["run 1", "run 3"]
+    assert rows[0].to_addrs == '["user1@example.com"]'
@@ -0,0 +1,64 @@
+from pathlib import Path
+
+from app.blobs import HashedBlobStore, read_eml
+from app.models import Blob, Message
+from app.constants import blobs
+
+RAW = b"From: a@b\r\nTo: c@d\r\nSubject: template\r\n\r\n" + b"same body " * 200 + b"\r\n"
+
+def test_identical_messages_share_one_compressed_blob(store, deliver):
+    deliver(store, RAW, RAW, RAW, blob_store=HashedBlobStore(str(store.store_dir), blobs.CODEC_GZIP))
+    files = list((store.store_dir / blobs.BLOB_DIR).rglob("*.eml.gz"))
+    assert len(files) == 1
+    assert files[0].stat().st_size < len(RAW)
+    with store.Session() as s:
+        assert s.query(Blob).one().refcount == 3
+        mid = s.query(Message).first().id
+    assert store.get_parsed(mid).headers["Subject"] == "template"
+    exported = store.export_message(mid, str(store.store_dir.parent / "exports"))
+    assert Path(exported).read_bytes() == RAW
+
+def test_blob_is_unlinked_with_last_reference(store, deliver):
+    deliver(store, RAW, RAW, blob_store=HashedBlobStore(str(store.store_dir)))
+    with store.Session() as s:
+        mids = [m.id for m in s.query(Message)]
+    path = Path(store.get_message(mids[0])["eml_path"])
+    assert store.delete_message(mids[0])
+    assert path.exists()
+    assert store.delete_message(mids[1])
+    assert not path.exists()
+    with store.Session() as s:
+        assert s.query(Blob).count() == 0
+
+def test_delete_racing_identical_ingest_keeps_the_blob(store, deliver, monkeypatch):
+    from app import blobs as blob_module, storage
+    blob_store = HashedBlobStore(str(store.store_dir))
+    deliver(store, RAW, blob_store=blob_store)
+    with store.Session() as s:
+        mid = s.query(Message).one().id
+
+    def reingest_first(session_factory, paths, pool=None):
+        # the same mail arrives after the delete committed, before its unlink
+        deliver(store, RAW, blob_store=blob_store)
+        blob_module.unlink_released(session_factory, paths, pool)
+
+    monkeypatch.setattr(storage, "unlink_released", reingest_first)
+    assert store.delete_message(mid)
+    with store.Session() as s:
+        survivor = s.query(Message).one()
+        assert s.query(Blob).one().refcount == 1
+    assert read_eml(survivor.eml_path) == RAW
+
+def test_migrate_flat_store(store, deliver):
+    deliver(store, RAW, RAW)
+    flat = sorted(store.store_dir.glob("*.eml"))
+    assert len(flat) == 2
+    target = HashedBlobStore(str(store.store_dir), blobs.CODEC_GZIP)
+    assert store.migrate_blobs(target) == (2, 0)
+    assert store.migrate_blobs(target) == (0, 0)
+    assert not any(p.exists() for p in flat)
+    with store.Session() as s:
+        paths = {m.eml_path for m in s.query(Message)}
+        assert s.query(Blob).one().refcount == 2
+    assert len(paths) == 1
+    assert read_eml(paths.pop()) == RAW
@@ -0,0 +1,67 @@
+import json
+import os
+import uuid
+from pathlib import Path
+
+import pytest
+
+from app.cache import ParsedCache
+from app.models import Message
+from app.storage import Store
+
+MULTIPART = (
+    b"From: a@b\r\nTo: c@d\r\nSubject: report\r\nMIME-Version: 1.0\r\n"
+    b"Content-Type: multipart/mixed; boundary=XX\r\n\r\n"
+    b"--XX\r\nContent-Type: text/plain\r\n\r\nsee attached\r\n"
+    b"--XX\r\nContent-Type: application/pdf\r\nContent-Disposition: attachment; filename=r.pdf\r\n"
+    b"Content-Transfer-Encoding: base64\r\n\r\nJVBERi0xLjQK\r\n--XX--\r\n"
+)
+
+@pytest.fixture()
+def store(tmp_path: Path):
+    return Store(str(tmp_path / "messages.db"), str(tmp_path / "store"), cache=ParsedCache(max_bytes=10_000))
+
+def add(store: Store, raw: bytes = MULTIPART) -> str:
+    mid = str(uuid.uuid4())
+    path = store.store_dir / f"{mid}.eml"
+    path.write_bytes(raw)
+    with store.Session() as s:
+        s.add(Message(id=mid, to_addrs=json.dumps([]), eml_path=str(path)))
+        s.commit()
+    return mid
+
+def test_parsed_message_and_hit_miss_counts(store):
+    mid = add(store)
+    first = store.get_parsed(mid)
+    assert first.headers["Subject"] == "report"
+    assert first.text.strip() == "see attached"
+    assert [(p["content_type"], p["filename"], p["size"]) for p in first.parts] == [
+        ("text/plain", None, 12), ("application/pdf", "r.pdf", 9),
+    ]
+    assert store.get_parsed(mid) is first
+    assert store.cache.stats()["hits"] == 1 and store.cache.stats()["misses"] == 1
+
+def test_changed_file_is_reparsed(store):
+    mid = add(store)
+    store.get_parsed(mid)
+    path = store.store_dir / f"{mid}.eml"
+    path.write_bytes(b"Subject: edited\r\n\r\nnew\r\n")
+    os.utime(path, ns=(1, 1))
+    assert store.get_parsed(mid).headers["Subject"] == "edited"
+
+def test_eviction_is_bounded_by_bytes(store):
+    body = b"Subject: big\r\n\r\n" + b"x" * 3000 + b"\r\n"
+    mids = [add(store, body) for _ in range(5)]
+    for mid in mids:
+        store.get_parsed(mid)
+    stats = store.cache.stats()
+    assert stats["bytes"] <= stats["max_bytes"]
+    assert stats["evictions"] >= 2
+    assert store.cache.lookup(mids[0]) is None
+
+def test_delete_invalidates(store):
+    mid = add(store)
+    store.get_parsed(mid)
+    assert store.delete_message(mid)
+    assert len(store.cache) == 0
+    assert store.get_parsed(mid) is None
@@ -0,0 +1,51 @@
+import json
+import uuid
+from pathlib import Path
+
+import pytest
+
+from app.models import Message, fts
+from app.models.fts import to_match_query
+
+def eml(subject: str, body: str) -> bytes:
+    return (f"From: qa@example.com\r\nTo: dev@example.com\r\nSubject: {subject}\r\n\r\n{body}\r\n").encode()
+
+def test_ingested_bodies_are_searchable(store, deliver):
+    deliver(store, eml("Password reset", "Use token ZX81-ALPHA to continue."), eml("Welcome", "Nothing here."))
+    hits = store.search_text("zx81")
+    assert len(hits) == 1
+    assert hits[0]["subject"] == "Password reset"
+    assert "<mark>" in hits[0]["snippet"]
+
+def test_subject_matches_rank_above_body_matches(store, deliver):
+    deliver(store, eml("Invoice", "see attached"), eml("Hello", "the invoice is attached"))
+    assert [h["subject"] for h in store.search_text("invoice")] == ["Invoice", "Hello"]
+
+def test_delete_removes_index_entry(store, deliver):
+    deliver(store, eml("Invoice", "body"))
+    mid = store.search_text("invoice")[0]["id"]
+    assert store.delete_message(mid)
+    assert store.search_text("invoice") == []
+
+def test_reindex_backfills_existing_messages(store, tmp_path: Path):
+    path = tmp_path / "old.eml"
+    path.write_bytes(eml("Legacy", "imported before the index existed"))
+    with store.Session() as s:
+        s.add(Message(id=str(uuid.uuid4()), from_addr="a@b", to_addrs=json.dumps(["c@d"]), subject="Legacy", eml_path=str(path)))
+        s.commit()
+    assert store.search_text("imported") == []
+    assert store.reindex() == 1
+    assert store.reindex() == 0
+    assert len(store.search_text("imported")) == 1
+
+def test_reindex_without_fts_writes_nothing(store, monkeypatch):
+    with store.Session() as s:
+        s.add(Message(id=str(uuid.uuid4()), subject="Legacy"))
+        s.commit()
+    monkeypatch.setattr(fts, "fts_available", lambda bind: False)
+    assert store.reindex() == 0
+
+def test_match_query_quotes_terms():
+    assert to_match_query('bob@example.com "weekly report" inv*') == '"bob@example.com" "weekly report" "inv"*'
+    with pytest.raises(ValueError):
+        to_match_query("   ")
@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, text, update
+
+from app.constants.database import group
+from app.ingest import IngestPipeline, Pending
+from app.models import Message, MessageGroup
+from app.storage import group_page_query
+
+BASE = datetime(2024, 1, 1, 12, 0, 0)
+
+def mail(n: int, subject: str, body: str = "hello", msgid: str | None = None, reply_to: str | None = None,
+         refs: str | None = None, rcpt: str = "c@d.test", namespace: str | None = None) -> Pending:
+    headers = ["From: a@b.test", f"To: {rcpt}", f"Subject: {subject}", f"Message-ID: {msgid or f'<{n}@local>'}"]
+    if reply_to:
+        headers.append(f"In-Reply-To: {reply_to}")
+    if refs:
+        headers.append(f"References: {refs}")
+    raw = ("\r\n".join(headers) + f"\r\n\r\n{body}\r\n").encode()
+    return Pending("a@b.test", [rcpt], raw, namespace=namespace, received_at=BASE + timedelta(minutes=n))
+
+def ingest(store, items, batch_size=200):
+    IngestPipeline(str(store.store_dir), store.Session, batch_size=batch_size).ingest_many(items)
+
+def groups(store, kind, **filters):
+    rows, _ = store.group_messages(kind, limit=100, **filters)
+    return {r["subject"]: r["count"] for r in rows}
+
+@pytest.mark.parametrize("batch_size", [1, 200])
+def test_replies_join_their_thread(store, batch_size):
+    ingest(store, [
+        # a reply that arrives before its parent still joins the root's thread
+        mail(0, "Re: plan", msgid="<r2@x>", refs="<root@x> <r1@x>"),
+        mail(1, "plan", msgid="<root@x>"),
+        mail(2, "Re: plan", msgid="<r1@x>", reply_to="<root@x>"),
+        mail(3, "RE: Re: plan", msgid="<r3@x>", reply_to="<r1@x>"),
+        mail(4, "other", msgid="<other@x>"),
+    ], batch_size=batch_size)
+    assert groups(store, group.KIND_THREAD) == {"RE: Re: plan": 4, "other": 1}
+
+    thread = store.group_messages(group.KIND_THREAD, limit=100)[0][1]
+    members, _ = store.search_messages(thread_id=thread["group"], limit=100)
+    assert [m["subject"] for m in members] == ["RE: Re: plan", "Re: plan", "plan", "Re: plan"]
+    assert thread["first_at"] == BASE
+
+def test_resends_collapse_into_one_duplicate_group(store):
+    ingest(store, [mail(i, "Your code", body="1234") for i in range(5)]
+                  + [mail(5, "Your code", body="9999"), mail(6, "Your code", body="1234", rcpt="x@y.test")])
+    rows, _ = store.group_messages(group.KIND_DUP, limit=100)
+    assert sorted(r["count"] for r in rows) == [1, 1, 5]
+    assert rows[0]["id"] == store.search_messages(limit=1)[0][0]["id"]
+    # filters keep the groups with any matching message
+    assert [r["count"] for r in store.group_messages(group.KIND_DUP, to_addr="x@y.test")[0]] == [1]
+
+def test_groups_are_per_namespace(store):
+    ingest(store, [mail(0, "hi", namespace="one"), mail(1, "hi", namespace="two"), mail(2, "hi", namespace="two")])
+    assert groups(store, group.KIND_DUP, namespace="two") == {"hi": 2}
+    assert sorted(r["count"] for r in store.group_messages(group.KIND_DUP)[0]) == [1, 2]
+
+def test_deletes_recount_groups(store):
+    ingest(store, [mail(i, "Your code", body="1234") for i in range(4)] + [mail(4, "lone")])
+    newest = store.search_messages(limit=100)[0]
+    assert store.delete_message(newest[1]["id"])     # the newest resend
+    rows, _ = store.group_messages(group.KIND_DUP, limit=100)
+    dup = next(r for r in rows if r["subject"] == "Your code")
+    assert (dup["count"], dup["id"]) == (3, newest[2]["id"])
+
+    store.purge(subject="lone")
+    assert groups(store, group.KIND_DUP) == {"Your code": 3}
+    # each resend has its own Message-ID, so its own thread; emptied ones are gone
+    with store.Session() as s:
+        threads = s.scalars(select(MessageGroup.latest_id).where(MessageGroup.kind == group.KIND_THREAD)).all()
+    assert sorted(threads) == sorted(m["id"] for m in newest[2:])
+
+def test_backfill_groups_messages_stored_before_grouping(store):
+    ingest(store, [mail(0, "plan", body="draft", msgid="<root@x>"), mail(1, "Re: plan", reply_to="<root@x>"),
+                   mail(2, "Your code"), mail(3, "Your code")])
+    with store.Session() as s:
+        s.execute(update(Message).values(thread_id=None, dup_key=None))
+        s.execute(MessageGroup.__table__.delete())
+        s.commit()
+    assert store.group_messages(group.KIND_THREAD)[0] == []
+
+    assert store.backfill_groups(batch_size=1) == 4
+    assert groups(store, group.KIND_THREAD) == {"Re: plan": 2, "Your code": 1}
+    assert groups(store, group.KIND_DUP) == {"Re: plan": 1, "plan": 1, "Your code": 2}
+    assert store.backfill_groups() == 0
+
+def test_grouped_page_walks_its_index(store):
+    stmt = group_page_query(group.KIND_THREAD, limit=10, namespace="ci")
+    with store.ReadSession() as s:
+        compiled = stmt.compile(s.get_bind(), compile_kwargs={"literal_binds": True})
+        plan = " ".join(r[-1] for r in s.execute(text(f"EXPLAIN QUERY PLAN {compiled}")))
+    assert group.IX_KIND_NAMESPACE_LATEST in plan
+    assert "TEMP B-TREE" not in plan
@@ -0,0 +1,65 @@
+import json
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+from sqlalchemy import func, select
+
+from app.models import Message, Recipient
+from app.storage import Store
+
+BASE = datetime(2024, 3, 1, 9, 0, 0)
+
+@pytest.fixture()
+def store(tmp_path: Path):
+    # messages written before message_recipients existed: no rows there yet
+    st = Store(str(tmp_path / "messages.db"), str(tmp_path / "store"))
+    with st.Session() as s:
+        for i in range(12):
+            mid = str(uuid.uuid4())
+            rcpt = f"User{i % 3}@Example.com"
+            path = st.store_dir / f"{mid}.eml"
+            path.write_bytes(
+                f"From: a@b.test\r\nTo: {rcpt}\r\nCc: Boss <boss@corp.test>\r\n"
+                f"Subject: m{i}\r\n\r\nhi\r\n".encode()
+            )
+            s.add(Message(
+                id=mid,
+                received_at=BASE + timedelta(minutes=i),
+                to_addrs=json.dumps([rcpt]),
+                subject=f"m{i}",
+                eml_path=str(path),
+            ))
+        s.commit()
+    return st
+
+def test_backfill_creates_envelope_and_header_rows_once(store):
+    assert store.backfill_recipients(batch_size=5) == 12
+    assert store.backfill_recipients(batch_size=5) == 0
+    with store.Session() as s:
+        kinds = dict(s.execute(
+            select(Recipient.kind, func.count()).group_by(Recipient.kind)
+        ).all())
+    assert kinds == {"rcpt": 12, "to": 12, "cc": 12}
+
+def test_mailbox_pages_are_deduplicated_and_ordered(store):
+    store.backfill_recipients()
+    seen, cursor = [], None
+    while True:
+        rows, cursor = store.mailbox_messages("USER1@example.com", cursor=cursor, limit=2)
+        seen.extend(rows)
+        if not cursor:
+            break
+    assert [r["subject"] for r in seen] == ["m10", "m7", "m4", "m1"]
+
+    rows, _ = store.mailbox_messages("@corp.test", limit=100)
+    assert len(rows) == 12
+
+def test_to_filter_uses_recipient_table(store):
+    store.backfill_recipients()
+    rows, _ = store.search_messages(to_addr="boss@corp.test", limit=100)
+    assert len(rows) == 12
+    rows, _ = store.search_messages(to_addr="user2@example.com", limit=100)
+    assert {r["subject"] for r in rows} == {"m2", "m5", "m8", "m11"}
@@ -0,0 +1,62 @@
+import json
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+from sqlalchemy import insert
+
+from app.models import Message, Recipient
+from app.retention import Purger, RetentionPolicy, incremental_vacuum
+from app.storage import Store
+from app.ingest_rows import recipient_rows
+
+NOW = datetime(2024, 6, 1, 12, 0, 0)
+
+@pytest.fixture()
+def store(tmp_path: Path):
+    st = Store(str(tmp_path / "messages.db"), str(tmp_path / "store"))
+    with st.Session() as s:
+        for i in range(30):
+            mid = str(uuid.uuid4())
+            path = st.store_dir / f"{mid}.eml"
+            path.write_bytes(b"x" * 100)
+            rcpt = "a@one.test" if i % 2 else "b@two.test"
+            s.execute(insert(Recipient), recipient_rows(mid, NOW - timedelta(hours=i), [rcpt]))
+            s.add(Message(
+                id=mid,
+                received_at=NOW - timedelta(hours=i),
+                to_addrs=json.dumps([rcpt]),
+                subject=f"m{i}",
+                size_bytes=100,
+                eml_path=str(path),
+            ))
+        s.commit()
+    return st
+
+def remaining(store, **filters):
+    rows, _ = store.search_messages(limit=1000, **filters)
+    return rows
+
+def test_age_policy_deletes_rows_and_files(store):
+    purger = Purger(store.Session, store.cache, chunk_size=4)
+    deleted, freed = purger.apply(RetentionPolicy(max_age=timedelta(hours=10)), now=NOW)
+    assert (deleted, freed) == (19, 1900)
+    rows = remaining(store)
+    assert len(rows) == 11
+    assert len(list(store.store_dir.glob("*.eml"))) == 11
+
+def test_count_and_byte_quotas_are_per_recipient(store):
+    purger = Purger(store.Session, chunk_size=3)
+    assert purger.apply(RetentionPolicy(recipient="a@one.test", max_count=5))[0] == 10
+    assert len(remaining(store, to_addr="a@one.test")) == 5
+    assert purger.apply(RetentionPolicy(recipient="@two.test", max_bytes=750))[0] == 8
+    kept = remaining(store, to_addr="b@two.test")
+    assert [r["subject"] for r in kept] == ["m0", "m2", "m4", "m6", "m8", "m10", "m12"]
+
+def test_store_purge_requires_a_filter(store):
+    with pytest.raises(ValueError):
+        store.purge()
+    assert store.purge(subject="m1")[0] == 11   # m1, m10..m19
+    assert incremental_vacuum(store.Session) >= 0
@@ -0,0 +1,108 @@
+import asyncio
+import json
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from sqlalchemy import text
+
+from app.constants.database import message
+from app.models import Message
+from app.storage import SUMMARY_COLUMNS, Store, encode_cursor, page_query
+from app.utils.utils import parse_search
+
+BASE = datetime(2024, 1, 1, 12, 0, 0)
+
+@pytest.fixture()
+def store(tmp_path: Path):
+    st = Store(str(tmp_path / "messages.db"), str(tmp_path / "store"))
+    with st.Session() as s:
+        for i in range(25):
+            s.add(Message(
+                id=str(uuid.uuid4()),
+                received_at=BASE + timedelta(minutes=i // 2),  # pairs share a timestamp
+                from_addr=f"sender{i % 3}@example.com",
+                to_addrs=json.dumps([f"user{i}@example.com"]),
+                subject=f"Report 100% #{i}" if i % 5 == 0 else f"hello {i}",
+                has_attachments=i % 2,
+            ))
+        s.commit()
+    return st
+
+def test_keyset_pages_cover_everything_once(store):
+    seen, cursor = [], None
+    while True:
+        rows, cursor = store.search_messages(cursor=cursor, limit=4)
+        seen.extend(rows)
+        if not cursor:
+            break
+    assert len(seen) == 25
+    assert len({r["id"] for r in seen}) == 25
+    keys = [(r["received_at"], r["id"]) for r in seen]
+    assert keys == sorted(keys, reverse=True)
+
+def test_filters_are_pushed_down(store):
+    rows, _ = store.search_messages(from_addr="sender1", has_attachments=True, limit=100)
+    assert rows and all(r["from_addr"] == "sender1@example.com" and r["has_attachments"] for r in rows)
+
+    rows, _ = store.search_messages("100%", limit=100)
+    assert len(rows) == 5
+
+    rows, _ = store.search_messages(since=BASE + timedelta(minutes=10), limit=100)
+    assert {r["received_at"] for r in rows} == {BASE + timedelta(minutes=10), BASE + timedelta(minutes=11), BASE + timedelta(minutes=12)}
+
+def test_bad_cursor_raises_value_error(store):
+    with pytest.raises(ValueError):
+        store.search_messages(cursor="not-a-cursor")
+
+def test_parse_search():
+    assert parse_search('from:bob "weekly report" has:attachments after:2024-01-02') == {
+        "from_addr": "bob",
+        "has_attachments": True,
+        "since": datetime(2024, 1, 2),
+        "text": "weekly report",
+    }
+
+def test_messages_by_id_applies_filters(store):
+    rows, _ = store.search_messages(limit=100)
+    ids = [r["id"] for r in rows]
+    assert [r["id"] for r in store.messages_by_id(ids[:6])] == ids[:6]
+    picked = store.messages_by_id(ids, from_addr="sender0")
+    assert picked and all(r["from_addr"] == "sender0@example.com" for r in picked)
+    assert store.messages_by_id([]) == []
+
+def test_async_reads_match_sync(store):
+    async def run():
+        page = await store.asearch_messages(from_addr="sender1", cursor=None, limit=4)
+        by_id = await store.amessages_by_id([r["id"] for r in page[0]], has_attachments=True)
+        return page, by_id
+
+    (rows, cursor), by_id = asyncio.run(run())
+    assert (rows, cursor) == store.search_messages(from_addr="sender1", limit=4)
+    assert by_id == [r for r in rows if r["has_attachments"]]
+
+def test_list_page_walks_the_list_index(store):
+    stmt = page_query(SUMMARY_COLUMNS, cursor=encode_cursor(BASE, "z"), limit=4)
+    with store.ReadSession() as s:
+        compiled = stmt.compile(s.get_bind(), compile_kwargs={"literal_binds": True})
+        plan = " ".join(r[-1] for r in s.execute(text(f"EXPLAIN QUERY PLAN {compiled}")))
+    assert f"USING INDEX {message.IX_LIST}" in plan
+    assert "TEMP B-TREE" not in plan
+
+def test_backfill_fills_rows_stored_before_summaries(store, tmp_path: Path):
+    eml = tmp_path / "old.eml"
+    eml.write_bytes(b"From: Old <old@example.com>\r\nTo: x@example.com\r\nSubject: old\r\n\r\nold body\r\n")
+    with store.Session() as s:
+        s.add(Message(id="old", received_at=BASE, from_addr="old@example.com", subject="old",
+                      to_addrs=json.dumps(["x@example.com"]), eml_path=str(eml)))
+        s.commit()
+    before = store.messages_by_id(["old"])[0]
+    assert (before["display_from"], before["snippet"], before["part_count"]) == ("old@example.com", "", None)
+
+    assert store.backfill_summaries(batch_size=10) == 26
+    after = store.messages_by_id(["old"])[0]
+    assert (after["display_from"], after["snippet"], after["part_count"]) == ("Old <old@example.com>", "old body", 1)
+    # fixture rows have no file: they keep their envelope and are not read again
+    assert store.search_messages(limit=1)[0][0]["part_count"] == 0
+    assert store.backfill_summaries() == 0